@@ -2,14 +2,18 @@
 import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from employees.routing import websocket_urlpatterns
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'employee_management.settings')
 
+# Django must be set up before anything that imports models
+http_application = get_asgi_application()
+
+from employees.authentication import JWTAuthMiddleware  # noqa: E402
+from employees.routing import websocket_urlpatterns  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
+    "http": http_application,
+    "websocket": JWTAuthMiddleware(
         URLRouter(
             websocket_urlpatterns
         )
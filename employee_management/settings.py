@@ -56,29 +56,121 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Caches: "responses" backs the list-endpoint response cache (employees/cache.py).
+# Entries expire after TIMEOUT seconds; the Redis instance should run with a
+# maxmemory limit and an LRU eviction policy to bound its size.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+        'TIMEOUT': 60,
+        'KEY_PREFIX': 'employees',
+    },
+}
+EMPLOYEES_RESPONSE_CACHE = 'responses'
+
+# Chat persistence: when True, EmployeesConsumer delivers messages before they
+# are stored and writes them in batches (employees/writebehind.py).
+EMPLOYEES_CHAT_WRITE_BEHIND = False
+EMPLOYEES_CHAT_WRITE_BEHIND_OPTIONS = {
+    'MAX_BATCH': 500,  # Messages per bulk INSERT
+    'FLUSH_INTERVAL': 0.05,  # Seconds between flushes
+    'MAX_QUEUE': 10000,  # Pending messages before senders are made to wait
+}
+
+# Per-request metrics (employees/instrumentation.py): wall time, queries, DB and
+# serializer time and response size per view action.  Slow requests also log
+# their SQL.  Prometheus text is served at /api/metrics/.
+EMPLOYEES_METRICS = {
+    'SINKS': ['employees.instrumentation.LogSink', 'employees.instrumentation.PrometheusSink'],
+    'SLOW_REQUEST_MS': 500,
+    'SQL_SAMPLE_RATE': 1.0,  # Share of slow requests whose SQL is logged
+    'MAX_SQL': 50,  # Statements kept per request
+}
+
+# Presence (employees/presence.py): online/away state from WebSocket
+# connections and heartbeats, kept in Redis and never in the database.
+EMPLOYEES_PRESENCE = {
+    'BACKEND': 'employees.presence.RedisPresence',
+    'LOCATION': 'redis://127.0.0.1:6379/2',
+    'HEARTBEAT_INTERVAL': 30,  # Seconds between client heartbeat frames
+    'OFFLINE_AFTER': 75,  # Seconds without a heartbeat before a user counts as offline
+    'DEBOUNCE': 1.0,  # Seconds of changes collected into one round of updates
+    'PUSH_DELAY': 0.05,  # Seconds a socket batches incoming updates into one frame
+    'MAX_SUBSCRIPTIONS': 1000,  # Users one socket may watch or look up at once
+}
+
+# Task and complaint change events pushed over the WebSocket (employees/events.py)
+EMPLOYEES_ENTITY_EVENTS = {
+    'COALESCE_WINDOW': 0.5,  # Seconds of saves to one row merged into one event
+    'NOTIFY_STAFF': True,  # Every event also goes to every active admin's stream
+}
+
+# Per-user sequenced event streams (employees/streams.py): chat and task and
+# complaint events a reconnecting socket missed are replayed from here.
+EMPLOYEES_EVENT_STREAM = {
+    'BACKEND': 'employees.streams.RedisEventStream',
+    'LOCATION': 'redis://127.0.0.1:6379/3',
+    'MAXLEN': 500,  # Events kept per user; a longer gap means a full refetch
+    'TTL': 86400,  # Seconds a stream is kept after its last event
+}
+
+# Binary WebSocket protocol (employees/protocol.py), used by clients that offer
+# the "employees.msgpack" subprotocol; JSON text frames stay the default.
+EMPLOYEES_WS_MSGPACK = {
+    'BATCH_DELAY': 0.005,  # Seconds of events a socket collects into one frame
+    'BATCH_MAX': 100,  # Events that flush a frame without waiting
+}
+
+# Validated JWTs and their users, cached per process (employees/authentication.py)
+EMPLOYEES_TOKEN_CACHE = {
+    'MAX_ENTRIES': 10000,
+    'TIMEOUT': 300,  # Seconds before a cached token is checked against the database again
+}
+
+# WebSocket handshakes (employees/authentication.py): JWT from the "jwt"
+# subprotocol or ?token=.  Trusting the token's claims avoids a user query per
+# handshake; the session fallback keeps cookie-only clients working.
+EMPLOYEES_WS_AUTH = {
+    'TRUST_TOKEN_CLAIMS': True,
+    'SESSION_FALLBACK': True,
+}
+
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'employees.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
+        'employees.renderers.ORJSONRenderer',  # Same bytes as DRF's JSONRenderer, faster
     ),
     'DEFAULT_PARSER_CLASSES': (
-        'rest_framework.parsers.JSONParser',
+        'employees.parsers.ORJSONParser',
     ),
   
 }
+# The browsable API is for development; production serves JSON only.
+# Off unless DJANGO_BROWSABLE_API=1 is set, e.g. for local development.
+BROWSABLE_API = os.environ.get('DJANGO_BROWSABLE_API', '').lower() in ('1', 'true', 'yes')
+if BROWSABLE_API:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] += ('rest_framework.renderers.BrowsableAPIRenderer',)
+
+# List endpoints build rows from values() instead of serializer instances (employees/rows.py)
+EMPLOYEES_FAST_LISTS = True
 
 
 MIDDLEWARE = [
+    'employees.instrumentation.InstrumentationMiddleware',  # First, so it times the whole request
     'corsheaders.middleware.CorsMiddleware',  
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware', 
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'employees.replicas.ReplicaRoutingMiddleware',  # After authentication, so it can look up session users' pins
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -121,6 +213,17 @@ DATABASES = {
     }
 }
 
+# Read replicas (employees/replicas.py): add each replica to DATABASES and list
+# its alias in REPLICAS.  After a write, that user reads from the primary for
+# PIN_SECONDS; pins are kept in CACHE, which must be shared by every process.
+DATABASE_ROUTERS = ['employees.replicas.PrimaryReplicaRouter']
+EMPLOYEES_REPLICAS = {
+    'PRIMARY': 'default',
+    'REPLICAS': [],
+    'PIN_SECONDS': 5,
+    'CACHE': 'responses',
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -154,6 +257,7 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'employees.serializers.EmployeeTokenObtainPairSerializer',  # Adds username and is_staff claims
 }
 
 
@@ -171,5 +275,11 @@ LOGGING = {
             'handlers': ['console'],
             'level': 'ERROR',
         },
+        # Every request at INFO, slow ones (with SQL) at WARNING
+        'employees.metrics': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
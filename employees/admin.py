@@ -1,9 +1,21 @@
 from django.contrib import admin
+from django.db.models import Q
 from .models import Task
+from .search import search_filter
 
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
     list_display = ('title', 'assigned_to', 'status', 'priority', 'due_date', 'created_at')
     list_filter = ('status', 'priority', 'assigned_to')
+    list_select_related = ('assigned_to',)
     search_fields = ('title', 'description', 'assigned_to__username')
     ordering = ('-created_at',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Title and description through the full-text index instead of icontains
+        # scans; assignee usernames still match partially.
+        if not search_term:
+            return queryset, False
+        match = search_filter(Task, search_term, queryset.db)
+        text_match = Q(match) if match is not None else Q(pk__in=[])
+        return queryset.filter(text_match | Q(assigned_to__username__icontains=search_term.strip())), False
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EmployeesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'employees'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (connects the model signal handlers)
+        from . import instrumentation  # noqa: F401  (installs the query timer)
@@ -0,0 +1,136 @@
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.http import HttpResponse
+from rest_framework.exceptions import APIException, AuthenticationFailed, MethodNotAllowed, NotAuthenticated
+from rest_framework.filters import OrderingFilter
+from rest_framework.request import Request
+
+from .authentication import CachedJWTAuthentication
+from .filters import QueryParamFilterBackend
+from .models import Message, Task
+from .pagination import KeysetPagination, OptionalLimitOffsetPagination
+from .presence import get_options as presence_options, get_presence
+from .renderers import ORJSONRenderer
+from .rows import fast_lists_enabled
+from .usercache import aresolve_username
+from .views import MESSAGE_FIELDS, TASK_FIELDS, MessageViewSet, TaskViewSet
+
+
+# Async read paths for ASGI
+#
+# Plain Django async views for the hottest GET endpoints, returning the same
+# JSON as their DRF counterparts: /api/async/messages/,
+# /api/async/messages/conversation/<username>/, /api/async/tasks/ and
+# /api/async/users/, plus /api/presence/ which only talks to Redis.  Queries go through the async ORM (aget, acount,
+# async iteration), so under an ASGI server the request is not pinned to a
+# worker thread for its whole lifetime; only the query itself runs in a thread
+# (Django 4.2 has no async database drivers).  Rows are read with values()
+# and represented by the DRF ViewSet's values_rows (employees/rows.py), or by
+# its serializer once they are loaded.
+#
+# Authentication is the same cached JWT check as the REST API.  These endpoints do not
+# use the response cache or conditional GET; clients that poll with
+# If-None-Match should stay on the DRF endpoints.
+_jwt = CachedJWTAuthentication()
+_renderer = ORJSONRenderer()
+
+
+async def authenticate(request):
+    header = _jwt.get_header(request)
+    raw_token = _jwt.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        raise NotAuthenticated()
+    user, _ = await _jwt.aresolve(raw_token)
+    return user
+
+
+def render(data, status=200):
+    return HttpResponse(_renderer.render(data), status=status, content_type='application/json')
+
+
+def async_api_view(view):
+    """Authenticated, GET-only async view returning DRF-style errors."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            if request.method != 'GET':
+                raise MethodNotAllowed(request.method)
+            user = await authenticate(request)
+            return await view(Request(request), user, *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            response = render(detail, exc.status_code)
+            if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+                response.status_code = 401
+                response['WWW-Authenticate'] = _jwt.authenticate_header(request)
+            return response
+    return wrapper
+
+
+async def paginated(paginator, queryset, request, viewset):
+    """The rows of `queryset` as `viewset` lists them, paginated if the paginator says so."""
+    rows = viewset.values_rows if fast_lists_enabled() else None
+    if rows is not None:
+        queryset = rows.values(queryset)
+    page = await paginator.apaginate_queryset(queryset, request)
+    objects = [row async for row in queryset] if page is None else page
+    data = rows.represent(objects) if rows is not None else viewset.serializer_class(objects, many=True).data
+    return render(data if page is None else paginator.get_paginated_response(data).data)
+
+
+@async_api_view
+async def message_list(request, user):
+    queryset = (
+        Message.objects.select_related('sender', 'recipient').only(*MESSAGE_FIELDS)
+        .filter(Q(sender=user) | Q(recipient=user))
+        .order_by('-timestamp', '-id')
+    )
+    return await paginated(KeysetPagination(), queryset, request, MessageViewSet)
+
+
+@async_api_view
+async def message_conversation(request, user, username):
+    try:
+        other_user = await aresolve_username(username)
+    except User.DoesNotExist:
+        return render({'error': 'User does not exist'}, status=400)
+
+    queryset = Message.objects.select_related('sender', 'recipient').only(*MESSAGE_FIELDS).filter(
+        (Q(sender=user) & Q(recipient_id=other_user.id)) |
+        (Q(sender_id=other_user.id) & Q(recipient=user))
+    ).order_by('-timestamp', '-id')
+    return await paginated(KeysetPagination(), queryset, request, MessageViewSet)
+
+
+@async_api_view
+async def task_list(request, user):
+    queryset = Task.objects.select_related('assigned_to').only(*TASK_FIELDS)
+    if not user.is_staff:
+        queryset = queryset.filter(assigned_to=user)
+    # Same filters and ordering as TaskViewSet; building them runs no queries
+    queryset = QueryParamFilterBackend().filter_queryset(request, queryset, TaskViewSet)
+    queryset = OrderingFilter().filter_queryset(request, queryset, TaskViewSet)
+    return await paginated(OptionalLimitOffsetPagination(), queryset, request, TaskViewSet)
+
+
+@async_api_view
+async def user_list(request, user):
+    return render([row async for row in User.objects.values('id', 'username')])
+
+
+# Presence: ?ids=1,2,3 maps those users to "online" | "away" | "offline";
+# without ids, every user who is not offline.
+@async_api_view
+async def presence(request, user):
+    ids = request.query_params.get('ids')
+    if ids is None:
+        return render(await get_presence().present())
+    try:
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in ids.split(',') if user_id))
+    except ValueError:
+        return render({'error': 'ids must be a comma-separated list of user ids'}, status=400)
+    if len(user_ids) > presence_options()['MAX_SUBSCRIPTIONS']:
+        return render({'error': 'Too many user ids'}, status=400)
+    return render(await get_presence().statuses(user_ids))
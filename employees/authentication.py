@@ -0,0 +1,253 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from channels.auth import AuthMiddlewareStack
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+
+# JWT authentication with a validated-token cache
+#
+# simplejwt verifies the signature and loads the User row on every request.
+# CachedJWTAuthentication remembers, per token, the validated token and the few
+# user columns requests actually read (id, username and the role flags) in a
+# bounded in-process LRU.  A repeat request with the same token is then
+# authenticated without decoding it or querying the database.  Any other user
+# field is loaded on first access, like a deferred field.
+#
+# Entries are keyed by the complete token string, so a forged token that
+# reuses a valid jti still goes through signature verification; the jti is
+# only used to evict blacklisted tokens.  An entry lives until the token's
+# "exp" or for TIMEOUT seconds, whichever is sooner.  User saves and deletes
+# (employees/signals.py) and blacklisting evict entries in this process; other
+# processes notice within TIMEOUT.
+USER_FIELDS = ('id', 'username', 'is_staff', 'is_active', 'is_superuser')
+
+# User fields copied into every token at login (EmployeeTokenObtainPairSerializer)
+USER_CLAIMS = ('username', 'is_staff')
+
+
+class TokenCache:
+    def __init__(self, max_entries=10000, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()  # raw token (bytes) -> (user values, validated token, expires)
+        self._by_user = {}  # user id -> raw tokens
+        self._by_jti = {}  # jti -> raw token
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, raw_token):
+        with self._lock:
+            entry = self._entries.get(raw_token)
+            if entry is not None and entry[2] > time.time():
+                self._entries.move_to_end(raw_token)
+                self.hits += 1
+                return entry[0], entry[1]
+            if entry is not None:
+                self._discard(raw_token)
+            self.misses += 1
+            return None
+
+    def set(self, raw_token, user, validated_token):
+        values = tuple(getattr(user, field) for field in USER_FIELDS)
+        expires = time.time() + self.timeout
+        exp = validated_token.get('exp')
+        if exp is not None:
+            leeway = jwt_settings.LEEWAY
+            if isinstance(leeway, timedelta):
+                leeway = leeway.total_seconds()
+            expires = min(expires, exp + leeway)
+        with self._lock:
+            self._discard(raw_token)
+            self._entries[raw_token] = (values, validated_token, expires)
+            self._by_user.setdefault(user.pk, set()).add(raw_token)
+            jti = validated_token.get(jwt_settings.JTI_CLAIM)
+            if jti is not None:
+                self._by_jti[jti] = raw_token
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for raw_token in list(self._by_user.get(user_id, ())):
+                self._discard(raw_token)
+
+    def invalidate_jti(self, jti):
+        with self._lock:
+            raw_token = self._by_jti.get(jti)
+            if raw_token is not None:
+                self._discard(raw_token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self._by_jti.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+    def _discard(self, raw_token):
+        entry = self._entries.pop(raw_token, None)
+        if entry is None:
+            return
+        values, validated_token, _ = entry
+        tokens = self._by_user.get(values[0])
+        if tokens is not None:
+            tokens.discard(raw_token)
+            if not tokens:
+                del self._by_user[values[0]]
+        jti = validated_token.get(jwt_settings.JTI_CLAIM)
+        if jti is not None and self._by_jti.get(jti) == raw_token:
+            del self._by_jti[jti]
+
+
+_options = getattr(settings, 'EMPLOYEES_TOKEN_CACHE', {})
+token_cache = TokenCache(
+    max_entries=_options.get('MAX_ENTRIES', 10000),
+    timeout=_options.get('TIMEOUT', 300),
+)
+
+
+def cached_user(values):
+    # Unloaded fields are deferred: reading one costs a query, never a wrong value.
+    return User.from_db(None, USER_FIELDS, values)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        return self.resolve(raw_token)
+
+    # Token -> user resolution shared by the REST API, the async views and the
+    # WebSocket handshake.  Each raises InvalidToken or AuthenticationFailed.
+    def resolve(self, raw_token, trust_claims=False):
+        """(user, validated token) for a raw token."""
+        cached = self.get_cached(raw_token)
+        return cached if cached is not None else self.load(raw_token, trust_claims)
+
+    async def aresolve(self, raw_token, trust_claims=False):
+        """resolve() for async callers; a cached token does not leave the event loop."""
+        cached = self.get_cached(raw_token)
+        return cached if cached is not None else await sync_to_async(self.load)(raw_token, trust_claims)
+
+    def load(self, raw_token, trust_claims=False):
+        """Validate a token that is not cached and load its user.
+
+        With ``trust_claims`` a token carrying the USER_CLAIMS is turned into a
+        user without a query, and without the is_active check; such users are
+        not cached.  Otherwise the user row is loaded and checked by simplejwt.
+        """
+        validated_token = self.get_validated_token(raw_token)
+        user = claims_user(validated_token) if trust_claims else None
+        if user is None:
+            user = self.get_user(validated_token)
+            token_cache.set(raw_token, user, validated_token)
+        return user, validated_token
+
+    def get_cached(self, raw_token):
+        """(user, validated token) for a token seen before, or None."""
+        entry = token_cache.get(raw_token)
+        if entry is None:
+            return None
+        values, validated_token = entry
+        return cached_user(values), validated_token
+
+
+# WebSocket authentication
+#
+# JWTAuthMiddleware authenticates the handshake with the same access tokens as
+# the REST API, taken from the "jwt" subprotocol (new WebSocket(url, ['jwt',
+# token]); preferred, since query strings end up in access logs) or from
+# ?token=.  scope["user"] is resolved once, before the consumer runs:
+#
+#   1. a token already in token_cache (seen by the REST API or an earlier
+#      handshake) costs no decoding and no query;
+#   2. otherwise, if TRUST_TOKEN_CLAIMS is on and the token carries the
+#      USER_CLAIMS, the user is built from the claims (no query);
+#   3. otherwise the user row is loaded, as for REST requests.
+#
+# With trusted claims a deactivated user can still open sockets until their
+# token expires, and a demoted admin's user still says is_staff: consumers
+# check the database before staff-only actions.  Handshakes without a token go through the session
+# AuthMiddlewareStack when SESSION_FALLBACK is on, and are anonymous otherwise.
+WS_SUBPROTOCOL = 'jwt'
+
+DEFAULT_WS_OPTIONS = {
+    'TRUST_TOKEN_CLAIMS': True,
+    'SESSION_FALLBACK': True,
+}
+
+
+def ws_options():
+    return {**DEFAULT_WS_OPTIONS, **getattr(settings, 'EMPLOYEES_WS_AUTH', {})}
+
+
+def get_ws_token(scope):
+    """(raw token, subprotocol to accept) from a WebSocket scope."""
+    subprotocols = scope.get('subprotocols') or []
+    if WS_SUBPROTOCOL in subprotocols:
+        index = subprotocols.index(WS_SUBPROTOCOL)
+        if index + 1 < len(subprotocols):
+            return subprotocols[index + 1].encode(), WS_SUBPROTOCOL
+    tokens = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('token')
+    if tokens:
+        return tokens[0].encode(), None
+    return None, None
+
+
+def claims_user(validated_token):
+    """User built from the token's claims, or None if the token lacks them."""
+    try:
+        values = [validated_token[jwt_settings.USER_ID_CLAIM]]
+        values += [validated_token[claim] for claim in USER_CLAIMS]
+    except KeyError:
+        return None
+    return User.from_db(None, ('id', *USER_CLAIMS), values)
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    def __init__(self, inner):
+        super().__init__(inner)
+        self.session_inner = AuthMiddlewareStack(inner)
+        self.auth = CachedJWTAuthentication()
+
+    async def __call__(self, scope, receive, send):
+        raw_token, subprotocol = get_ws_token(scope)
+        if raw_token is None and ws_options()['SESSION_FALLBACK']:
+            return await self.session_inner(scope, receive, send)
+
+        scope = dict(scope)
+        scope['user'] = await self.get_user(raw_token) if raw_token is not None else AnonymousUser()
+        if subprotocol is not None and scope['user'].is_authenticated:
+            scope['auth_subprotocol'] = subprotocol  # Browsers drop the socket unless it is echoed
+        return await super().__call__(scope, receive, send)
+
+    async def get_user(self, raw_token):
+        try:
+            user, _ = await self.auth.aresolve(raw_token, trust_claims=ws_options()['TRUST_TOKEN_CLAIMS'])
+        except AuthenticationFailed:  # Includes InvalidToken
+            return AnonymousUser()
+        return user
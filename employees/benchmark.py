@@ -0,0 +1,474 @@
+import asyncio
+import json
+import math
+import time
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from datetime import date, timedelta
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import AsyncClient
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .cache import get_cache
+from .consumers import EmployeesConsumer
+from .models import Attendance, Complaint, Salary, Task
+from .protocol import MSGPACK_SUBPROTOCOL, unpack
+from .streams import publish
+
+# Load-test benchmark
+#
+# Requests go through the full Django/DRF stack in-process (APIClient), so the
+# numbers are server-side latency without network or serialization to a socket.
+# EmployeesConsumer is driven with channels' WebsocketCommunicator over the
+# in-memory channel layer and in-memory presence.  For each scenario the run reports p50/p95/p99
+# latency, throughput and database queries per request.  Results are plain
+# JSON so a run can be saved as a baseline and later runs compared with it.
+#
+# The asgi:* scenarios send concurrent requests through Django's ASGI handler
+# (AsyncClient) to both the DRF endpoint and its async version
+# (employees/async_views.py).  In-process, every query still runs on one
+# thread, so these numbers compare per-request overhead; the concurrency
+# benefit of the async views shows up under a real ASGI server with a network
+# database.
+#
+# The chat:fan-out:* scenarios push the same chat events to many sockets
+# speaking the JSON and the MessagePack protocol (employees/protocol.py), and
+# also report bytes sent and process CPU time per delivered event.
+#
+# The lists:* scenarios fetch large pages of the list endpoints, without the
+# response cache, through values() rows and ORJSONRenderer ("values", the
+# default).  Given a `serializer_baseline` (a context manager factory that
+# puts the serializers and DRF's stdlib JSONRenderer back, see the benchmark
+# command's --serializer-baseline) they are also run inside it ("serializer").
+#
+# Settings (in-memory channel layer, presence and event stream, the test
+# client's host) are the caller's to set up; the benchmark command does.
+#
+# Write scenarios (messages:create, chat:*) add rows; run the benchmark against
+# a database filled by `manage.py seed_data`, not against real data.
+Scenario = namedtuple('Scenario', ['name', 'method', 'path', 'role', 'data'], defaults=[None])
+
+
+class QueryCount:
+    """execute_wrapper() that counts the queries run on the connection."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def counting_queries():
+    counter = QueryCount()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+def pick_users():
+    """An admin, an employee and one of the employee's chat peers from the seeded data."""
+    admin = User.objects.filter(is_staff=True, is_active=True).order_by('id').first()
+    employees = list(User.objects.filter(is_staff=False, is_active=True).order_by('id')[:2])
+    if admin is None or len(employees) < 2:
+        return None
+    return {'admin': admin, 'employee': employees[0], 'peer': employees[1]}
+
+
+def http_scenarios(users):
+    employee, peer = users['employee'], users['peer']
+    today = date.today()
+    month_ago = today - timedelta(days=30)
+
+    def first_id(queryset):
+        return queryset.order_by('id').values_list('id', flat=True).first() or 0
+
+    attendance_id = first_id(Attendance.objects.filter(employee=employee))
+    complaint_id = first_id(Complaint.objects.filter(employee=employee))
+    task_id = first_id(Task.objects.filter(assigned_to=employee))
+    salary_id = first_id(Salary.objects.filter(employee=employee))
+
+    return [
+        Scenario('users:list', 'get', '/api/users/', 'admin'),
+        Scenario('complaints:list', 'get', '/api/complaints/?limit=50', 'admin'),
+        Scenario('complaints:list-own', 'get', '/api/complaints/', 'employee'),
+        Scenario('complaints:retrieve', 'get', f'/api/complaints/{complaint_id}/', 'employee'),
+        Scenario('complaints:search', 'get', '/api/complaints/search/?q=synthetic', 'admin'),
+        Scenario('attendance:list', 'get', f'/api/attendance/?limit=100&date_after={month_ago}', 'admin'),
+        Scenario('attendance:list-own', 'get', '/api/attendance/?limit=100', 'employee'),
+        Scenario('attendance:retrieve', 'get', f'/api/attendance/{attendance_id}/', 'employee'),
+        Scenario('attendance:export', 'get', f'/api/attendance/export/?date_after={month_ago}', 'admin'),
+        Scenario('attendance-summary', 'get', f'/api/attendance-summary/?start={month_ago}&end={today}', 'admin'),
+        Scenario('tasks:list', 'get', '/api/tasks/?limit=100', 'admin'),
+        Scenario('tasks:list-own', 'get', '/api/tasks/?status=Pending', 'employee'),
+        Scenario('tasks:retrieve', 'get', f'/api/tasks/{task_id}/', 'employee'),
+        Scenario('tasks:search', 'get', '/api/tasks/search/?q=synthetic', 'admin'),
+        Scenario('salary:list', 'get', '/api/salary/?limit=100', 'admin'),
+        Scenario('salary:retrieve', 'get', f'/api/salary/{salary_id}/', 'admin'),
+        Scenario('messages:list', 'get', '/api/messages/?limit=50', 'employee'),
+        Scenario('messages:search', 'get', '/api/messages/search/?q=synthetic', 'employee'),
+        Scenario('messages:conversation', 'get', f'/api/messages/conversation/{peer.username}/?limit=50', 'employee'),
+        Scenario('messages:create', 'post', '/api/messages/', 'employee',
+                 {'recipient': peer.username, 'content': 'Benchmark message'}),
+        Scenario('conversations:list', 'get', '/api/conversations/', 'employee'),
+        Scenario('conversations:unread', 'get', '/api/conversations/unread/', 'employee'),
+        Scenario('cache-stats', 'get', '/api/cache-stats/', 'admin'),
+        Scenario('metrics', 'get', '/api/metrics/', 'admin'),
+    ]
+
+
+def percentile(ordered, pct):
+    # Nearest-rank percentile of an already sorted list
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def summarize(latencies, elapsed, queries, errors):
+    # Latency figures are None when there are no samples (e.g. --iterations 0)
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'p50_ms': milliseconds(percentile(ordered, 50)),
+        'p95_ms': milliseconds(percentile(ordered, 95)),
+        'p99_ms': milliseconds(percentile(ordered, 99)),
+        'mean_ms': milliseconds(sum(ordered) / len(ordered) if ordered else None),
+        'throughput_rps': round(len(ordered) / elapsed, 1) if elapsed else None,
+        'queries_per_request': round(queries / len(ordered), 2) if ordered else None,
+    }
+
+
+def run_http_scenario(scenario, users, iterations=50, warmup=5, cold=False):
+    client = APIClient(raise_request_exception=False)  # Count 500s as errors instead of aborting the run
+    client.force_authenticate(users[scenario.role])
+    latencies, queries, errors, elapsed = [], 0, 0, 0.0
+
+    for n in range(warmup + iterations):
+        if cold:
+            get_cache().clear()  # Measure the database path, not the response cache
+        with counting_queries() as captured:
+            started = time.perf_counter()
+            if scenario.method == 'get':
+                response = client.get(scenario.path)
+            else:
+                response = client.generic(scenario.method.upper(), scenario.path, json.dumps(scenario.data), 'application/json')
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            took = time.perf_counter() - started
+        if n < warmup:
+            continue
+        latencies.append(took)
+        elapsed += took
+        queries += captured.count
+        errors += response.status_code >= 400
+    return summarize(latencies, elapsed, queries, errors)
+
+
+def run_chat_scenario(clients=10, messages=20):
+    """Pairs of employees chat concurrently; latency is send -> delivery to the peer."""
+    users = list(User.objects.filter(is_staff=False, is_active=True).order_by('id')[:clients * 2])
+    pairs = list(zip(users[::2], users[1::2]))
+    if not pairs:
+        return None
+
+    async def connect(user):
+        communicator = WebsocketCommunicator(EmployeesConsumer.as_asgi(), '/ws/employees/')
+        communicator.scope['user'] = user
+        await communicator.connect()
+        return communicator
+
+    async def converse(sender, recipient, peer_username):
+        latencies = []
+        for n in range(messages):
+            started = time.perf_counter()
+            await sender.send_to(text_data=json.dumps({'message': f'Benchmark {n}', 'recipient_username': peer_username}))
+            await recipient.receive_from(timeout=10)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    async def run():
+        senders = [await connect(sender) for sender, _ in pairs]
+        recipients = [await connect(recipient) for _, recipient in pairs]
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            converse(sender, recipient, peer.username)
+            for sender, recipient, (_, peer) in zip(senders, recipients, pairs)
+        ))
+        elapsed = time.perf_counter() - started
+        for communicator in senders + recipients:
+            await communicator.disconnect()
+        return [latency for latencies in results for latency in latencies], elapsed
+
+    with counting_queries() as captured:
+        latencies, elapsed = async_to_sync(run)()
+    return summarize(latencies, elapsed, captured.count, 0)
+
+
+def run_presence_scenario(clients=20, rounds=20):
+    """Connected users alternate online/away heartbeats and look up everyone's state."""
+    users = list(User.objects.filter(is_active=True).order_by('id')[:clients])
+    if not users:
+        return None
+    user_ids = [user.id for user in users]
+
+    async def connect(user):
+        communicator = WebsocketCommunicator(EmployeesConsumer.as_asgi(), '/ws/employees/')
+        communicator.scope['user'] = user
+        await communicator.connect()
+        return communicator
+
+    async def poll(communicator):
+        latencies = []
+        for n in range(rounds):
+            started = time.perf_counter()
+            await communicator.send_to(text_data=json.dumps({'type': 'heartbeat', 'state': 'away' if n % 2 else 'online'}))
+            await communicator.send_to(text_data=json.dumps({'type': 'presence_query', 'user_ids': user_ids}))
+            await communicator.receive_from(timeout=10)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    async def run():
+        communicators = [await connect(user) for user in users]
+        started = time.perf_counter()
+        results = await asyncio.gather(*(poll(communicator) for communicator in communicators))
+        elapsed = time.perf_counter() - started
+        for communicator in communicators:
+            await communicator.disconnect()
+        return [latency for latencies in results for latency in latencies], elapsed
+
+    # Heartbeats every round measure the backend write, not the client-side
+    # throttle, with a HEARTBEAT_INTERVAL of 0 (as the benchmark command sets)
+    with counting_queries() as captured:
+        latencies, elapsed = async_to_sync(run)()
+    return summarize(latencies, elapsed, captured.count, 0)
+
+
+def run_broadcast_scenario(admin, recipients=100, iterations=10):
+    """One admin broadcasts to `recipients` users; latency is send -> broadcast_ack."""
+    usernames = list(
+        User.objects.filter(is_active=True).exclude(id=admin.id).order_by('id')
+        .values_list('username', flat=True)[:recipients]
+    )
+    if not usernames:
+        return None
+
+    async def run():
+        communicator = WebsocketCommunicator(EmployeesConsumer.as_asgi(), '/ws/employees/')
+        communicator.scope['user'] = admin
+        await communicator.connect()
+        latencies = []
+        for n in range(iterations):
+            started = time.perf_counter()
+            await communicator.send_to(text_data=json.dumps({
+                'type': 'broadcast', 'message': f'Benchmark broadcast {n}', 'recipient_usernames': usernames,
+            }))
+            await communicator.receive_from(timeout=30)
+            latencies.append(time.perf_counter() - started)
+        await communicator.disconnect()
+        return latencies
+
+    with counting_queries() as captured:
+        latencies = async_to_sync(run)()
+    return summarize(latencies, sum(latencies), captured.count, 0)
+
+
+def run_fan_out_scenario(protocol=None, listeners=50, events=20):
+    """Server-side fan-out of `events` chat events to `listeners` sockets using `protocol`.
+
+    Latency is publish -> the last socket holding the event; the result adds
+    bytes sent per event and process CPU time per delivered event.
+    """
+    users = list(User.objects.filter(is_active=True).order_by('id')[:listeners])
+    if not users:
+        return None
+    subprotocols = [protocol] if protocol else []
+
+    async def connect(user):
+        communicator = WebsocketCommunicator(EmployeesConsumer.as_asgi(), '/ws/employees/', subprotocols=subprotocols)
+        communicator.scope['user'] = user
+        await communicator.connect()
+        return communicator
+
+    async def drain(communicator):
+        received, size, frames = 0, 0, 0
+        while received < events:
+            frame = await communicator.receive_output(timeout=10)
+            payload = frame.get('bytes') or frame['text'].encode()
+            size += len(payload)
+            frames += 1
+            received += len(unpack(payload)) if frame.get('bytes') is not None else 1
+        return size, frames
+
+    async def run():
+        communicators = [await connect(user) for user in users]
+        latencies = []
+        cpu_started, started = time.process_time(), time.perf_counter()
+        for n in range(events):
+            sent = time.perf_counter()
+            await publish([(user.id, {
+                'type': 'chat_message', 'sender_username': 'benchmark', 'recipient_username': user.username,
+                'message': f'Benchmark fan-out {n}', 'timestamp': timezone.now().isoformat(),
+            }) for user in users])
+            latencies.append(sent)
+        drained = await asyncio.gather(*(drain(communicator) for communicator in communicators))
+        finished = time.perf_counter()
+        elapsed, cpu = finished - started, time.process_time() - cpu_started
+        for communicator in communicators:
+            await communicator.disconnect()
+        return [finished - sent for sent in latencies], elapsed, cpu, drained
+
+    with counting_queries() as captured:
+        latencies, elapsed, cpu, drained = async_to_sync(run)()
+    delivered = len(users) * events
+    return {
+        **summarize(latencies, elapsed, captured.count, 0),
+        'bytes_per_event': round(sum(size for size, _ in drained) / delivered, 1),
+        'events_per_frame': round(delivered / sum(frames for _, frames in drained), 2),
+        'cpu_us_per_event': round(cpu / delivered * 1e6, 1),
+    }
+
+
+def asgi_scenarios(users):
+    # (name, DRF path, async path, role) for the endpoints with an async version
+    peer = users['peer'].username
+    return [
+        ('messages:list', '/api/messages/?limit=50', '/api/async/messages/?limit=50', 'employee'),
+        ('messages:conversation', f'/api/messages/conversation/{peer}/?limit=50',
+         f'/api/async/messages/conversation/{peer}/?limit=50', 'employee'),
+        ('tasks:list', '/api/tasks/?limit=100', '/api/async/tasks/?limit=100', 'admin'),
+        ('users:list', '/api/users/', '/api/async/users/', 'admin'),
+    ]
+
+
+def list_scenarios():
+    # (name, path, role) for list endpoints served from values() rows
+    return [
+        ('tasks', '/api/tasks/?limit=500', 'admin'),
+        ('attendance', '/api/attendance/?limit=500', 'admin'),
+        ('salary', '/api/salary/?limit=500', 'admin'),
+        ('messages', '/api/messages/?limit=200', 'employee'),
+    ]
+
+
+def run_list_scenario(scenario, users, baseline=nullcontext, iterations=50, warmup=5):
+    with baseline():
+        return run_http_scenario(scenario, users, iterations, warmup, cold=True)
+
+
+def run_asgi_scenario(path, user, requests=100, concurrency=10):
+    """`requests` GETs through Django's ASGI handler, `concurrency` in flight at once.
+
+    Every request has its own query string, so none is served from the
+    response cache and both sides query the database.
+    """
+    client = AsyncClient()
+    headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+    separator = '&' if '?' in path else '?'
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, errors = [], 0
+
+        async def one(n):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(f'{path}{separator}benchmark={n}', headers=headers)
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code >= 400
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(requests)))
+        return latencies, time.perf_counter() - started, errors
+
+    with counting_queries() as captured:
+        latencies, elapsed, errors = async_to_sync(run)()
+    return summarize(latencies, elapsed, captured.count, errors)
+
+
+def run_benchmark(iterations=50, warmup=5, cold=False, only=None, chat_clients=10, chat_messages=20,
+                  broadcast_recipients=100, asgi_requests=100, asgi_concurrency=10, serializer_baseline=None,
+                  progress=None):
+    users = pick_users()
+    if users is None:
+        raise ValueError("Need at least one admin and two employees; run `manage.py seed_data` first.")
+
+    def selected(name):
+        return not only or any(name.startswith(prefix) for prefix in only)
+
+    results = {}
+    for scenario in http_scenarios(users):
+        if selected(scenario.name):
+            results[scenario.name] = run_http_scenario(scenario, users, iterations, warmup, cold)
+            if progress:
+                progress(scenario.name, results[scenario.name])
+
+    modes = [('serializer', serializer_baseline)] if serializer_baseline is not None else []
+    for name, path, role in list_scenarios():
+        for mode, baseline in modes + [('values', nullcontext)]:
+            full_name = f'lists:{name}:{mode}'
+            if selected(full_name):
+                scenario = Scenario(full_name, 'get', path, role)
+                results[full_name] = run_list_scenario(scenario, users, baseline, iterations, warmup)
+                if progress:
+                    progress(full_name, results[full_name])
+
+    for name, run in (
+        ('chat:message', lambda: run_chat_scenario(chat_clients, chat_messages)),
+        ('chat:broadcast', lambda: run_broadcast_scenario(users['admin'], broadcast_recipients)),
+        ('chat:presence', lambda: run_presence_scenario(chat_clients * 2, chat_messages)),
+        ('chat:fan-out:json', lambda: run_fan_out_scenario(None, chat_clients, chat_messages * 5)),
+        ('chat:fan-out:msgpack', lambda: run_fan_out_scenario(MSGPACK_SUBPROTOCOL, chat_clients, chat_messages * 5)),
+    ):
+        if selected(name):
+            result = run()
+            if result is not None:
+                results[name] = result
+                if progress:
+                    progress(name, result)
+
+    # Sync (DRF) and async versions of the same endpoints under ASGI
+    for name, sync_path, async_path, role in asgi_scenarios(users):
+        for mode, path in (('sync', sync_path), ('async', async_path)):
+            full_name = f'asgi:{name}:{mode}'
+            if selected(full_name):
+                results[full_name] = run_asgi_scenario(path, users[role], asgi_requests, asgi_concurrency)
+                if progress:
+                    progress(full_name, results[full_name])
+
+    return {
+        'settings': {
+            'iterations': iterations, 'warmup': warmup, 'cold': cold, 'database': connection.vendor,
+            'asgi_requests': asgi_requests, 'asgi_concurrency': asgi_concurrency,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance=0.2):
+    """Rows of (scenario, baseline p95, current p95, change, query change, regressed)."""
+    rows = []
+    for name, result in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if before is None or before['p95_ms'] is None or result['p95_ms'] is None:
+            continue
+        change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0.0
+        query_change = result['queries_per_request'] - before['queries_per_request']
+        rows.append((
+            name, before['p95_ms'], result['p95_ms'], change, query_change,
+            change > tolerance or query_change > 0,
+        ))
+    return rows
@@ -0,0 +1,191 @@
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.utils.dateparse import parse_date
+
+from .cache import invalidate
+from .models import Attendance
+from .summaries import apply_attendance_changes
+
+
+# Bulk attendance import
+#
+# Records are processed in chunks: each chunk costs one query to resolve the
+# employee ids, one to lock rows that already exist for those (employee, date)
+# pairs and one bulk INSERT, instead of an auth round trip and INSERT per row.
+ATTENDANCE_STATUSES = {choice for choice, _ in Attendance.STATUS_CHOICES}
+CONFLICT_MODES = ('ignore', 'update')
+DEFAULT_CHUNK_SIZE = 2000
+CONFLICT_RETRIES = 3
+
+
+def iter_uploaded_records(upload, file_type=None):
+    """Yield dicts from an uploaded CSV or JSONL file without reading it whole."""
+    name = (upload.name or '').lower()
+    file_type = file_type or ('csv' if name.endswith('.csv') else 'jsonl')
+    lines = (line.decode('utf-8-sig') if isinstance(line, bytes) else line for line in upload)
+
+    if file_type == 'csv':
+        yield from csv.DictReader(lines)
+        return
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield {'_error': 'Invalid JSON line.'}
+
+
+def parse_record(record):
+    """Return ((employee_id, date, status), None) or (None, errors)."""
+    if not isinstance(record, dict):
+        return None, {'non_field_errors': ['Expected an object.']}
+    if '_error' in record:
+        return None, {'non_field_errors': [record['_error']]}
+
+    errors = {}
+    try:
+        employee_id = int(record.get('employee'))
+    except (TypeError, ValueError):
+        employee_id = None
+        errors['employee'] = ['A valid employee id is required.']
+
+    day = record.get('date')
+    try:
+        day = parse_date(day) if isinstance(day, str) else None
+    except ValueError:
+        day = None
+    if day is None:
+        errors['date'] = ['A valid YYYY-MM-DD date is required.']
+
+    status = record.get('status') or 'Present'
+    if status not in ATTENDANCE_STATUSES:
+        errors['status'] = [f'"{status}" is not a valid choice.']
+
+    if errors:
+        return None, errors
+    return (employee_id, day, status), None
+
+
+def import_attendance(records, on_conflict='ignore', chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write attendance records in chunks and report what happened to each row.
+
+    ``on_conflict='ignore'`` leaves existing (employee, date) rows untouched and
+    reports them as ``skipped``; ``'update'`` overwrites their status.
+    """
+    if on_conflict not in CONFLICT_MODES:
+        raise ValueError(f'on_conflict must be one of {CONFLICT_MODES}')
+
+    summary = {'created': 0, 'updated': 0, 'skipped': 0, 'errors': 0}
+    results = []
+    records = iter(records)
+    row_number = 0
+
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        parsed = []
+        for record in chunk:
+            row_number += 1
+            values, errors = parse_record(record)
+            if errors:
+                results.append({'row': row_number, 'status': 'error', 'errors': errors})
+                summary['errors'] += 1
+            else:
+                parsed.append((row_number, values))
+
+        for result in _write_chunk(parsed, on_conflict):
+            summary[result['status'] if result['status'] != 'error' else 'errors'] += 1
+            results.append(result)
+
+    # bulk_create() sends no post_save signals.
+    invalidate(Attendance)
+    results.sort(key=lambda result: result['row'])
+    return summary, results
+
+
+def _write_chunk(parsed, on_conflict):
+    if not parsed:
+        return []
+
+    employee_ids = {employee_id for _, (employee_id, _, _) in parsed}
+    dates = {day for _, (_, day, _) in parsed}
+    known_ids = set(User.objects.filter(id__in=employee_ids).values_list('id', flat=True))
+
+    results = []
+    to_write = {}
+    for row, (employee_id, day, status) in parsed:
+        key = (employee_id, day)
+        if employee_id not in known_ids:
+            results.append({'row': row, 'status': 'error', 'errors': {'employee': ['Employee does not exist.']}})
+        elif key in to_write:
+            results.append({'row': row, 'status': 'error', 'errors': {'non_field_errors': ['Duplicate of an earlier row.']}})
+        else:
+            to_write[key] = (row, status)
+
+    if not to_write:
+        return results
+
+    for attempt in range(CONFLICT_RETRIES):
+        try:
+            existing = _write_locked(to_write, dates, on_conflict)
+            break
+        except IntegrityError:
+            # Another request inserted one of our new keys after we looked;
+            # read again so that row is reported and counted as existing.
+            if attempt == CONFLICT_RETRIES - 1:
+                raise
+
+    for key, (row, status) in to_write.items():
+        if key not in existing:
+            outcome = 'created'
+        elif on_conflict == 'update':
+            outcome = 'updated'
+        else:
+            outcome = 'skipped'
+        results.append({'row': row, 'status': outcome})
+    return results
+
+
+def _write_locked(to_write, dates, on_conflict):
+    """Write one chunk and update the rollups; return the rows that existed before.
+
+    Existing rows are locked so their status cannot change under us, and new
+    rows are inserted without a conflict clause: a row another request inserted
+    in the meantime raises IntegrityError instead of being silently skipped
+    and counted a second time.
+    """
+    with transaction.atomic():
+        existing = {
+            (employee_id, day): (pk, status)
+            for pk, employee_id, day, status in Attendance.objects.select_for_update().filter(
+                employee_id__in={employee_id for employee_id, _ in to_write}, date__in=dates,
+            ).values_list('id', 'employee_id', 'date', 'status')
+        }
+        Attendance.objects.bulk_create([
+            Attendance(employee_id=employee_id, date=day, status=status)
+            for (employee_id, day), (_, status) in to_write.items()
+            if (employee_id, day) not in existing
+        ])
+
+        changes = []
+        updated = []
+        for (employee_id, day), (_, status) in to_write.items():
+            if (employee_id, day) not in existing:
+                changes.append((employee_id, day, status, 1))
+                continue
+            pk, previous = existing[(employee_id, day)]
+            if on_conflict == 'update' and previous != status:
+                updated.append(Attendance(pk=pk, status=status))
+                changes.append((employee_id, day, previous, -1))
+                changes.append((employee_id, day, status, 1))
+        Attendance.objects.bulk_update(updated, ['status'])
+        apply_attendance_changes(changes)
+    return existing
@@ -0,0 +1,165 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.query import QuerySet
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+from .replicas import primary
+
+logger = logging.getLogger(__name__)
+
+
+# Response cache for read-heavy list endpoints
+#
+# Cached payloads are keyed by view, scope (the caller's role, or their id for
+# per-user querysets), query string and the current "version" of every model
+# the payload is built from.  Payloads are always built from the primary
+# database (see employees/replicas.py): the version is bumped when a write
+# commits on the primary, and a payload read from a lagging replica just
+# after that would be stored under the new version and served to everyone
+# for the whole TTL.  post_save/post_delete handlers in
+# employees/signals.py bump a model's version when the write commits, which
+# makes every payload built from that model unreachable at once; the stale
+# entries simply age out
+# through the cache's TTL and size limit.
+#
+# An entry also keeps the response's validators (ETag, Last-Modified, set by
+# ConditionalListMixin, which comes after this mixin in a view's bases), so a
+# poll that hits the cache is answered, 304 or not, without a query.
+#
+# The cache alias comes from settings.EMPLOYEES_RESPONSE_CACHE (Redis in
+# production, LocMemCache in tests).  Cache errors never fail a request: the
+# view falls back to the database.
+VERSION_KEY = 'version:{}'
+CACHED_HEADERS = ('ETag', 'Last-Modified')
+HITS_KEY = 'stats:hits'
+MISSES_KEY = 'stats:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'EMPLOYEES_RESPONSE_CACHE', 'default')]
+
+
+def model_label(model):
+    return model._meta.label_lower
+
+
+def _count(cache, key):
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:  # Missing (never set, or evicted)
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+    except Exception:
+        logger.exception("Could not update response cache counter %s", key)
+
+
+def invalidate(*models):
+    cache = get_cache()
+    for model in models:
+        key = VERSION_KEY.format(model_label(model))
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Restart from the clock so an evicted counter can never fall
+                # back to a version that older payloads were stored under.
+                cache.set(key, time.time_ns(), timeout=None)
+        except Exception:
+            logger.exception("Could not invalidate cached responses for %s", model_label(model))
+
+
+def model_versions(cache, models):
+    keys = [VERSION_KEY.format(model_label(model)) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [str(versions[key]) for key in keys]
+
+
+def cache_stats():
+    cache = get_cache()
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counters.get(HITS_KEY, 0), counters.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+    }
+
+
+def _plain(data):
+    # Serializer return types keep a reference to their serializer; store
+    # plain containers only.
+    if isinstance(data, dict):
+        return {key: _plain(value) for key, value in data.items()}
+    if isinstance(data, (list, QuerySet)):
+        return [_plain(value) for value in data]
+    return data
+
+
+class CachedListMixin:
+    """Serve `list` from the response cache.
+
+    `cache_models` lists every model whose rows appear in the payload.
+    """
+    cache_models = ()
+    cache_timeout = 60
+    cache_per_user = True  # False when every caller of a role sees the same list
+
+    def get_cache_scope(self, request):
+        if request.user.is_staff:
+            return 'admin'
+        return f'user:{request.user.pk}' if self.cache_per_user else 'employee'
+
+    def get_cache_key(self, request, versions):
+        query = request.query_params.urlencode() if request.query_params else ''
+        raw = '|'.join([
+            # Payloads hold absolute next/previous links built from the request
+            self.__class__.__name__, request.scheme, request.get_host(), self.get_cache_scope(request),
+            request.accepted_renderer.format, query, *versions,
+        ])
+        return 'response:' + hashlib.sha1(raw.encode()).hexdigest()
+
+    def cached_response(self, request, build):
+        """Return the cached payload for this request, or call `build()` and cache it."""
+        cache = get_cache()
+        try:
+            key = self.get_cache_key(request, model_versions(cache, self.cache_models))
+            entry = cache.get(key)
+        except Exception:
+            logger.exception("Response cache unavailable")
+            return build()
+
+        if entry is not None:
+            _count(cache, HITS_KEY)
+            data, headers = entry
+            if 'ETag' in headers:
+                not_modified = get_conditional_response(request._request, etag=headers['ETag'])
+                if not_modified is not None:
+                    return not_modified
+            response = Response(data)
+            for header, value in headers.items():
+                response[header] = value
+            return response
+
+        _count(cache, MISSES_KEY)
+        with primary():
+            response = build()
+        try:
+            if response.status_code == 200:
+                headers = {header: response[header] for header in CACHED_HEADERS if response.has_header(header)}
+                cache.set(key, (_plain(response.data), headers), timeout=self.cache_timeout)
+        except Exception:
+            logger.exception("Response cache unavailable")
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedListMixin, self).list(request, *args, **kwargs))
@@ -0,0 +1,74 @@
+import hashlib
+import logging
+import time
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_cache, model_versions
+
+logger = logging.getLogger(__name__)
+
+
+# Conditional GET for polled list endpoints
+#
+# The validator for a list is derived from one aggregate over the caller's
+# (filtered) queryset: the newest modification time, the row count and the
+# highest id.  Any create, update or delete changes at least one of them.  When
+# the client's If-None-Match still matches, the view answers 304 after that
+# single query, without fetching or serializing any rows.  Views that also
+# cache their lists put CachedListMixin first: a cached entry keeps its
+# validators, so polls that hit the cache skip the aggregate as well.
+#
+# Only the ETag decides whether a 304 is sent: Last-Modified is informational,
+# because a deleted row does not move max(updated_at) forward.
+#
+# Payloads that also show columns of other models (e.g. the assignee's
+# username) list those models in `etag_related_models`; their response-cache
+# versions are folded into the ETag.
+class ConditionalListMixin:
+    last_modified_field = 'updated_at'
+    etag_related_models = ()
+
+    def get_related_versions(self):
+        if not self.etag_related_models:
+            return []
+        try:
+            return model_versions(get_cache(), self.etag_related_models)
+        except Exception:
+            logger.exception("Response cache unavailable")
+            return [str(time.time_ns())]  # Never matches, so never a stale 304
+
+    def get_list_validators(self, request, queryset):
+        state = queryset.order_by().aggregate(
+            last_modified=Max(self.last_modified_field), count=Count('pk'), last_id=Max('pk'),
+        )
+        raw = '|'.join(str(part) for part in (
+            self.__class__.__name__, self.action, request.user.pk,
+            request.accepted_renderer.format, request.query_params.urlencode(),
+            state['last_modified'] and state['last_modified'].isoformat(),
+            state['count'], state['last_id'], *self.get_related_versions(),
+        ))
+        etag = quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+        return etag, state['last_modified']
+
+    def conditional_response(self, request, queryset, build):
+        """Answer 304 if the client's copy of `queryset` is current, else `build()`."""
+        etag, last_modified = self.get_list_validators(request, queryset)
+        not_modified = get_conditional_response(request._request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = build()
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(
+            request, queryset, lambda: super(ConditionalListMixin, self).list(request, *args, **kwargs),
+        )
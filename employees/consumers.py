@@ -1,8 +1,49 @@
+import asyncio
 import json
+import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
+from .cache import invalidate
+from .inbox import record_messages
+from .instrumentation import current_metrics, track
 from .models import Message
+from .protocol import compact, get_options as protocol_options, negotiate, pack, unpack
+from .presence import ONLINE, STATES, get_options as presence_options, get_presence, presence_group, presence_notifier
+from .replicas import primary, routed
+from .streams import get_event_stream, publish, user_group
+from .usercache import load_username, username_cache
+from .writebehind import message_writer
+from django.conf import settings
+from django.utils import timezone
 from django.contrib.auth.models import User
 from channels.db import database_sync_to_async
+from django.db import IntegrityError, transaction
+
+logger = logging.getLogger(__name__)
+
+# Broadcasts: how many recipients one frame may address, and how many
+# group_send calls are in flight at once while fanning out.
+MAX_BROADCAST_RECIPIENTS = getattr(settings, 'EMPLOYEES_MAX_BROADCAST_RECIPIENTS', 10000)
+FAN_OUT_CONCURRENCY = getattr(settings, 'EMPLOYEES_FAN_OUT_CONCURRENCY', 500)
+BROADCAST_GROUPS = ('all', 'staff', 'employees')
+
+# Frame "type" -> handler; frames without a known type are chat messages
+FRAME_HANDLERS = {
+    'broadcast': 'receive_broadcast',
+    'heartbeat': 'receive_heartbeat',
+    'presence_subscribe': 'receive_presence_subscribe',
+    'presence_unsubscribe': 'receive_presence_unsubscribe',
+    'presence_query': 'receive_presence_query',
+    'resume': 'receive_resume',
+}
+
+# Channel-layer events a resume may replay
+REPLAYABLE_EVENTS = ('chat_message', 'entity_event')
+
+# Channel-layer events whose handlers only write to the socket.  channels hops
+# to a worker thread to close stale database connections before every handler;
+# these skip that.
+PUSH_EVENTS = ('chat_message', 'entity_event', 'presence_update')
+
 
 class EmployeesConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -11,14 +52,24 @@ class EmployeesConsumer(AsyncWebsocketConsumer):
             return
 
         self.user = self.scope["user"]
-        self.group_name = f'user_{self.user.id}'
+        self.group_name = user_group(self.user.id)
+        self.presence_state = ONLINE
+        self.heartbeat_at = asyncio.get_running_loop().time()
+        self.presence_subscriptions = set()
+        self.presence_buffer = {}
+        self.presence_push = None
+        self.replayed_epoch, self.replayed_through = None, 0  # Highest seq already sent by a resume
+        self.protocol = negotiate(self.scope)
+        self.outbox = []  # Binary protocol: frames waiting for the next batch
+        self.outbox_push = None
 
         # Join user-specific group
         await self.channel_layer.group_add(
             self.group_name,
             self.channel_name
         )
-        await self.accept()
+        await self.accept(self.protocol or self.scope.get('auth_subprotocol'))
+        await self.update_presence('connect')
 
     async def disconnect(self, close_code):
         # Leave user-specific group
@@ -26,51 +77,328 @@ class EmployeesConsumer(AsyncWebsocketConsumer):
             self.group_name,
             self.channel_name
         )
+        if getattr(settings, 'EMPLOYEES_CHAT_WRITE_BEHIND', False):
+            await message_writer.flush()
+        if self.presence_push is not None:
+            self.presence_push.cancel()
+        if self.outbox_push is not None:
+            self.outbox_push.cancel()
+        await self.group_many('group_discard', self.presence_subscriptions)
+        await self.update_presence('disconnect')
+
+    async def receive(self, text_data=None, bytes_data=None):
+        data = json.loads(text_data) if text_data is not None else unpack(bytes_data)
+        if not isinstance(data, dict):
+            await self.send_frame({'error': 'Invalid message format'})
+            return
+        frame_type = data.get('type') if data.get('type') in FRAME_HANDLERS else 'chat'
+        with track(f'EmployeesConsumer.{frame_type}', path=self.scope.get('path', '')):
+            async with routed(self.user.id):
+                await getattr(self, FRAME_HANDLERS.get(frame_type, 'receive_chat'))(data)
+
+    async def dispatch(self, message):
+        # Live copies of events a resume has already replayed are dropped
+        if 'seq' in message and message.get('epoch') == self.replayed_epoch and message['seq'] <= self.replayed_through:
+            return
+        if message['type'] in PUSH_EVENTS:
+            await getattr(self, message['type'])(message)
+            return
+        await super().dispatch(message)
+
+    # Every outgoing frame: a JSON text frame each, or batched into one binary
+    # frame per BATCH_DELAY with the MessagePack protocol (employees/protocol.py)
+    async def send_frame(self, frame):
+        if self.protocol is None:
+            await self.send(text_data=json.dumps(frame))
+            return
+        self.outbox.append(compact(frame))
+        if len(self.outbox) >= protocol_options()['BATCH_MAX']:
+            await self.flush_frames()
+        elif self.outbox_push is None or self.outbox_push.done():
+            self.outbox_push = asyncio.create_task(self.push_frames())
+
+    async def push_frames(self):
+        await asyncio.sleep(protocol_options()['BATCH_DELAY'])
+        await self.flush_frames()
+
+    async def flush_frames(self):
+        frames, self.outbox = self.outbox, []
+        if frames:
+            await self.send(bytes_data=pack(frames))
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
+    # Count outgoing frame sizes towards the frame being handled
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.response_bytes += len(text_data.encode()) if text_data is not None else len(bytes_data or b'')
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    async def receive_chat(self, data):
         message = data.get('message')
         recipient_username = data.get('recipient_username')
 
         if not message or not recipient_username:
-            await self.send(text_data=json.dumps({'error': 'Invalid message format'}))
+            await self.send_frame({'error': 'Invalid message format'})
             return
 
         try:
             recipient = await self.get_user_by_username(recipient_username)
         except User.DoesNotExist:
-            await self.send(text_data=json.dumps({'error': 'Recipient does not exist'}))
+            await self.send_frame({'error': 'Recipient does not exist'})
             return
 
-        # Save the message to the database
-        new_message = await self.create_message(self.user, recipient, message)
+        write_behind = getattr(settings, 'EMPLOYEES_CHAT_WRITE_BEHIND', False)
+        if write_behind:
+            # Deliver first; the message is persisted by the next batch write
+            new_message = Message(sender=self.user, recipient_id=recipient.id, content=message, timestamp=timezone.now())
+        else:
+            # Save the message to the database
+            try:
+                new_message = await self.create_message(self.user, recipient, message)
+            except IntegrityError:
+                # Deleted in another process while still in our username cache
+                username_cache.invalidate(recipient.id)
+                await self.send_frame({'error': 'Recipient does not exist'})
+                return
 
         # Send message to recipient's group
-        recipient_group = f'user_{recipient.id}'
-        await self.channel_layer.group_send(
-            recipient_group,
-            {
+        await publish([(recipient.id, {
+            'type': 'chat_message',
+            'sender_username': self.user.username,
+            'recipient_username': recipient.username,
+            'message': new_message.content,
+            'timestamp': new_message.timestamp.isoformat()
+        })])
+
+        if write_behind:
+            await message_writer.enqueue(new_message)
+
+    # One message to many recipients: {"type": "broadcast", "message": ...,
+    # "recipient_usernames": [...]} or, for admins, "group": "all" | "staff" | "employees".
+    # The sender gets {"type": "broadcast_ack", "recipients": <count>, "missing":
+    # [usernames that do not exist], "inactive": [deactivated usernames]}; their
+    # own username in the list is skipped.
+    async def receive_broadcast(self, data):
+        message = data.get('message')
+        usernames = data.get('recipient_usernames')
+        group = data.get('group')
+
+        if not message or (usernames is None) == (group is None):
+            await self.send_frame({'error': 'Invalid broadcast format'})
+            return
+        if group is not None and (group not in BROADCAST_GROUPS or not await self.is_staff()):
+            await self.send_frame({'error': 'Invalid broadcast group'})
+            return
+        if usernames is not None and (not isinstance(usernames, list) or len(usernames) > MAX_BROADCAST_RECIPIENTS):
+            await self.send_frame({'error': 'Invalid recipient list'})
+            return
+
+        recipients = await self.get_broadcast_recipients(usernames, group)
+        messages = await self.create_messages(self.user, recipients, message)
+
+        await publish([
+            (recipient_id, {
                 'type': 'chat_message',
                 'sender_username': self.user.username,
-                'recipient_username': recipient.username,
+                'recipient_username': recipient_username,
                 'message': new_message.content,
                 'timestamp': new_message.timestamp.isoformat()
-            }
-        )
+            })
+            for (recipient_id, recipient_username), new_message in zip(recipients, messages)
+        ])
+
+        found = {username for _, username in recipients}
+        unresolved = [username for username in usernames or [] if username not in found and username != self.user.username]
+        inactive = await self.get_inactive_usernames(unresolved) if unresolved else set()
+        await self.send_frame({
+            'type': 'broadcast_ack',
+            'recipients': len(recipients),
+            'missing': [username for username in unresolved if username not in inactive],
+            'inactive': [username for username in unresolved if username in inactive],
+        })
+
+    # Missed events: {"type": "resume", "last_seq": <highest seq received>,
+    # "epoch": <its epoch>} after reconnecting replays every later event, then
+    # sends {"type": "resumed", "seq": ..., "epoch": ..., "replayed": ...}.  If
+    # some of them are gone, or the stream has started again since (another
+    # epoch), the reply is {"type": "resync", "seq": ..., "epoch": ...}:
+    # refetch over the REST API and carry on from that seq.
+    async def receive_resume(self, data):
+        last_seq, epoch = data.get('last_seq'), data.get('epoch')
+        if type(last_seq) is not int or last_seq < 0:
+            await self.send_frame({'error': 'Invalid last_seq'})
+            return
+        if epoch is not None and type(epoch) is not int:
+            await self.send_frame({'error': 'Invalid epoch'})
+            return
+        try:
+            newest, epoch, events = await get_event_stream().since(self.user.id, last_seq, epoch)
+        except Exception:
+            logger.exception("Reading the event stream failed for user %s", self.user.id)
+            await self.send_frame({'type': 'resync', 'seq': None, 'epoch': None})
+            return
+        if events is not None:
+            for seq, event in events:
+                if event.get('type') in REPLAYABLE_EVENTS:
+                    await getattr(self, event['type'])({**event, 'seq': seq, 'epoch': epoch})
+        if epoch != self.replayed_epoch or newest > self.replayed_through:
+            self.replayed_epoch, self.replayed_through = epoch, newest
+        if events is None:
+            await self.send_frame({'type': 'resync', 'seq': newest, 'epoch': epoch})
+            return
+        await self.send_frame({'type': 'resumed', 'seq': newest, 'epoch': epoch, 'replayed': len(events)})
+
+    # Presence: {"type": "heartbeat", "state": "online" | "away"} every
+    # HEARTBEAT_INTERVAL seconds; "presence_subscribe" / "presence_unsubscribe"
+    # / "presence_query" with "user_ids": [...].  Subscribers get
+    # {"type": "presence", "users": {"<id>": "online" | "away" | "offline"}}.
+    async def receive_heartbeat(self, data):
+        state = data.get('state', ONLINE)
+        if state not in STATES:
+            await self.send_frame({'error': 'Invalid heartbeat state'})
+            return
+        # Extra heartbeats from a chatty client are not written through
+        now = asyncio.get_running_loop().time()
+        if state == self.presence_state and now - self.heartbeat_at < presence_options()['HEARTBEAT_INTERVAL'] / 2:
+            return
+        self.presence_state, self.heartbeat_at = state, now
+        await self.update_presence('heartbeat', state)
+
+    async def receive_presence_subscribe(self, data):
+        user_ids = await self.presence_user_ids(data)
+        if user_ids is None:
+            return
+        added = [user_id for user_id in user_ids if user_id not in self.presence_subscriptions]
+        if len(self.presence_subscriptions) + len(added) > presence_options()['MAX_SUBSCRIPTIONS']:
+            await self.send_frame({'error': 'Too many presence subscriptions'})
+            return
+        self.presence_subscriptions.update(added)
+        await self.group_many('group_add', added)
+        # Read after joining the groups, so no change can fall in between
+        await self.send_presence(await get_presence().statuses(user_ids))
+
+    async def receive_presence_unsubscribe(self, data):
+        user_ids = await self.presence_user_ids(data)
+        if user_ids is None:
+            return
+        removed = [user_id for user_id in user_ids if user_id in self.presence_subscriptions]
+        self.presence_subscriptions.difference_update(removed)
+        await self.group_many('group_discard', removed)
+
+    async def receive_presence_query(self, data):
+        user_ids = await self.presence_user_ids(data)
+        if user_ids is not None:
+            await self.send_presence(await get_presence().statuses(user_ids))
+
+    async def presence_user_ids(self, data):
+        user_ids = data.get('user_ids')
+        if (
+            not isinstance(user_ids, list) or len(user_ids) > presence_options()['MAX_SUBSCRIPTIONS']
+            or not all(type(user_id) is int for user_id in user_ids)
+        ):
+            await self.send_frame({'error': 'Invalid user id list'})
+            return None
+        return list(dict.fromkeys(user_ids))
+
+    async def update_presence(self, method, *args):
+        # Presence is best effort: a backend outage must not break chat
+        try:
+            old, new = await getattr(get_presence(), method)(self.user.id, *args)
+        except Exception:
+            logger.exception("Presence %s failed for user %s", method, self.user.id)
+            return
+        presence_notifier.changed(self.user.id, old, new)
+
+    async def group_many(self, operation, user_ids):
+        groups = [presence_group(user_id) for user_id in user_ids]
+        for start in range(0, len(groups), FAN_OUT_CONCURRENCY):
+            await asyncio.gather(*(
+                getattr(self.channel_layer, operation)(group, self.channel_name)
+                for group in groups[start:start + FAN_OUT_CONCURRENCY]
+            ))
+
+    async def presence_update(self, event):
+        # Updates arriving close together go out as one frame
+        self.presence_buffer.update(event['users'])
+        if self.presence_push is None or self.presence_push.done():
+            self.presence_push = asyncio.create_task(self.push_presence())
+
+    async def push_presence(self):
+        await asyncio.sleep(presence_options()['PUSH_DELAY'])
+        users, self.presence_buffer = self.presence_buffer, {}
+        await self.send_presence(users)
+
+    async def send_presence(self, users):
+        await self.send_frame({'type': 'presence', 'users': users})
+
+    # Task and complaint changes (employees/events.py)
+    async def entity_event(self, event):
+        await self.send_frame({
+            'type': 'entity_event',
+            'entity': event['entity'],
+            'event': event['event'],
+            'previous_status': event['previous_status'],
+            'data': event['data'],
+            'seq': event.get('seq'),
+            'epoch': event.get('epoch'),
+        })
 
     async def chat_message(self, event):
         # Send message to WebSocket
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             'sender': event['sender_username'],
             'recipient': event['recipient_username'],
             'message': event['message'],
-            'timestamp': event['timestamp']
-        }))
+            'timestamp': event['timestamp'],
+            'seq': event.get('seq'),
+            'epoch': event.get('epoch'),
+        })
+
+    async def get_user_by_username(self, username):
+        # Cache hits skip both the thread-pool hop and the query
+        cached = username_cache.get(username)
+        if cached is not None:
+            return cached
+        return await database_sync_to_async(load_username)(username)
+
+    @database_sync_to_async
+    def is_staff(self):
+        # self.user may be built from token claims, which keep a demoted
+        # admin's is_staff until the token expires: ask the primary
+        with primary():
+            return User.objects.filter(pk=self.user.id, is_staff=True, is_active=True).exists()
 
     @database_sync_to_async
-    def get_user_by_username(self, username):
-        return User.objects.get(username=username)
+    def get_broadcast_recipients(self, usernames, group):
+        # One query for the whole recipient list, as (id, username) pairs
+        users = User.objects.filter(is_active=True).exclude(id=self.user.id)
+        if usernames is not None:
+            users = users.filter(username__in=[str(username) for username in usernames])
+        elif group == 'staff':
+            users = users.filter(is_staff=True)
+        elif group == 'employees':
+            users = users.filter(is_staff=False)
+        return list(users.order_by('id').values_list('id', 'username'))
+
+    @database_sync_to_async
+    def get_inactive_usernames(self, usernames):
+        return set(User.objects.filter(is_active=False, username__in=[str(username) for username in usernames])
+                   .values_list('username', flat=True))
 
     @database_sync_to_async
     def create_message(self, sender, recipient, content):
-        return Message.objects.create(sender=sender, recipient=recipient, content=content)
+        with transaction.atomic():
+            message = Message.objects.create(sender=sender, recipient_id=recipient.id, content=content)
+            record_messages([message])
+        return message
+
+    @database_sync_to_async
+    def create_messages(self, sender, recipients, content):
+        with transaction.atomic():
+            messages = Message.objects.bulk_create(
+                [Message(sender=sender, recipient_id=recipient_id, content=content) for recipient_id, _ in recipients],
+                batch_size=1000,
+            )
+            record_messages(messages)
+        invalidate(Message)  # bulk_create() sends no post_save signals
+        return messages
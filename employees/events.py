@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+
+from .models import Complaint, Task
+from .serializers import ComplaintSerializer, TaskSerializer
+from .streams import publish
+from .views import COMPLAINT_FIELDS, TASK_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+# Task and complaint change events
+#
+# Saves of a Task or Complaint are pushed over the WebSocket to everyone who
+# can see the row: the assignee or owner (and the previous assignee after a
+# reassignment) and every active admin, each through their own user_<id>
+# group so the event joins that user's sequenced stream (employees/streams.py).
+# Admins see every row, so each event is appended to every active admin's
+# stream: a flush costs one stream write per admin per changed row, plus one
+# query for the admin ids.  Set EMPLOYEES_ENTITY_EVENTS['NOTIFY_STAFF'] = False
+# to notify only the assignee or owner.
+#
+# Events are queued when the transaction commits, so rolled-back writes
+# publish nothing, and a background thread publishes the queue every
+# COALESCE_WINDOW seconds: several saves of one row inside a window become a
+# single event with the row's final state, serialized once.  The event is the
+# strongest of the coalesced saves: "created", then "status_changed" (with the
+# status before the first save), then "updated".
+#
+# Sockets receive {"type": "entity_event", "entity": "task" | "complaint",
+# "event": ..., "previous_status": ..., "data": <the REST representation>,
+# "seq": ..., "epoch": ...}.  Events still queued when the process exits are lost; clients
+# that resume past them are told to refetch.
+EVENT_STRENGTH = {'updated': 0, 'status_changed': 1, 'created': 2}
+
+Entity = namedtuple('Entity', ['name', 'owner_field', 'queryset', 'serializer'])
+
+ENTITIES = {
+    Task: Entity('task', 'assigned_to_id', lambda: Task.objects.select_related('assigned_to').only(*TASK_FIELDS), TaskSerializer),
+    Complaint: Entity('complaint', 'employee_id', lambda: Complaint.objects.select_related('employee').only(*COMPLAINT_FIELDS), ComplaintSerializer),
+}
+
+
+def coalesce_window():
+    return getattr(settings, 'EMPLOYEES_ENTITY_EVENTS', {}).get('COALESCE_WINDOW', 0.5)
+
+
+def notify_staff():
+    return getattr(settings, 'EMPLOYEES_ENTITY_EVENTS', {}).get('NOTIFY_STAFF', True)
+
+
+def saved_fields(instance, update_fields):
+    """The instance's tracked_fields that a save with ``update_fields`` writes."""
+    return [
+        name for name in type(instance).tracked_fields
+        if update_fields is None or {name, name.removesuffix('_id')} & set(update_fields)
+    ]
+
+
+def entity_saving(instance, using, update_fields=None):
+    # Status and owner before this save come from the values the row was
+    # loaded with (LoadedValuesMixin), so saving a loaded row costs no query.
+    # Only a row saved with one of them deferred, or without being loaded,
+    # reads the stored values; new rows and update_fields leaving both alone
+    # need nothing.
+    if instance.pk is None:
+        return
+    loaded = instance.__dict__.setdefault('_loaded_values', {})
+    missing = [name for name in saved_fields(instance, update_fields) if name not in loaded]
+    if missing:
+        stored = type(instance)._base_manager.using(using).filter(pk=instance.pk).values(*missing).first()
+        loaded.update(stored or {})
+
+
+def entity_saved(instance, created, update_fields=None):
+    entity = ENTITIES[type(instance)]
+    loaded = instance.__dict__.get('_loaded_values', {})
+    previous_status, previous_owner = loaded.get('status'), loaded.get(entity.owner_field)
+    if created:
+        event = 'created'
+    elif previous_status is not None and previous_status != instance.status:
+        event = 'status_changed'
+    else:
+        event = 'updated'
+    recipients = {getattr(instance, entity.owner_field)}
+    if previous_owner is not None:
+        recipients.add(previous_owner)
+
+    # A later save of the same instance compares against what this one wrote
+    instance._loaded_values = {
+        **loaded, **{name: getattr(instance, name) for name in saved_fields(instance, update_fields)},
+    }
+
+    model, pk = type(instance), instance.pk
+    transaction.on_commit(lambda: entity_publisher.add(model, pk, event, previous_status, recipients))
+
+
+class EntityEventPublisher:
+    def __init__(self):
+        self._pending = {}  # (model, pk) -> [event, previous status, recipient ids]
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.published = 0
+
+    def add(self, model, pk, event, previous_status, recipients):
+        self.queue(model, pk, event, previous_status, recipients)
+        if coalesce_window() <= 0:
+            self.flush()
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='entity-events', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def queue(self, model, pk, event, previous_status, recipients):
+        with self._lock:
+            pending = self._pending.get((model, pk))
+            if pending is None:
+                self._pending[(model, pk)] = [event, previous_status if event == 'status_changed' else None, set(recipients)]
+                return
+            if EVENT_STRENGTH[event] > EVENT_STRENGTH[pending[0]]:
+                pending[0] = event
+            if event == 'status_changed' and pending[1] is None:
+                pending[1] = previous_status
+            pending[2].update(recipients)
+
+    def _run(self):
+        # One event loop for the thread's lifetime: Redis clients belong to a
+        # loop, so a loop per flush would open a connection per flush
+        loop = asyncio.new_event_loop()
+        while True:
+            self._wake.wait()
+            time.sleep(coalesce_window())  # Let further saves of the same rows pile up
+            self._wake.clear()
+            try:
+                self.flush(loop)
+            except Exception:
+                logger.exception("Publishing task/complaint events failed")
+            finally:
+                close_old_connections()
+
+    def flush(self, loop=None):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        sends = []
+        staff_ids = set()
+        if notify_staff():
+            staff_ids = set(User.objects.filter(is_staff=True, is_active=True).values_list('id', flat=True))
+        for model, entity in ENTITIES.items():
+            pks = [pk for (pending_model, pk) in pending if pending_model is model]
+            if not pks:
+                continue
+            # Current state of every changed row in one query; rows deleted meanwhile are skipped
+            for instance in entity.queryset().filter(pk__in=pks):
+                event, previous_status, recipients = pending[(model, instance.pk)]
+                payload = {
+                    'type': 'entity_event',
+                    'entity': entity.name,
+                    'event': event,
+                    'previous_status': previous_status,
+                    'data': dict(entity.serializer(instance).data),
+                }
+                sends += [(user_id, payload) for user_id in sorted(recipients | staff_ids)]
+        if loop is None:
+            async_to_sync(publish)(sends)
+        else:
+            loop.run_until_complete(publish(sends))
+        self.published += len(sends)
+
+
+entity_publisher = EntityEventPublisher()
@@ -0,0 +1,135 @@
+import csv
+import io
+from collections import namedtuple
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework import status
+
+from .models import Attendance, Salary, Task
+
+
+# Streaming exports
+#
+# Rows are read with values_list() over queryset.iterator(), so the database
+# driver streams them in chunks (a server-side cursor on PostgreSQL) and no
+# model instances are built.  They are written out as CSV or JSONL a chunk at a
+# time through StreamingHttpResponse, which keeps memory flat however many
+# rows are exported.  Under ASGI the response gets an async iterator instead:
+# Django reads a sync iterator to the end before sending anything there, as
+# it does an async one under WSGI.
+#
+# Each export names its model, its (column name, ORM lookup) pairs and the date
+# and employee fields the export_data command filters on.
+Export = namedtuple('Export', ['model', 'columns', 'date_field', 'employee_field'])
+
+EXPORTS = {
+    'attendance': Export(
+        Attendance,
+        [('id', 'id'), ('employee', 'employee_id'), ('employee_username', 'employee__username'),
+         ('date', 'date'), ('status', 'status')],
+        'date', 'employee',
+    ),
+    'salary': Export(
+        Salary,
+        [('id', 'id'), ('employee', 'employee_id'), ('employee_username', 'employee__username'),
+         ('basic_salary', 'basic_salary'), ('bonuses', 'bonuses'), ('deductions', 'deductions'),
+         ('net_salary', 'net_salary'), ('date', 'date')],
+        'date', 'employee',
+    ),
+    'tasks': Export(
+        Task,
+        [('id', 'id'), ('title', 'title'), ('assigned_to', 'assigned_to_id'),
+         ('assigned_to_username', 'assigned_to__username'), ('status', 'status'), ('priority', 'priority'),
+         ('due_date', 'due_date'), ('completed', 'completed'), ('created_by', 'created_by_id'),
+         ('created_at', 'created_at'), ('updated_at', 'updated_at')],
+        'due_date', 'assigned_to',
+    ),
+}
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def values_rows(queryset, columns):
+    return queryset.values_list(*(lookup for _, lookup in columns))
+
+
+def csv_text(header, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def jsonl_text(header, rows):
+    encoder = DjangoJSONEncoder()
+    return ''.join(encoder.encode(dict(zip(header, row))) + '\n' for row in rows)
+
+
+WRITERS = {'csv': csv_text, 'jsonl': jsonl_text}
+
+
+def iter_export(queryset, columns, output, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield `queryset` as CSV or JSONL text chunks."""
+    header = [name for name, _ in columns]
+    write = WRITERS[output]
+    if output == 'csv':
+        yield csv_text(header, [header])
+    rows = []
+    for row in values_rows(queryset, columns).iterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield write(header, rows)
+            rows = []
+    if rows:
+        yield write(header, rows)
+
+
+async def aiter_export(queryset, columns, output, chunk_size=DEFAULT_CHUNK_SIZE):
+    """iter_export() for async consumers; each chunk of rows is one hop to the database thread."""
+    header = [name for name, _ in columns]
+    write = WRITERS[output]
+    if output == 'csv':
+        yield csv_text(header, [header])
+    # Django 4.2's values_list().aiterator() starts its query on the event loop, so
+    # the chunks come from a sync iterator advanced in the database thread instead.
+    rows = values_rows(queryset, columns).iterator(chunk_size=chunk_size)
+    next_rows = sync_to_async(lambda: list(islice(rows, chunk_size)))
+    while chunk := await next_rows():
+        yield write(header, chunk)
+
+
+def streaming_export_response(queryset, columns, output, name, chunk_size=DEFAULT_CHUNK_SIZE, asynchronous=False):
+    chunks = (aiter_export if asynchronous else iter_export)(queryset, columns, output, chunk_size)
+    response = StreamingHttpResponse(chunks, content_type=EXPORT_FORMATS[output])
+    filename = f'{name}-{timezone.localdate().isoformat()}.{output}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+class ExportMixin:
+    """Adds GET <list>/export/?output=csv|jsonl, honouring the list's filters and ordering."""
+    export_name = None
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        if not request.user.is_staff:
+            return self.permission_denied(request, "Only admins can export records.")
+
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            return Response({'error': f'output must be one of {", ".join(EXPORT_FORMATS)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        columns = EXPORTS[self.export_name].columns
+        queryset = self.filter_queryset(self.get_queryset())
+        return streaming_export_response(
+            queryset, columns, output, self.export_name, asynchronous=isinstance(request._request, ASGIRequest),
+        )
@@ -0,0 +1,123 @@
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Conversation, Message
+
+
+# Conversation summaries
+#
+# record_messages() folds a batch of stored messages into the Conversation rows
+# of both participants: last message id/timestamp/preview, and the recipient's
+# unread count.  A batch costs one INSERT for missing rows, one locked SELECT
+# and one bulk UPDATE, whether it holds a single chat message or a broadcast
+# to thousands of users.  Callers run it in the same transaction that stores
+# the messages.  Rows are always inserted and locked in primary key order, so
+# concurrent writers cannot deadlock on each other's rows.
+#
+# forget_message() undoes a deleted message: the summaries of both sides fall
+# back to the latest remaining message (or go away with the last one), and the
+# recipient's unread count drops if the message was among their unread ones,
+# the newest `unread_count` messages from that peer.
+PREVIEW_LENGTH = 140
+
+
+def record_messages(messages, count_unread=True):
+    updates = {}  # (owner_id, peer_id) -> [latest message, unread increment]
+    for message in messages:
+        pairs = [((message.sender_id, message.recipient_id), 0)]
+        if message.recipient_id != message.sender_id:
+            pairs.append(((message.recipient_id, message.sender_id), 1 if count_unread else 0))
+        for pair, unread in pairs:
+            state = updates.get(pair)
+            if state is None:
+                updates[pair] = [message, unread]
+                continue
+            if (message.timestamp, message.pk) > (state[0].timestamp, state[0].pk):
+                state[0] = message
+            state[1] += unread
+
+    if not updates:
+        return
+
+    with transaction.atomic():
+        # Rows that do not exist yet start out empty, then everything is
+        # updated under a row lock so concurrent writers cannot lose counts.
+        Conversation.objects.bulk_create([
+            Conversation(owner_id=owner_id, peer_id=peer_id, last_timestamp=state[0].timestamp)
+            for (owner_id, peer_id), state in sorted(updates.items(), key=lambda item: item[0])
+        ], ignore_conflicts=True)
+
+        rows = list(Conversation.objects.select_for_update().filter(_pairs_filter(updates)).order_by('pk'))
+        changed = []
+        for row in rows:
+            state = updates.get((row.owner_id, row.peer_id))
+            if state is None:
+                continue
+            message, unread = state
+            if row.last_message_id is None or message.timestamp >= row.last_timestamp:
+                row.last_message_id = message.pk
+                row.last_timestamp = message.timestamp
+                row.last_preview = message.content[:PREVIEW_LENGTH]
+            row.unread_count += unread
+            changed.append(row)
+        Conversation.objects.bulk_update(
+            changed, ['last_message', 'last_timestamp', 'last_preview', 'unread_count'], batch_size=1000,
+        )
+
+
+def _pairs_filter(pairs):
+    # Owners with several peers get one IN term each; the remaining pairs are
+    # grouped by peer.  A broadcast (sender -> N recipients plus the N reverse
+    # rows) then becomes two IN lists instead of thousands of ORed pairs.
+    by_owner = defaultdict(list)
+    for owner_id, peer_id in pairs:
+        by_owner[owner_id].append(peer_id)
+
+    terms, by_peer = [], defaultdict(list)
+    for owner_id, peers in by_owner.items():
+        if len(peers) > 1:
+            terms.append(Q(owner_id=owner_id, peer_id__in=peers))
+        else:
+            by_peer[peers[0]].append(owner_id)
+    terms.extend(Q(peer_id=peer_id, owner_id__in=owners) for peer_id, owners in by_peer.items())
+    return reduce(or_, terms)
+
+
+def forget_message(message):
+    sender_id, recipient_id = message.sender_id, message.recipient_id
+    between = Q(sender_id=sender_id, recipient_id=recipient_id) | Q(sender_id=recipient_id, recipient_id=sender_id)
+    with transaction.atomic():
+        rows = list(Conversation.objects.select_for_update().filter(
+            Q(owner_id=sender_id, peer_id=recipient_id) | Q(owner_id=recipient_id, peer_id=sender_id)
+        ).order_by('pk'))
+        if not rows:
+            return
+        latest = None
+        if any(row.last_message_id is None for row in rows):  # SET_NULL if it was the last message
+            latest = Message.objects.filter(between).only('id', 'content', 'timestamp').order_by('-timestamp', '-id').first()
+            if latest is None:
+                Conversation.objects.filter(pk__in=[row.pk for row in rows]).delete()
+                return
+        for row in rows:
+            fields = []
+            if row.last_message_id is None:
+                row.last_message_id, row.last_timestamp = latest.pk, latest.timestamp
+                row.last_preview = latest.content[:PREVIEW_LENGTH]
+                fields += ['last_message', 'last_timestamp', 'last_preview']
+            if row.owner_id == recipient_id != sender_id and row.unread_count:
+                newer = Message.objects.filter(sender_id=sender_id, recipient_id=recipient_id).filter(
+                    Q(timestamp__gt=message.timestamp) | Q(timestamp=message.timestamp, id__gt=message.pk)
+                ).count()
+                if newer < row.unread_count:
+                    row.unread_count -= 1
+                    fields.append('unread_count')
+            if fields:
+                row.save(update_fields=fields)
+
+
+def mark_read(owner_id, peer_id):
+    return Conversation.objects.filter(owner_id=owner_id, peer_id=peer_id).update(unread_count=0)
@@ -0,0 +1,365 @@
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('employees.metrics')
+
+
+# Per-request performance metrics
+#
+# InstrumentationMiddleware (HTTP) and track() (WebSocket frames in
+# EmployeesConsumer) put a RequestMetrics object in a context variable for the
+# duration of the request.  While it is set, a database execute wrapper counts
+# and times every query, and TimedSerializerMixin times serializer
+# to_representation() calls (minus any queries they trigger).  When the
+# request finishes the metrics go to every sink in
+# settings.EMPLOYEES_METRICS['SINKS']:
+#
+#   LogSink         one JSON log line per request on the "employees.metrics"
+#                   logger (INFO, or WARNING for slow requests)
+#   PrometheusSink  per-action counters and a latency histogram, served in the
+#                   Prometheus text format by /api/metrics/ (per process)
+#   MemorySink      keeps the last records in memory, for tests
+#
+# Queries and database time are also counted per database alias (primary and
+# read replicas, see employees/replicas.py).
+#
+# Requests slower than SLOW_REQUEST_MS carry their SQL (at most MAX_SQL
+# statements with timings) to the sinks, for SQL_SAMPLE_RATE of them.
+# Outside a tracked request the hooks cost one context variable lookup.
+DEFAULT_OPTIONS = {
+    'SINKS': ['employees.instrumentation.LogSink', 'employees.instrumentation.PrometheusSink'],
+    'SLOW_REQUEST_MS': 500,
+    'SQL_SAMPLE_RATE': 1.0,
+    'MAX_SQL': 50,
+}
+
+_current = ContextVar('employees_request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = (
+        'action', 'method', 'path', 'status', 'started', 'wall_ms', 'queries', 'db_ms',
+        'serializer_ms', 'response_bytes', 'sql', 'serializing', 'aliases',
+    )
+
+    def __init__(self, method, path, action='unresolved'):
+        self.action = action
+        self.method = method
+        self.path = path
+        self.status = None
+        self.started = time.perf_counter()
+        self.wall_ms = None
+        self.queries = 0
+        self.db_ms = 0.0
+        self.serializer_ms = 0.0
+        self.response_bytes = 0
+        self.sql = []
+        self.serializing = False
+        self.aliases = {}  # database alias -> [queries, db ms]
+
+    def as_dict(self, include_sql=False):
+        data = {
+            'action': self.action,
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'wall_ms': round(self.wall_ms, 3),
+            'queries': self.queries,
+            'db_ms': round(self.db_ms, 3),
+            'serializer_ms': round(self.serializer_ms, 3),
+            'response_bytes': self.response_bytes,
+            'db_aliases': {
+                alias: {'queries': queries, 'db_ms': round(db_ms, 3)} for alias, (queries, db_ms) in self.aliases.items()
+            },
+        }
+        if include_sql:
+            data['sql'] = [{'sql': sql, 'ms': round(ms, 3)} for sql, ms in self.sql]
+        return data
+
+
+def current_metrics():
+    return _current.get()
+
+
+@lru_cache(maxsize=None)
+def get_options():
+    return {**DEFAULT_OPTIONS, **getattr(settings, 'EMPLOYEES_METRICS', {})}
+
+
+@lru_cache(maxsize=None)
+def get_sinks():
+    return [import_string(path)() for path in get_options()['SINKS']]
+
+
+@receiver(setting_changed)
+def reset_options(setting, **kwargs):
+    if setting == 'EMPLOYEES_METRICS':
+        get_options.cache_clear()
+        get_sinks.cache_clear()
+
+
+def finish(metrics):
+    metrics.wall_ms = (time.perf_counter() - metrics.started) * 1000
+    options = get_options()
+    include_sql = metrics.wall_ms >= options['SLOW_REQUEST_MS'] and random.random() < options['SQL_SAMPLE_RATE']
+    for sink in get_sinks():
+        try:
+            sink.record(metrics, include_sql)
+        except Exception:
+            logger.exception("Metrics sink %s failed", sink.__class__.__name__)
+
+
+@contextmanager
+def track(action, method='WS', path=''):
+    """Collect metrics for the enclosed block, e.g. one WebSocket frame."""
+    metrics = RequestMetrics(method, path, action)
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+        finish(metrics)
+
+
+# Database hook
+def time_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        metrics.queries += 1
+        metrics.db_ms += elapsed
+        per_alias = metrics.aliases.setdefault(context['connection'].alias, [0, 0.0])
+        per_alias[0] += 1
+        per_alias[1] += elapsed
+        if len(metrics.sql) < get_options()['MAX_SQL']:
+            metrics.sql.append((sql, elapsed))
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # Outermost, so the execute_wrapper() context manager's pop() never removes it
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+# Serializer hook
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        metrics = _current.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)  # Nested serializers count towards their parent
+        metrics.serializing = True
+        started, db_ms = time.perf_counter(), metrics.db_ms
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializing = False
+            metrics.serializer_ms += (time.perf_counter() - started) * 1000 - (metrics.db_ms - db_ms)
+
+
+def timed_serialization():
+    """Count the enclosed block as serializer time, for code that builds representations itself."""
+    metrics = _current.get()
+    if metrics is None or metrics.serializing:
+        return nullcontext()
+    return _timed_serialization(metrics)
+
+
+@contextmanager
+def _timed_serialization(metrics):
+    metrics.serializing = True
+    started, db_ms = time.perf_counter(), metrics.db_ms
+    try:
+        yield
+    finally:
+        metrics.serializing = False
+        metrics.serializer_ms += (time.perf_counter() - started) * 1000 - (metrics.db_ms - db_ms)
+
+
+# HTTP hook
+def view_action(view_func, method):
+    cls = getattr(view_func, 'cls', None)  # DRF views
+    if cls is None:
+        return f'{view_func.__module__}.{getattr(view_func, "__name__", "view")}'
+    actions = getattr(view_func, 'actions', None)  # Viewsets: {'get': 'list', ...}
+    handler = actions.get(method.lower(), method.lower()) if actions else method.lower()
+    return f'{cls.__name__}.{handler}'
+
+
+class InstrumentationMiddleware:
+    # Works in both modes, so it adds no thread hop in front of async views
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics(request.method, request.path)
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.complete(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics(request.method, request.path)
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.complete(request, response, metrics)
+
+    def complete(self, request, response, metrics):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            metrics.action = view_action(match.func, request.method)
+        metrics.status = response.status_code
+        if response.streaming:
+            stream = self.astream if response.is_async else self.stream
+            response.streaming_content = stream(response.streaming_content, metrics)
+        else:
+            metrics.response_bytes = len(response.content)
+            finish(metrics)
+        return response
+
+    @staticmethod
+    def stream(content, metrics):
+        # Streamed bodies (exports) are produced after the view returns; keep
+        # counting their queries and bytes until the last chunk is sent.
+        _current.set(metrics)
+        try:
+            for chunk in content:
+                metrics.response_bytes += len(chunk)
+                yield chunk
+        finally:
+            _current.set(None)
+            finish(metrics)
+
+    @staticmethod
+    async def astream(content, metrics):
+        _current.set(metrics)
+        try:
+            async for chunk in content:
+                metrics.response_bytes += len(chunk)
+                yield chunk
+        finally:
+            _current.set(None)
+            finish(metrics)
+
+
+# Sinks
+class LogSink:
+    def record(self, metrics, include_sql):
+        level = logging.WARNING if metrics.wall_ms >= get_options()['SLOW_REQUEST_MS'] else logging.INFO
+        if logger.isEnabledFor(level):
+            logger.log(level, json.dumps(metrics.as_dict(include_sql)))
+
+
+class MemorySink:
+    records = deque(maxlen=1000)  # Shared by every instance, so tests can read it
+
+    def record(self, metrics, include_sql):
+        self.records.append(metrics.as_dict(include_sql))
+
+
+class PrometheusSink:
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    COUNTERS = (
+        ('employees_requests_total', 'Requests handled', None),
+        ('employees_request_seconds_total', 'Wall time', 'wall_ms'),
+        ('employees_request_db_queries_total', 'Database queries', 'queries'),
+        ('employees_request_db_seconds_total', 'Time spent in the database', 'db_ms'),
+        ('employees_request_serializer_seconds_total', 'Time spent in serializers', 'serializer_ms'),
+        ('employees_response_bytes_total', 'Response body bytes', 'response_bytes'),
+    )
+    ALIAS_COUNTERS = (
+        ('employees_db_alias_queries_total', 'Database queries per database alias'),
+        ('employees_db_alias_seconds_total', 'Time spent in the database per database alias'),
+    )
+    _lock = threading.Lock()
+    _totals = defaultdict(lambda: [0.0] * len(PrometheusSink.COUNTERS))
+    _buckets = defaultdict(lambda: [0] * (len(PrometheusSink.BUCKETS) + 1))
+    _alias_totals = defaultdict(lambda: [0.0, 0.0])  # alias -> [queries, seconds]
+
+    def record(self, metrics, include_sql):
+        labels = (metrics.action, metrics.method, str(metrics.status))
+        seconds = metrics.wall_ms / 1000
+        with self._lock:
+            totals = self._totals[labels]
+            for i, (_, _, attribute) in enumerate(self.COUNTERS):
+                value = 1 if attribute is None else getattr(metrics, attribute)
+                totals[i] += value / 1000 if attribute and attribute.endswith('_ms') else value
+            buckets = self._buckets[labels]
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            buckets[-1] += 1
+            for alias, (queries, db_ms) in metrics.aliases.items():
+                alias_totals = self._alias_totals[alias]
+                alias_totals[0] += queries
+                alias_totals[1] += db_ms / 1000
+
+    @classmethod
+    def render(cls):
+        with cls._lock:
+            totals = {labels: list(values) for labels, values in cls._totals.items()}
+            buckets = {labels: list(values) for labels, values in cls._buckets.items()}
+            alias_totals = {alias: list(values) for alias, values in cls._alias_totals.items()}
+
+        def label_text(labels, **extra):
+            pairs = zip(('action', 'method', 'status'), labels)
+            text = ','.join(f'{key}="{value}"' for key, value in [*pairs, *extra.items()])
+            return '{' + text + '}'
+
+        lines = []
+        for i, (name, help_text, _) in enumerate(cls.COUNTERS):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f'{name}{label_text(labels)} {values[i]:g}' for labels, values in sorted(totals.items())]
+
+        for i, (name, help_text) in enumerate(cls.ALIAS_COUNTERS):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f'{name}{{alias="{alias}"}} {values[i]:g}' for alias, values in sorted(alias_totals.items())]
+
+        name = 'employees_request_duration_seconds'
+        lines += [f'# HELP {name} Request wall time', f'# TYPE {name} histogram']
+        for labels, counts in sorted(buckets.items()):
+            for bound, count in zip(cls.BUCKETS, counts):
+                lines.append(f'{name}_bucket{label_text(labels, le=f"{bound:g}")} {count}')
+            lines.append(f'{name}_bucket{label_text(labels, le="+Inf")} {counts[-1]}')
+            lines.append(f'{name}_sum{label_text(labels)} {totals[labels][1]:g}')
+            lines.append(f'{name}_count{label_text(labels)} {counts[-1]}')
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls._totals.clear()
+            cls._buckets.clear()
+            cls._alias_totals.clear()
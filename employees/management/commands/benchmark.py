@@ -0,0 +1,113 @@
+import json
+from contextlib import contextmanager
+from unittest import mock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from employees.benchmark import compare, run_benchmark
+from employees.renderers import ORJSONRenderer
+
+# Reported by some scenarios only, printed after the common columns
+EXTRA_COLUMNS = ('bytes_per_event', 'events_per_frame', 'cpu_us_per_event')
+
+# The WebSocket scenarios run against in-process backends, and every
+# heartbeat of the presence scenario is written
+BENCHMARK_SETTINGS = {
+    'CHANNEL_LAYERS': {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    'EMPLOYEES_PRESENCE': {'BACKEND': 'employees.presence.MemoryPresence', 'HEARTBEAT_INTERVAL': 0},
+    'EMPLOYEES_EVENT_STREAM': {'BACKEND': 'employees.streams.MemoryEventStream'},
+}
+
+
+@contextmanager
+def serializer_baseline():
+    """List endpoints as they were before values() rows and orjson: serializers and JSONRenderer."""
+    with override_settings(EMPLOYEES_FAST_LISTS=False), mock.patch.object(ORJSONRenderer, 'render', JSONRenderer.render):
+        yield
+
+
+def milliseconds(value, width):
+    return f"{value:>{width}.2f}" if value is not None else f"{'-':>{width}}"
+
+
+class Command(BaseCommand):
+    help = "Benchmark the REST endpoints and the chat consumer against the current database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help="Requests per HTTP scenario")
+        parser.add_argument('--warmup', type=int, default=5, help="Unmeasured requests before each HTTP scenario")
+        parser.add_argument('--scenario', action='append', default=None,
+                            help="Only scenarios whose name starts with this; repeat for several")
+        parser.add_argument('--cold', action='store_true', help="Clear the response cache before every request")
+        parser.add_argument('--chat-clients', type=int, default=10, help="Concurrent chat pairs")
+        parser.add_argument('--chat-messages', type=int, default=20, help="Messages per chat pair")
+        parser.add_argument('--broadcast-recipients', type=int, default=100)
+        parser.add_argument('--asgi-requests', type=int, default=100, help="Requests per asgi:* scenario")
+        parser.add_argument('--asgi-concurrency', type=int, default=10, help="asgi:* requests in flight at once")
+        parser.add_argument('--serializer-baseline', action='store_true',
+                            help="Also run lists:* through the serializers and DRF's JSONRenderer (lists:*:serializer)")
+        parser.add_argument('--output', default=None, help="Write the results as JSON here")
+        parser.add_argument('--baseline', default=None, help="Compare with a results file from an earlier run")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed p95 slowdown against the baseline (0.2 = 20%%)")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        def progress(name, result):
+            self.stdout.write(
+                f"{name:<34} {result['requests']:>6} {milliseconds(result['p50_ms'], 10)} {milliseconds(result['p95_ms'], 10)} "
+                f"{milliseconds(result['p99_ms'], 10)} {result['throughput_rps'] or 0:>10.1f} "
+                f"{milliseconds(result['queries_per_request'], 8)}"
+                + (f"  {result['errors']} errors" if result['errors'] else "")
+                + ''.join(f"  {key}={result[key]}" for key in EXTRA_COLUMNS if key in result)
+            )
+
+        self.stdout.write(f"{'scenario':<34} {'reqs':>6} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'req/s':>10} {'queries':>8}")
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], **BENCHMARK_SETTINGS):
+                current = run_benchmark(
+                    iterations=options['iterations'],
+                    warmup=options['warmup'],
+                    cold=options['cold'],
+                    only=options['scenario'],
+                    chat_clients=options['chat_clients'],
+                    chat_messages=options['chat_messages'],
+                    broadcast_recipients=options['broadcast_recipients'],
+                    asgi_requests=options['asgi_requests'],
+                    asgi_concurrency=options['asgi_concurrency'],
+                    serializer_baseline=serializer_baseline if options['serializer_baseline'] else None,
+                    progress=progress,
+                )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if options['output']:
+            with open(options['output'], 'w') as out:
+                json.dump(current, out, indent=2, sort_keys=True)
+            self.stdout.write(f"Saved results to {options['output']}")
+
+        if not options['baseline']:
+            return
+        try:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read baseline: {exc}")
+
+        rows = compare(current, baseline, options['tolerance'])
+        self.stdout.write(f"\n{'scenario':<34} {'base p95':>10} {'p95':>10} {'change':>8} {'queries':>8}")
+        for name, before, after, change, query_change, regressed in rows:
+            line = f"{name:<34} {before:>10.2f} {after:>10.2f} {change:>+8.1%} {query_change:>+8.2f}"
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+
+        regressions = [row[0] for row in rows if row[-1]]
+        if regressions:
+            message = f"{len(regressions)} scenario(s) regressed: {', '.join(regressions)}"
+            if options['fail_on_regression']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
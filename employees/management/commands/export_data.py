@@ -0,0 +1,50 @@
+import argparse
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from employees.export import DEFAULT_CHUNK_SIZE, EXPORTS, EXPORT_FORMATS, iter_export
+
+
+def date_arg(value):
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise argparse.ArgumentTypeError(f"Invalid date: {value}")
+    return day
+
+
+class Command(BaseCommand):
+    help = "Stream attendance, salary or task history as CSV or JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORTS))
+        parser.add_argument('--output', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--start', type=date_arg, default=None, help="First date to include, YYYY-MM-DD")
+        parser.add_argument('--end', type=date_arg, default=None, help="Last date to include, YYYY-MM-DD")
+        parser.add_argument('--employee', type=int, action='append', default=None,
+                            help="Only this employee id; repeat for several")
+        parser.add_argument('--file', default=None, help="Write here instead of stdout")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        export = EXPORTS[options['dataset']]
+        date_field = export.date_field
+        queryset = export.model.objects.order_by(date_field, 'id')
+        if options['start']:
+            queryset = queryset.filter(**{f'{date_field}__gte': options['start']})
+        if options['end']:
+            queryset = queryset.filter(**{f'{date_field}__lte': options['end']})
+        if options['employee']:
+            queryset = queryset.filter(**{f'{export.employee_field}__in': options['employee']})
+
+        chunks = iter_export(queryset, export.columns, options['output'], options['chunk_size'])
+        if options['file']:
+            with open(options['file'], 'w', newline='', encoding='utf-8') as out:
+                out.writelines(chunks)
+            self.stderr.write(self.style.SUCCESS(f"Wrote {options['dataset']} to {options['file']}"))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from employees.summaries import rebuild_attendance_summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-employee monthly attendance rollups from the attendance table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_attendance_summaries(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} attendance summaries in {elapsed:.2f}s"))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from employees.inbox import record_messages
+from employees.models import Conversation, Message
+
+
+class Command(BaseCommand):
+    help = "Rebuild every conversation summary from the message history (unread counts start at zero)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        batch_size = options['batch_size']
+        count = 0
+        with transaction.atomic():
+            Conversation.objects.all().delete()
+            batch = []
+            messages = Message.objects.only('id', 'sender', 'recipient', 'content', 'timestamp').order_by('id')
+            for message in messages.iterator(chunk_size=batch_size):
+                batch.append(message)
+                if len(batch) >= batch_size:
+                    record_messages(batch, count_unread=False)
+                    count += len(batch)
+                    batch = []
+            record_messages(batch, count_unread=False)
+            count += len(batch)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {Conversation.objects.count()} conversations from {count} messages in {elapsed:.2f}s"
+        ))
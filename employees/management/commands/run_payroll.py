@@ -0,0 +1,50 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from employees.payroll import DEFAULT_CHUNK_SIZE, run_payroll
+
+
+def decimal_arg(value):
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise CommandError(f"Invalid amount: {value}")
+
+
+class Command(BaseCommand):
+    help = "Generate the Salary rows for every active employee for one pay date."
+
+    def add_arguments(self, parser):
+        parser.add_argument('date', help="Pay date, YYYY-MM-DD")
+        parser.add_argument('--basic-salary', type=decimal_arg, default=None,
+                            help="Basic salary for employees with no earlier salary")
+        parser.add_argument('--bonuses', type=decimal_arg, default=Decimal('0'))
+        parser.add_argument('--deductions', type=decimal_arg, default=Decimal('0'))
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            pay_date = parse_date(options['date'])
+        except ValueError:
+            pay_date = None
+        if pay_date is None:
+            raise CommandError("date must be YYYY-MM-DD")
+
+        def progress(processed, total, elapsed):
+            self.stdout.write(f"{processed}/{total} employees processed in {elapsed:.2f}s")
+
+        result = run_payroll(
+            pay_date,
+            basic_salary=options['basic_salary'],
+            bonuses=options['bonuses'],
+            deductions=options['deductions'],
+            chunk_size=options['chunk_size'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} salaries for {pay_date} "
+            f"({result['skipped_existing']} already paid, {result['skipped_no_salary']} without a basic salary) "
+            f"in {result['elapsed_seconds']}s"
+        ))
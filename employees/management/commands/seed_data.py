@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from employees.seed import DEFAULT_BATCH_SIZE, seed
+
+
+class Command(BaseCommand):
+    help = "Bulk-insert synthetic users, attendance, tasks, complaints, salaries and messages."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--days', type=int, default=90, help="Days of attendance history per employee")
+        parser.add_argument('--tasks', type=int, default=20, help="Tasks per employee")
+        parser.add_argument('--complaints', type=int, default=2, help="Complaints per employee")
+        parser.add_argument('--salary-months', type=int, default=12)
+        parser.add_argument('--messages', type=int, default=20000, help="Chat messages in total")
+        parser.add_argument('--prefix', default='seed', help="Username prefix for the new users")
+        parser.add_argument('--password', default='password')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=0, help="Random seed")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = seed(
+            users=options['users'],
+            days=options['days'],
+            tasks=options['tasks'],
+            complaints=options['complaints'],
+            salary_months=options['salary_months'],
+            messages=options['messages'],
+            prefix=options['prefix'],
+            password=options['password'],
+            batch_size=options['batch_size'],
+            seed=options['seed'],
+        )
+        elapsed = time.perf_counter() - started
+        summary = ', '.join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary} in {elapsed:.2f}s"))
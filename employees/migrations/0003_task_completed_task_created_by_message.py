@@ -0,0 +1,78 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+
+
+def backfill_created_by(apps, schema_editor):
+    # Existing tasks are attributed to the first staff user, or to their
+    # assignee when there is none.
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Task = apps.get_model('employees', 'Task')
+    alias = schema_editor.connection.alias
+    staff = User.objects.using(alias).filter(is_staff=True).order_by('pk').first()
+    tasks = Task.objects.using(alias).filter(created_by__isnull=True)
+    tasks.update(created_by=staff if staff is not None else F('assigned_to'))
+    if schema_editor.connection.vendor == 'postgresql':
+        # Check the deferred foreign keys now: PostgreSQL refuses the ALTER
+        # TABLE below while trigger events are pending on the table.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+def create_message_table(apps, schema_editor):
+    # The Message model existed before this migration did, so some databases
+    # already have the table.
+    Message = apps.get_model('employees', 'Message')
+    if Message._meta.db_table not in schema_editor.connection.introspection.table_names():
+        schema_editor.create_model(Message)
+
+
+def drop_message_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('employees', 'Message'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('employees', '0002_alter_task_priority'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='completed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='created_by',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_created_by, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='task',
+            name='created_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='priority',
+            field=models.CharField(choices=[('Low', 'Low'), ('Medium', 'Medium'), ('High', 'High')], default='Medium', max_length=10),
+        ),
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.CreateModel(
+                name='Message',
+                fields=[
+                    ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                    ('content', models.TextField()),
+                    ('timestamp', models.DateTimeField(auto_now_add=True)),
+                    ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_messages', to=settings.AUTH_USER_MODEL)),
+                    ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_messages', to=settings.AUTH_USER_MODEL)),
+                ],
+            ),
+        ]),
+        migrations.RunPython(create_message_table, drop_message_table),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.16 on 2026-10-18 09:54
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def delete_duplicate_salaries(apps, schema_editor):
+    # The unique constraint cannot be added while an employee has two salary
+    # rows for one date.  Keep the most recently written row of each group.
+    Salary = apps.get_model('employees', 'Salary')
+    salaries = Salary.objects.using(schema_editor.connection.alias)
+    duplicates = (
+        salaries.values('employee_id', 'date')
+        .annotate(keep=Max('id'), rows=Count('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for row in duplicates.iterator():
+        salaries.filter(employee_id=row['employee_id'], date=row['date']).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('employees', '0006_attendancesummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_salaries, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='salary',
+            name='salary_employee_date_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='salary',
+            unique_together={('employee', 'date')},
+        ),
+    ]
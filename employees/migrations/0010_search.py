@@ -0,0 +1,81 @@
+from django.db import migrations
+
+# Full-text search indexes (see employees/search.py).  Not model fields, so
+# written by hand per database:
+#
+#   PostgreSQL  a generated search_vector tsvector column and a GIN index on it.
+#               Adding a stored generated column rewrites the table; on a large
+#               employees_message table run this in a maintenance window.
+#   SQLite      an FTS5 external-content table plus insert/update/delete
+#               triggers.  A later migration that rebuilds one of these tables
+#               on SQLite drops its triggers and must recreate them.
+#
+# Other databases get nothing, and searching them raises NotSupportedError.
+TABLES = {
+    'employees_message': (('content', 'A'),),
+    'employees_task': (('title', 'A'), ('description', 'B')),
+    'employees_complaint': (('subject', 'A'), ('description', 'B')),
+}
+
+
+def postgres_sql(table, fields):
+    vector = ' || '.join(
+        f"setweight(to_tsvector('english', coalesce({field}, '')), '{weight}')" for field, weight in fields
+    )
+    return [
+        f'ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({vector}) STORED',
+        f'CREATE INDEX {table}_search_idx ON {table} USING gin (search_vector)',
+    ]
+
+
+def sqlite_sql(table, fields):
+    fts = f'{table}_fts'
+    columns = ', '.join(field for field, _ in fields)
+    new = ', '.join(f'new.{field}' for field, _ in fields)
+    old = ', '.join(f'old.{field}' for field, _ in fields)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='{table}', content_rowid='id')",
+        f'CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN '
+        f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new}); END',
+        f'CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old}); END",
+        f'CREATE TRIGGER {fts}_update AFTER UPDATE ON {table} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old}); "
+        f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new}); END',
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",  # Index the existing rows
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, fields in TABLES.items():
+        if vendor == 'postgresql':
+            statements = postgres_sql(table, fields)
+        elif vendor == 'sqlite':
+            statements = sqlite_sql(table, fields)
+        else:
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table in TABLES:
+        if vendor == 'postgresql':
+            schema_editor.execute(f'ALTER TABLE {table} DROP COLUMN search_vector')  # Drops the index too
+        elif vendor == 'sqlite':
+            for suffix in ('insert', 'delete', 'update'):
+                schema_editor.execute(f'DROP TRIGGER {table}_fts_{suffix}')
+            schema_editor.execute(f'DROP TABLE {table}_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0009_conversation'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
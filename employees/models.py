@@ -4,9 +4,28 @@ from django.contrib.auth.models import User
 from datetime import date
 #
 
+
+class LoadedValuesMixin:
+    """Remember the values of ``tracked_fields`` a row was loaded with.
+
+    Saves compare against them (employees/events.py) instead of querying the
+    stored row again.  Rows built in memory have none.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in cls.tracked_fields
+        }
+        return instance
+
+
 #####
 # Complaints
-class Complaint(models.Model):
+class Complaint(LoadedValuesMixin, models.Model):
+    tracked_fields = ('status', 'employee_id')
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
         ('Resolved', 'Resolved'),
@@ -18,6 +37,13 @@ class Complaint(models.Model):
     description = models.TextField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-created_at'], name='complaint_status_created_idx'),
+            models.Index(fields=['-created_at', '-id'], name='complaint_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.employee.username} - {self.subject}"
@@ -36,13 +62,36 @@ class Attendance(models.Model):
 
     class Meta:
         unique_together = ['employee', 'date']  # Prevent duplicate entries for the same day
+        indexes = [
+            # (employee, date) is already covered by the unique constraint.
+            models.Index(fields=['-date', 'status'], name='attendance_date_status_idx'),
+        ]
 
     def __str__(self):
         return f"{self.employee.username} - {self.date} - {self.status}"
 
 
+# Attendance rollups: one row per employee per month, kept in step with
+# Attendance by the API (see employees/summaries.py).
+class AttendanceSummary(models.Model):
+    employee = models.ForeignKey(User, related_name='attendance_summaries', on_delete=models.CASCADE)
+    month = models.DateField()  # First day of the month
+    present_days = models.PositiveIntegerField(default=0)
+    absent_days = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['employee', 'month']
+        indexes = [
+            models.Index(fields=['month'], name='attendance_summary_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.employee_id} - {self.month:%Y-%m}: {self.present_days} present, {self.absent_days} absent"
+
+
 # Tasks
-class Task(models.Model):
+class Task(LoadedValuesMixin, models.Model):
+    tracked_fields = ('status', 'assigned_to_id')
     STATUS_CHOICES = [
         ('Pending', 'Pending'),
         ('In Progress', 'In Progress'),
@@ -71,6 +120,15 @@ class Task(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, null=False)
     completed = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['assigned_to', 'due_date'], name='task_assignee_due_idx'),
+            models.Index(fields=['status', 'priority'], name='task_status_priority_idx'),
+            models.Index(fields=['due_date'], name='task_due_date_idx'),
+            models.Index(fields=['-created_at', '-id'], name='task_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.title} - {self.assigned_to.username}"
 
@@ -82,10 +140,39 @@ class Message(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Composite keys used by keyset pagination on (timestamp, id): one per
+        # side of the inbox query and one for a single conversation.
+        indexes = [
+            models.Index(fields=['sender', 'recipient', '-timestamp', '-id'], name='message_conversation_idx'),
+            models.Index(fields=['sender', '-timestamp', '-id'], name='message_sender_ts_idx'),
+            models.Index(fields=['recipient', '-timestamp', '-id'], name='message_recipient_ts_idx'),
+        ]
+
     def __str__(self):
         return f"{self.sender} to {self.recipient}: {self.content}"
 
 
+# Conversations: one row per (owner, peer) summarising their messages, kept
+# up to date whenever messages are stored (see employees/inbox.py).
+class Conversation(models.Model):
+    owner = models.ForeignKey(User, related_name='conversations', on_delete=models.CASCADE)
+    peer = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    last_message = models.ForeignKey(Message, related_name='+', null=True, on_delete=models.SET_NULL)
+    last_timestamp = models.DateTimeField()
+    last_preview = models.CharField(max_length=255, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['owner', 'peer']
+        indexes = [
+            models.Index(fields=['owner', '-last_timestamp', '-id'], name='conversation_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id} with {self.peer_id}: {self.unread_count} unread"
+
+
 # Salary
 class Salary(models.Model):
     employee = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -95,6 +182,13 @@ class Salary(models.Model):
     net_salary = models.DecimalField(max_digits=10, decimal_places=2, editable=False)
     date = models.DateField()
 
+    class Meta:
+        unique_together = ['employee', 'date']  # One salary row per employee per pay date
+        indexes = [
+            # (employee, date) lookups use the unique constraint's index.
+            models.Index(fields=['-date'], name='salary_date_idx'),
+        ]
+
     def __str__(self):
         return f"Salary for {self.employee.username} on {self.date}"
 
@@ -0,0 +1,259 @@
+import base64
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# Keyset (cursor) pagination on (timestamp, id)
+#
+# Pages are fetched with a range predicate on the composite key instead of an
+# OFFSET, so every page is an index range scan and costs the same no matter how
+# deep into the history the client is.  Pagination is opt-in: requests without
+# any of the query parameters below keep getting the full, unpaginated list.
+#
+# The page query fetches one extra row to know whether there is another page
+# in the walking direction.  A page reached through a cursor also probes one
+# row past its other end, so both links are exact.
+def encode_cursor(timestamp, pk):
+    raw = f"{timestamp.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, pk = raw.rsplit('|', 1)
+        timestamp = parse_datetime(timestamp)
+        pk = int(pk)
+    except (ValueError, TypeError, UnicodeError):
+        raise NotFound('Invalid cursor.')
+    if timestamp is None:
+        raise NotFound('Invalid cursor.')
+    return timestamp, pk
+
+
+def keyset_filter(queryset, field, before=None, after=None):
+    # Newest first: "before" walks towards older rows, "after" towards newer ones.
+    if before is not None:
+        timestamp, pk = before
+        queryset = queryset.filter(
+            Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk})
+        ).order_by(f'-{field}', '-id')
+    elif after is not None:
+        timestamp, pk = after
+        queryset = queryset.filter(
+            Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'id__gt': pk})
+        ).order_by(field, 'id')
+    else:
+        queryset = queryset.order_by(f'-{field}', '-id')
+    return queryset
+
+
+class KeysetPagination(BasePagination):
+    timestamp_field = 'timestamp'
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'limit'
+    before_query_param = 'before'
+    after_query_param = 'after'
+
+    def is_requested(self, request):
+        params = request.query_params
+        return any(
+            param in params
+            for param in (self.page_size_query_param, self.before_query_param, self.after_query_param)
+        )
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self.get_page_queryset(queryset, request)
+        if page is None:
+            return None
+        rows = self.set_page(list(page))
+        probe = self.get_probe_queryset(queryset)
+        self.set_has_behind(probe is not None and probe.exists())
+        return rows
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page = self.get_page_queryset(queryset, request)
+        if page is None:
+            return None
+        rows = self.set_page([row async for row in page])
+        probe = self.get_probe_queryset(queryset)
+        self.set_has_behind(probe is not None and await probe.aexists())
+        return rows
+
+    def get_page_queryset(self, queryset, request):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        before = request.query_params.get(self.before_query_param)
+        after = request.query_params.get(self.after_query_param)
+        self.before = decode_cursor(before) if before else None
+        self.after = decode_cursor(after) if after and self.before is None else None
+        self.walking_forward = self.after is not None
+
+        queryset = keyset_filter(queryset, self.timestamp_field, before=self.before, after=self.after)
+
+        # Fetch one extra row to know whether another page exists in that direction.
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.walking_forward:
+            rows.reverse()
+
+        self.page = rows
+        self.has_older = has_more if not self.walking_forward else False
+        self.has_newer = has_more if self.walking_forward else False
+        return rows
+
+    def get_probe_queryset(self, queryset):
+        # Rows past the end of the page the client came from; the first page
+        # (no cursor) has nothing newer and an empty page shows no links.
+        if not self.page or (self.before is None and self.after is None):
+            return None
+        if self.walking_forward:
+            return keyset_filter(queryset, self.timestamp_field, before=self.key_for(self.page[-1]))
+        return keyset_filter(queryset, self.timestamp_field, after=self.key_for(self.page[0]))
+
+    def set_has_behind(self, exists):
+        if self.walking_forward:
+            self.has_older = exists
+        else:
+            self.has_newer = exists
+
+    def key_for(self, obj):
+        if isinstance(obj, dict):  # values() rows (employees/rows.py)
+            return obj[self.timestamp_field], obj['id']
+        return getattr(obj, self.timestamp_field), obj.pk
+
+    def cursor_for(self, obj):
+        return encode_cursor(*self.key_for(obj))
+
+    def get_older_link(self):
+        if not self.page or not self.has_older:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.after_query_param)
+        return replace_query_param(url, self.before_query_param, self.cursor_for(self.page[-1]))
+
+    def get_newer_link(self):
+        if not self.page or not self.has_newer:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.before_query_param)
+        return replace_query_param(url, self.after_query_param, self.cursor_for(self.page[0]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_older_link()),
+            ('previous', self.get_newer_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ConversationPagination(KeysetPagination):
+    # The inbox is always paginated, newest conversation first.
+    timestamp_field = 'last_timestamp'
+    page_size = 30
+
+    def is_requested(self, request):
+        return True
+
+
+# Limit/offset pagination for the admin tables
+#
+# Also opt-in: without ?limit= or ?offset= the endpoint returns the full list
+# exactly as before, so existing clients keep working.
+class OptionalLimitOffsetPagination(LimitOffsetPagination):
+    default_limit = 50
+    max_limit = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.limit_query_param not in params and self.offset_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    # Same as paginate_queryset(), for the async views
+    async def apaginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.limit_query_param not in params and self.offset_query_param not in params:
+            return None
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.count = await queryset.acount()
+        self.offset = self.get_offset(request)
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return [row async for row in queryset[self.offset:self.offset + self.limit]]
+
+
+# Ranked search results (employees/search.py)
+#
+# Always paginated, and without a COUNT(*): counting every match of a common
+# word costs more than ranking one page.  One extra row is fetched to know
+# whether a next page exists.
+class SearchPagination(LimitOffsetPagination):
+    default_limit = 20
+    max_limit = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = replace_query_param(self.request.build_absolute_uri(), self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
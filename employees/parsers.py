@@ -0,0 +1,24 @@
+import io
+
+import orjson
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+
+# orjson parsing
+#
+# ORJSONParser reads UTF-8 request bodies with orjson.  Bodies orjson
+# rejects (and other encodings) go through DRF's JSONParser, so requests that
+# parsed before still parse to the same data and malformed ones fail with the
+# same ParseError.
+class ORJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # Also what orjson is stricter about: lone surrogates, integers wider than 64 bits
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -0,0 +1,315 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from functools import lru_cache
+
+import redis.asyncio as redis
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+# Presence
+#
+# Who is online, kept out of the database.  EmployeesConsumer reports socket
+# connects and disconnects, and clients send {"type": "heartbeat", "state":
+# "online" | "away"} every HEARTBEAT_INTERVAL seconds.  A user is
+#
+#   online   a socket of theirs is open and heartbeated within OFFLINE_AFTER
+#   away     the same, but the last heartbeat said "away"
+#   offline  otherwise, including when a server process died with their
+#            sockets open (their heartbeats simply stop)
+#
+# RedisPresence stores three keys for the whole deployment: a sorted set of
+# user id -> last heartbeat, a hash of user id -> open sockets and a set of
+# away user ids, so 100k connected users take a few MB and every operation,
+# including a bulk status lookup, is one Lua script round trip.  MemoryPresence
+# keeps the same in process, for tests and single-process deployments.
+#
+# State changes are published by PresenceNotifier: each process collects them
+# for DEBOUNCE seconds, drops users that ended the window in the state they
+# started it in (a reconnect), and sends one "presence_update" to the
+# "presence_<id>" group of every user that did change.  Subscribed consumers
+# batch those into one frame per PUSH_DELAY.
+DEFAULT_OPTIONS = {
+    'BACKEND': 'employees.presence.RedisPresence',
+    'LOCATION': 'redis://127.0.0.1:6379/2',
+    'KEY_PREFIX': 'presence',
+    'HEARTBEAT_INTERVAL': 30,
+    'OFFLINE_AFTER': 75,
+    'DEBOUNCE': 1.0,
+    'PUSH_DELAY': 0.05,
+    'MAX_SUBSCRIPTIONS': 1000,
+}
+
+ONLINE, AWAY, OFFLINE = 'online', 'away', 'offline'
+STATES = (ONLINE, AWAY)  # What a heartbeat may report
+
+
+def presence_group(user_id):
+    return f'presence_{user_id}'
+
+
+@lru_cache(maxsize=None)
+def get_options():
+    return {**DEFAULT_OPTIONS, **getattr(settings, 'EMPLOYEES_PRESENCE', {})}
+
+
+@lru_cache(maxsize=None)
+def get_presence():
+    options = get_options()
+    return import_string(options['BACKEND'])(options)
+
+
+@receiver(setting_changed)
+def reset_presence(setting, **kwargs):
+    if setting == 'EMPLOYEES_PRESENCE':
+        get_options.cache_clear()
+        get_presence.cache_clear()
+
+
+# Backends
+#
+# connect(), disconnect() and heartbeat() return the user's (old, new) state;
+# statuses() maps each requested id to its state and present() maps every user
+# who is not offline.
+_STATUS_LUA = """
+local function status(uid, cutoff)
+    local sockets = tonumber(redis.call('HGET', KEYS[2], uid) or '0')
+    local seen = tonumber(redis.call('ZSCORE', KEYS[1], uid) or '0')
+    if sockets <= 0 or seen < cutoff then return 'offline' end
+    if redis.call('SISMEMBER', KEYS[3], uid) == 1 then return 'away' end
+    return 'online'
+end
+"""
+
+# ARGV: user id, now, cutoff.  A user who was offline starts counting sockets
+# afresh, which discards counts left behind by dead processes.
+_CONNECT_LUA = _STATUS_LUA + """
+local old = status(ARGV[1], tonumber(ARGV[3]))
+if old == 'offline' then
+    redis.call('HSET', KEYS[2], ARGV[1], 1)
+else
+    redis.call('HINCRBY', KEYS[2], ARGV[1], 1)
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('SREM', KEYS[3], ARGV[1])
+return {old, status(ARGV[1], tonumber(ARGV[3]))}
+"""
+
+_DISCONNECT_LUA = _STATUS_LUA + """
+local old = status(ARGV[1], tonumber(ARGV[3]))
+if redis.call('HINCRBY', KEYS[2], ARGV[1], -1) <= 0 then
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('SREM', KEYS[3], ARGV[1])
+end
+return {old, status(ARGV[1], tonumber(ARGV[3]))}
+"""
+
+# ARGV: user id, now, cutoff, "away" or "online"
+_HEARTBEAT_LUA = _STATUS_LUA + """
+local old = status(ARGV[1], tonumber(ARGV[3]))
+if tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0') <= 0 then
+    redis.call('HSET', KEYS[2], ARGV[1], 1)
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+if ARGV[4] == 'away' then
+    redis.call('SADD', KEYS[3], ARGV[1])
+else
+    redis.call('SREM', KEYS[3], ARGV[1])
+end
+return {old, status(ARGV[1], tonumber(ARGV[3]))}
+"""
+
+# ARGV: cutoff, user ids...
+_STATUSES_LUA = _STATUS_LUA + """
+local result = {}
+for i = 2, #ARGV do
+    result[i - 1] = status(ARGV[i], tonumber(ARGV[1]))
+end
+return result
+"""
+
+# ARGV: cutoff.  Only users seen since the cutoff can be present.
+_PRESENT_LUA = _STATUS_LUA + """
+local result = {}
+for _, uid in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], '+inf')) do
+    local state = status(uid, tonumber(ARGV[1]))
+    if state ~= 'offline' then
+        table.insert(result, uid)
+        table.insert(result, state)
+    end
+end
+return result
+"""
+
+
+class RedisPresence:
+    def __init__(self, options):
+        self.location = options['LOCATION']
+        self.offline_after = options['OFFLINE_AFTER']
+        prefix = options['KEY_PREFIX']
+        # One hash tag, so Redis Cluster keeps the three keys in one slot
+        self.keys = [f'{{{prefix}}}:seen', f'{{{prefix}}}:sockets', f'{{{prefix}}}:away']
+        self._clients = weakref.WeakKeyDictionary()  # event loop -> (client, scripts)
+
+    def _connection(self):
+        # redis.asyncio connections belong to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(loop)
+        if entry is None:
+            client = redis.Redis.from_url(self.location, decode_responses=True)
+            scripts = {
+                name: client.register_script(source) for name, source in (
+                    ('connect', _CONNECT_LUA), ('disconnect', _DISCONNECT_LUA), ('heartbeat', _HEARTBEAT_LUA),
+                    ('statuses', _STATUSES_LUA), ('present', _PRESENT_LUA),
+                )
+            }
+            entry = self._clients[loop] = (client, scripts)
+        return entry
+
+    async def _transition(self, script, user_id, *args):
+        now = time.time()
+        old, new = await self._connection()[1][script](keys=self.keys, args=[user_id, now, now - self.offline_after, *args])
+        return old, new
+
+    async def connect(self, user_id):
+        return await self._transition('connect', user_id)
+
+    async def disconnect(self, user_id):
+        return await self._transition('disconnect', user_id)
+
+    async def heartbeat(self, user_id, state=ONLINE):
+        return await self._transition('heartbeat', user_id, state)
+
+    async def statuses(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        states = await self._connection()[1]['statuses'](keys=self.keys, args=[time.time() - self.offline_after, *user_ids])
+        return dict(zip(user_ids, states))
+
+    async def present(self):
+        flat = await self._connection()[1]['present'](keys=self.keys, args=[time.time() - self.offline_after])
+        return {int(uid): state for uid, state in zip(flat[::2], flat[1::2])}
+
+    async def clear(self):
+        await self._connection()[0].delete(*self.keys)
+
+
+class MemoryPresence:
+    def __init__(self, options):
+        self.offline_after = options['OFFLINE_AFTER']
+        self._seen = {}  # user id -> last heartbeat
+        self._sockets = {}  # user id -> open sockets
+        self._away = set()
+        self._lock = threading.Lock()  # Views may call in from other threads' event loops
+
+    def _status(self, user_id, cutoff):
+        if self._sockets.get(user_id, 0) <= 0 or self._seen.get(user_id, 0) < cutoff:
+            return OFFLINE
+        return AWAY if user_id in self._away else ONLINE
+
+    async def connect(self, user_id):
+        now = time.time()
+        cutoff = now - self.offline_after
+        with self._lock:
+            old = self._status(user_id, cutoff)
+            self._sockets[user_id] = 1 if old == OFFLINE else self._sockets[user_id] + 1
+            self._seen[user_id] = now
+            self._away.discard(user_id)
+            return old, self._status(user_id, cutoff)
+
+    async def disconnect(self, user_id):
+        cutoff = time.time() - self.offline_after
+        with self._lock:
+            old = self._status(user_id, cutoff)
+            self._sockets[user_id] = self._sockets.get(user_id, 0) - 1
+            if self._sockets[user_id] <= 0:
+                del self._sockets[user_id]
+                self._seen.pop(user_id, None)
+                self._away.discard(user_id)
+            return old, self._status(user_id, cutoff)
+
+    async def heartbeat(self, user_id, state=ONLINE):
+        now = time.time()
+        cutoff = now - self.offline_after
+        with self._lock:
+            old = self._status(user_id, cutoff)
+            if self._sockets.get(user_id, 0) <= 0:
+                self._sockets[user_id] = 1
+            self._seen[user_id] = now
+            if state == AWAY:
+                self._away.add(user_id)
+            else:
+                self._away.discard(user_id)
+            return old, self._status(user_id, cutoff)
+
+    async def statuses(self, user_ids):
+        cutoff = time.time() - self.offline_after
+        with self._lock:
+            return {user_id: self._status(user_id, cutoff) for user_id in user_ids}
+
+    async def present(self):
+        cutoff = time.time() - self.offline_after
+        with self._lock:
+            states = {user_id: self._status(user_id, cutoff) for user_id in self._seen}
+        return {user_id: state for user_id, state in states.items() if state != OFFLINE}
+
+    async def clear(self):
+        with self._lock:
+            self._seen.clear()
+            self._sockets.clear()
+            self._away.clear()
+
+
+# Notifications
+class PresenceNotifier:
+    def __init__(self):
+        self._pending = {}  # user id -> (state before the window, latest state)
+        self._loop = None
+        self._task = None
+        self.sent = 0
+
+    def changed(self, user_id, old, new):
+        if old == new:
+            return
+        first = self._pending[user_id][0] if user_id in self._pending else old
+        self._pending[user_id] = (first, new)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._task = loop.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(get_options()['DEBOUNCE'])
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Presence update failed")
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        sends = [
+            (presence_group(user_id), {'type': 'presence_update', 'users': [[user_id, new]]})
+            for user_id, (old, new) in pending.items() if old != new
+        ]
+        if not sends:
+            return
+        channel_layer = get_channel_layer()
+        concurrency = getattr(settings, 'EMPLOYEES_FAN_OUT_CONCURRENCY', 500)
+        for start in range(0, len(sends), concurrency):
+            await asyncio.gather(*(
+                channel_layer.group_send(group, event) for group, event in sends[start:start + concurrency]
+            ))
+        self.sent += len(sends)
+
+
+presence_notifier = PresenceNotifier()
@@ -0,0 +1,80 @@
+from functools import lru_cache
+
+import msgpack
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+# WebSocket wire protocols
+#
+# JSON text frames, one per event, are the default.  A client that offers the
+# "employees.msgpack" subprotocol (new WebSocket(url, ['employees.msgpack']),
+# alongside ['jwt', <token>] if it authenticates that way) gets MessagePack
+# binary frames instead.  Each frame is an array of every event queued within
+# BATCH_DELAY seconds, at most BATCH_MAX of them.  Every event is a map with
+# the short keys below and always has a "t" (type): chat messages are "chat"
+# and errors "error".  Nested payloads (a task's "d" data, presence "u" users)
+# keep their JSON keys, and presence user ids stay integers.
+#
+# Clients may send frames as JSON text or as MessagePack maps with the JSON keys.
+MSGPACK_SUBPROTOCOL = 'employees.msgpack'
+DEFAULT_OPTIONS = {
+    'BATCH_DELAY': 0.005,
+    'BATCH_MAX': 100,
+}
+
+SHORT_KEYS = {
+    'sender': 's',
+    'recipient': 'r',
+    'message': 'm',
+    'timestamp': 'ts',
+    'seq': 'q',
+    'epoch': 'ep',
+    'entity': 'en',
+    'event': 'ev',
+    'previous_status': 'ps',
+    'data': 'd',
+    'users': 'u',
+    'error': 'err',
+    'recipients': 'n',
+    'missing': 'x',
+    'inactive': 'ia',
+    'replayed': 'rp',
+}
+
+
+@lru_cache(maxsize=None)
+def get_options():
+    return {**DEFAULT_OPTIONS, **getattr(settings, 'EMPLOYEES_WS_MSGPACK', {})}
+
+
+@receiver(setting_changed)
+def reset_options(setting, **kwargs):
+    if setting == 'EMPLOYEES_WS_MSGPACK':
+        get_options.cache_clear()
+
+
+def negotiate(scope):
+    """The binary subprotocol if the client offered it, else None (JSON)."""
+    return MSGPACK_SUBPROTOCOL if MSGPACK_SUBPROTOCOL in (scope.get('subprotocols') or []) else None
+
+
+def compact(frame):
+    packed = {'t': frame.get('type') or ('error' if 'error' in frame else 'chat')}
+    for key, value in frame.items():
+        if key != 'type':
+            packed[SHORT_KEYS.get(key, key)] = value
+    return packed
+
+
+def pack(frames):
+    return msgpack.packb(frames)
+
+
+def unpack(data):
+    """A client frame, or None if it is not valid MessagePack."""
+    try:
+        return msgpack.unpackb(data, strict_map_key=False)
+    except (msgpack.UnpackException, ValueError):
+        return None
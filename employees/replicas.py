@@ -0,0 +1,280 @@
+import logging
+import random
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import CachedJWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+
+# Read replicas
+#
+# PrimaryReplicaRouter sends writes to PRIMARY and reads to one of REPLICAS,
+# but only inside an HTTP request (ReplicaRoutingMiddleware) or a WebSocket
+# frame (routed()) that may use them.  Within one of those, reads go to the
+# primary when
+#
+#   - the request is unsafe (POST, PUT, PATCH, DELETE), so the get_object()
+#     lookup an update or delete starts with sees the row it will change
+#   - the request or frame has already written
+#   - the user wrote in the last PIN_SECONDS: every write pins its user to the
+#     primary in the CACHE cache, which all processes must share, so they read
+#     their own writes whichever process serves them
+#   - they follow a relation from a row that was loaded from the primary
+#
+# primary() sends the reads inside it to the primary too; the response cache
+# builds every payload it stores that way, since other users will be served it
+# for the whole cache TTL.
+#
+# Reads anywhere else (management commands, the task/complaint event
+# publisher, write-behind, async views' own threads outside a request) use
+# the primary, since nothing there says how stale a replica may be.  A
+# request picks one replica at random and keeps it.  With no REPLICAS the
+# middleware does nothing and the router always answers PRIMARY.
+#
+# PIN_SECONDS must exceed the replicas' usual replication lag.  WebSocket
+# frames do not look pins up; their reads are user lookups that do not depend
+# on the user's own writes.
+DEFAULT_OPTIONS = {
+    'PRIMARY': 'default',
+    'REPLICAS': [],
+    'PIN_SECONDS': 5,
+    'CACHE': 'default',
+}
+
+_route = ContextVar('employees_db_route', default=None)
+_jwt = CachedJWTAuthentication()
+
+
+@lru_cache(maxsize=None)
+def get_options():
+    return {**DEFAULT_OPTIONS, **getattr(settings, 'EMPLOYEES_REPLICAS', {})}
+
+
+@receiver(setting_changed)
+def reset_options(setting, **kwargs):
+    if setting == 'EMPLOYEES_REPLICAS':
+        get_options.cache_clear()
+
+
+class Route:
+    """Where the current request's reads go; replica None means the primary."""
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+def pick_replica():
+    replicas = get_options()['REPLICAS']
+    return random.choice(replicas) if replicas else None
+
+
+# Pins
+def pin_key(user_id):
+    return f'employees:db-pin:{user_id}'
+
+
+def pin(user_id):
+    options = get_options()
+    try:
+        caches[options['CACHE']].set(pin_key(user_id), 1, options['PIN_SECONDS'])
+    except Exception:
+        logger.exception("Pinning user %s to the primary failed", user_id)
+
+
+async def apin(user_id):
+    options = get_options()
+    try:
+        await caches[options['CACHE']].aset(pin_key(user_id), 1, options['PIN_SECONDS'])
+    except Exception:
+        logger.exception("Pinning user %s to the primary failed", user_id)
+
+
+def is_pinned(user_id):
+    try:
+        return caches[get_options()['CACHE']].get(pin_key(user_id)) is not None
+    except Exception:
+        logger.exception("Reading the primary pin of user %s failed", user_id)
+        return True  # Cannot tell, so do not risk stale reads
+
+
+async def ais_pinned(user_id):
+    try:
+        return await caches[get_options()['CACHE']].aget(pin_key(user_id)) is not None
+    except Exception:
+        logger.exception("Reading the primary pin of user %s failed", user_id)
+        return True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        primary = get_options()['PRIMARY']
+        route = _route.get()
+        if route is None or route.replica is None or route.wrote:
+            return primary
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == primary:
+            return primary
+        return route.replica
+
+    def db_for_write(self, model, **hints):
+        route = _route.get()
+        if route is not None:
+            route.wrote = True
+        return get_options()['PRIMARY']
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The primary and its replicas hold the same rows
+        options = get_options()
+        aliases = {options['PRIMARY'], *options['REPLICAS']}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside the block."""
+    outer = _route.get()
+    route = Route(None)
+    token = _route.set(route)
+    try:
+        yield
+    finally:
+        _route.reset(token)
+        if route.wrote and outer is not None:
+            outer.wrote = True
+
+
+# WebSocket frames
+@asynccontextmanager
+async def routed(user_id):
+    """Route the enclosed frame's reads to a replica until it writes; pin user_id if it did."""
+    route = Route(pick_replica())
+    token = _route.set(route)
+    try:
+        yield route
+    finally:
+        _route.reset(token)
+        if route.wrote and route.replica is not None:
+            await apin(user_id)
+
+
+# HTTP requests
+def token_user_id(request):
+    """User id from the request's JWT without touching the database, or None."""
+    header = _jwt.get_header(request)
+    raw_token = _jwt.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    cached = _jwt.get_cached(raw_token)
+    if cached is not None:
+        return cached[0].id
+    try:
+        return AccessToken(raw_token)[jwt_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None  # The view rejects it
+
+
+def session_user_id(request):
+    # Loads the session user before routing starts, so from the primary
+    user = getattr(request, 'user', None)
+    return user.id if user is not None and user.is_authenticated else None
+
+
+class ReplicaRoutingMiddleware:
+    # Works in both modes, so it adds no thread hop in front of async views
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not get_options()['REPLICAS']:
+            return self.get_response(request)
+        replica = None
+        if request.method in SAFE_METHODS:
+            user_id = token_user_id(request) or session_user_id(request)
+            replica = None if user_id is not None and is_pinned(user_id) else pick_replica()
+        route = Route(replica)
+        token = _route.set(route)
+        try:
+            response = self.get_response(request)
+        finally:
+            _route.reset(token)
+        return self.complete(request, response, route)
+
+    async def __acall__(self, request):
+        if not get_options()['REPLICAS']:
+            return await self.get_response(request)
+        replica = None
+        if request.method in SAFE_METHODS:
+            # Async views authenticate by JWT only; session users are not looked up here
+            user_id = token_user_id(request)
+            replica = None if user_id is not None and await ais_pinned(user_id) else pick_replica()
+        route = Route(replica)
+        token = _route.set(route)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _route.reset(token)
+        if response.streaming:
+            self.route_stream(response, route)
+        if route.wrote:
+            user_id = token_user_id(request)
+            if user_id is not None:
+                await apin(user_id)
+        return response
+
+    def complete(self, request, response, route):
+        if response.streaming:
+            self.route_stream(response, route)
+        if route.wrote:
+            # DRF has replaced request.user with the authenticated user by now
+            user_id = session_user_id(request) or token_user_id(request)
+            if user_id is not None:
+                pin(user_id)
+        return response
+
+    def route_stream(self, response, route):
+        # Streamed bodies (exports) run their queries after the view returns
+        stream = self.astream if response.is_async else self.stream
+        response.streaming_content = stream(response.streaming_content, route)
+
+    @staticmethod
+    def stream(content, route):
+        # Set rather than reset: under ASGI each chunk may run in a different context
+        _route.set(route)
+        try:
+            yield from content
+        finally:
+            _route.set(None)
+
+    @staticmethod
+    async def astream(content, route):
+        _route.set(route)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            _route.set(None)
@@ -0,0 +1,158 @@
+from functools import cached_property
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from rest_framework.response import Response
+
+from .instrumentation import timed_serialization
+
+
+# Serializer-free list rows
+#
+# ValuesRows stands in for a ModelSerializer on list endpoints: rows are read
+# with values() (no model instances, one column per field) and turned into
+# the serializer's exact representation through a plan worked out once from
+# the serializer's fields: output key, values() lookup and, only where the
+# value from the database is not already what the field would return, that
+# field's own to_representation().  Integer, string, choice, boolean and
+# primary-key fields are copied as they are; dates, datetimes and decimals go
+# through their DRF field, so formats and settings are the serializer's.
+# ISO 8601 datetimes are the exception: DateTimeField looks the current
+# timezone up for every value, so they are converted here, with the timezone
+# looked up once per list.
+#
+# Fields with no column of their own (SerializerMethodField,
+# StringRelatedField) are declared by hand:
+#
+#   sources   {field: values() lookup}, for a related column read as is
+#   computed  {field: ((lookups, ...), function)}, function gets the values
+#
+# ValuesListMixin serves a ViewSet's list() (and list-like actions that call
+# list_response()) this way when `values_rows` is set and
+# settings.EMPLOYEES_FAST_LISTS is not False, after the ViewSet's own
+# filtering, ordering and pagination.  Retrieves and writes keep the serializer.
+IDENTITY_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.BooleanField,
+    serializers.ReadOnlyField, serializers.PrimaryKeyRelatedField,
+)
+UNDECLARED_FIELDS = (serializers.SerializerMethodField, serializers.RelatedField, serializers.BaseSerializer)
+
+
+def fast_lists_enabled():
+    return getattr(settings, 'EMPLOYEES_FAST_LISTS', True)
+
+
+class DateTimeConverter:
+    """DateTimeField.to_representation for ISO 8601 output, for one timezone at a time."""
+
+    def __init__(self, field):
+        self.field = field
+
+    def bind(self, tz):
+        to_representation = self.field.to_representation
+
+        def convert(value):
+            if tz is None or value.utcoffset() is None:
+                return to_representation(value)
+            value = value.astimezone(tz).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+
+
+def converter(field):
+    """None if values() already returns what `field` would, else its to_representation."""
+    if isinstance(field, IDENTITY_FIELDS):
+        return None
+    if isinstance(field, serializers.DateTimeField) and not hasattr(field, 'timezone'):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if output_format is not None and output_format.lower() == ISO_8601:
+            return DateTimeConverter(field)
+    if isinstance(field, serializers.ChoiceField) and all(isinstance(key, str) for key in field.choices):
+        return None
+    return field.to_representation
+
+
+def computed_value(lookups, function):
+    return lambda row: function(*[row[lookup] for lookup in lookups])
+
+
+class ValuesRows:
+    def __init__(self, serializer_class, sources=None, computed=None):
+        self.serializer_class = serializer_class
+        self.sources = sources or {}
+        self.computed = computed or {}
+
+    @cached_property
+    def plan(self):
+        # [(key, lookup, converter)], or (key, None, function of the row) for computed fields
+        plan = []
+        for field in self.serializer_class().fields.values():
+            if field.write_only:
+                continue
+            name = field.field_name
+            if name in self.computed:
+                plan.append((name, None, computed_value(*self.computed[name])))
+            elif name in self.sources:
+                plan.append((name, self.sources[name], None))
+            elif isinstance(field, UNDECLARED_FIELDS) and not isinstance(field, serializers.PrimaryKeyRelatedField):
+                raise ImproperlyConfigured(f'{self.serializer_class.__name__}.{name} needs a source or a computed value.')
+            else:
+                plan.append((name, '__'.join(field.source_attrs), converter(field)))
+        return plan
+
+    @cached_property
+    def lookups(self):
+        lookups = [lookup for _, lookup, _ in self.plan if lookup is not None]
+        for lookups_of_field, _ in self.computed.values():
+            lookups += lookups_of_field
+        return list(dict.fromkeys(lookups))
+
+    def values(self, queryset):
+        return queryset.values(*self.lookups)
+
+    def bound_plan(self):
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        return [
+            (name, lookup, convert.bind(tz) if isinstance(convert, DateTimeConverter) else convert)
+            for name, lookup, convert in self.plan
+        ]
+
+    def represent(self, rows):
+        plan = self.bound_plan()
+        data = []
+        with timed_serialization():
+            for row in rows:
+                item = {}
+                for name, lookup, convert in plan:
+                    if lookup is None:
+                        item[name] = convert(row)
+                    else:
+                        value = row[lookup]
+                        item[name] = value if convert is None or value is None else convert(value)
+                data.append(item)
+        return data
+
+
+class ValuesListMixin:
+    """Serve `list` from values() rows when `values_rows` is set."""
+    values_rows = None
+
+    def list(self, request, *args, **kwargs):
+        return self.list_response(self.filter_queryset(self.get_queryset()))
+
+    def list_response(self, queryset):
+        """`queryset` as a list response, paginated if the paginator says so."""
+        if self.values_rows is None or not fast_lists_enabled():
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                return self.get_paginated_response(self.get_serializer(page, many=True).data)
+            return Response(self.get_serializer(queryset, many=True).data)
+
+        rows = self.values_rows.values(queryset)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.values_rows.represent(page))
+        return Response(self.values_rows.represent(rows))
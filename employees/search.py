@@ -0,0 +1,108 @@
+import re
+
+from django.db import NotSupportedError, connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from .models import Complaint, Message, Task
+from .pagination import SearchPagination
+
+
+# Full-text search
+#
+# SearchMixin adds GET <list>/search/?q=... to a ViewSet.  Results come from
+# the ViewSet's own queryset and filters, so they are scoped exactly like the
+# list, and are ordered by relevance.
+#
+# PostgreSQL: every searchable table has a search_vector tsvector column
+# GENERATED from its text columns, so every write path (bulk_create included)
+# keeps it current, and a GIN index on it.  q is parsed by websearch_to_tsquery
+# (quoted phrases, "or", -word) and matches are ranked with ts_rank_cd.
+#
+# SQLite (tests, local development): an FTS5 external-content table per model,
+# kept in step by triggers and ranked with bm25().  Every word of q must match.
+#
+# Both are created by migration 0010_search; the column is not a model field.
+# Fields are weighted A (titles, subjects, message bodies) or B (descriptions).
+SEARCH_CONFIG = 'english'
+SEARCH_FIELDS = {
+    Message: (('content', 'A'),),
+    Task: (('title', 'A'), ('description', 'B')),
+    Complaint: (('subject', 'A'), ('description', 'B')),
+}
+BM25_WEIGHTS = {'A': 1.0, 'B': 0.4}  # ts_rank_cd's defaults for A and B
+MAX_QUERY_LENGTH = 200
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+def fts_query(q):
+    # FTS5 has its own query syntax; quote every word so user input is only ever words
+    words = re.findall(r'\w+', q)
+    return ' '.join(f'"{word}"' for word in words) or None
+
+
+def search_filter(model, q, using='default'):
+    """Condition matching rows of model against q (no ranking), or None if q has no words."""
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    if connection.vendor == 'postgresql':
+        sql, params = f"{table}.search_vector @@ websearch_to_tsquery('{SEARCH_CONFIG}', %s)", [q]
+    elif connection.vendor == 'sqlite':
+        terms = fts_query(q)
+        if terms is None:
+            return None
+        fts = connection.ops.quote_name(fts_table(model))
+        sql, params = f'{table}.id IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)', [terms]
+    else:
+        raise NotSupportedError(f'Full-text search is not set up for {connection.vendor}.')
+    return RawSQL(sql, params, output_field=BooleanField())
+
+
+def search(queryset, q):
+    """queryset restricted to rows matching q, annotated with search_rank, best match first."""
+    connection = connections[queryset.db]
+    model = queryset.model
+    table = connection.ops.quote_name(model._meta.db_table)
+    if connection.vendor == 'sqlite':
+        terms = fts_query(q)
+        if terms is None:
+            return queryset.none()
+        # A join, so bm25() is computed once per match while FTS5 scans its
+        # index; a correlated subquery would search the index again per row.
+        fts = connection.ops.quote_name(fts_table(model))
+        weights = ', '.join(str(BM25_WEIGHTS[weight]) for _, weight in SEARCH_FIELDS[model])
+        queryset = queryset.extra(
+            tables=[fts_table(model)],
+            where=[f'{fts}.rowid = {table}.id', f'{fts} MATCH %s'],
+            params=[terms],
+            select={'search_rank': f'-bm25({fts}, {weights})'},  # bm25() is lower for better matches
+        )
+    else:
+        match = search_filter(model, q, queryset.db)
+        rank = RawSQL(f"ts_rank_cd({table}.search_vector, websearch_to_tsquery('{SEARCH_CONFIG}', %s))", [q],
+                      output_field=FloatField())
+        queryset = queryset.filter(match).annotate(search_rank=rank)
+    return queryset.order_by('-search_rank', '-id')
+
+
+class SearchMixin:
+    """Adds GET <list>/search/?q=..., ranked, within the list's own queryset and filters."""
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(q) > MAX_QUERY_LENGTH:
+            return Response({'error': f'q must be at most {MAX_QUERY_LENGTH} characters'}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = search(self.filter_queryset(self.get_queryset()), q)
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
@@ -0,0 +1,134 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .cache import invalidate
+from .inbox import record_messages
+from .models import Attendance, Complaint, Message, Salary, Task
+from .summaries import apply_attendance_changes, month_start
+
+
+# Synthetic data for benchmarks and local load testing
+#
+# seed() adds a batch of new users (named <prefix><n>) together with their
+# attendance history, tasks, complaints, monthly salaries and chat messages.
+# Rows are generated lazily and written batch_size at a time with
+# bulk_create(), so large volumes do not have to fit in memory.  Attendance
+# rollups and conversation summaries are kept up to date as they would be
+# through the API.  The same `seed` value always produces the same data.
+DEFAULT_BATCH_SIZE = 5000
+
+
+def _insert(model, objects, batch_size, after_batch=None):
+    count = 0
+    while True:
+        batch = list(islice(objects, batch_size))
+        if not batch:
+            return count
+        with transaction.atomic():
+            created = model.objects.bulk_create(batch)
+            if after_batch is not None:
+                after_batch(created)
+        count += len(batch)
+
+
+def seed(users=200, days=90, tasks=20, complaints=2, salary_months=12, messages=20000,
+         prefix='seed', password='password', staff_ratio=0.1, batch_size=DEFAULT_BATCH_SIZE, seed=0):
+    rng = random.Random(seed)
+    today = date.today()
+    first = User.objects.filter(username__startswith=prefix).count()
+    password = make_password(password)  # Hash once; every seeded user shares it
+
+    staff_count = max(1, int(users * staff_ratio))
+    _insert(User, (
+        User(
+            username=f'{prefix}{first + i:05d}', password=password,
+            first_name=f'First{first + i}', last_name=f'Last{first + i}',
+            email=f'{prefix}{first + i:05d}@example.com', is_staff=i < staff_count,
+        )
+        for i in range(users)
+    ), batch_size)
+    seeded = list(
+        User.objects.filter(username__startswith=prefix, username__gte=f'{prefix}{first:05d}')
+        .order_by('id').values_list('id', 'is_staff')
+    )
+    user_ids = [user_id for user_id, _ in seeded]
+    staff_ids = [user_id for user_id, is_staff in seeded if is_staff]
+    employee_ids = [user_id for user_id, is_staff in seeded if not is_staff] or user_ids
+
+    workdays = [today - timedelta(days=n) for n in range(days) if (today - timedelta(days=n)).weekday() < 5]
+    attendance = _insert(Attendance, (
+        Attendance(employee_id=employee_id, date=day, status='Present' if rng.random() < 0.92 else 'Absent')
+        for employee_id in employee_ids
+        for day in workdays
+    ), batch_size, after_batch=lambda rows: apply_attendance_changes(
+        [(row.employee_id, row.date, row.status, 1) for row in rows]
+    ))
+
+    task_statuses = [choice for choice, _ in Task.STATUS_CHOICES]
+    priorities = [choice for choice, _ in Task.PRIORITY_CHOICES]
+
+    def task(employee_id, n):
+        task_status = rng.choice(task_statuses)
+        return Task(
+            title=f'Task {n} for employee {employee_id}', description='Synthetic task. ' * rng.randint(1, 20),
+            assigned_to_id=employee_id, created_by_id=rng.choice(staff_ids), status=task_status,
+            priority=rng.choice(priorities), due_date=today + timedelta(days=rng.randint(-60, 60)),
+            completed=task_status == 'Completed',
+        )
+
+    task_count = _insert(Task, (
+        task(employee_id, n) for employee_id in employee_ids for n in range(tasks)
+    ), batch_size)
+
+    complaint_statuses = [choice for choice, _ in Complaint.STATUS_CHOICES]
+    complaint_count = _insert(Complaint, (
+        Complaint(
+            employee_id=employee_id, subject=f'Complaint {n} from employee {employee_id}',
+            description='Synthetic complaint. ' * rng.randint(1, 30), status=rng.choice(complaint_statuses),
+        )
+        for employee_id in employee_ids for n in range(complaints)
+    ), batch_size)
+
+    def salaries(employee_id):
+        basic = Decimal(rng.randrange(30000, 150000, 500))
+        month = month_start(today)
+        for _ in range(salary_months):
+            bonuses = Decimal(rng.choice([0, 0, 0, 1000, 2500, 5000]))
+            deductions = Decimal(rng.randrange(0, 3000, 100))
+            yield Salary(
+                employee_id=employee_id, basic_salary=basic, bonuses=bonuses, deductions=deductions,
+                net_salary=basic + bonuses - deductions, date=month,
+            )
+            month = month_start(month - timedelta(days=1))
+
+    salary_count = _insert(Salary, (
+        row for employee_id in user_ids for row in salaries(employee_id)
+    ), batch_size)
+
+    def chat():
+        # Most chat happens between a handful of regular contacts
+        contacts = {
+            user_id: rng.sample([peer for peer in user_ids if peer != user_id], min(8, len(user_ids) - 1))
+            for user_id in user_ids
+        }
+        for n in range(messages):
+            sender_id = rng.choice(user_ids)
+            yield Message(sender_id=sender_id, recipient_id=rng.choice(contacts[sender_id]), content=f'Synthetic message {n}')
+
+    message_count = _insert(Message, chat() if len(user_ids) > 1 else iter(()), batch_size, after_batch=record_messages)
+
+    invalidate(User, Attendance, Task, Complaint, Salary, Message)  # bulk_create() sends no signals
+    return {
+        'users': len(user_ids),
+        'attendance': attendance,
+        'tasks': task_count,
+        'complaints': complaint_count,
+        'salaries': salary_count,
+        'messages': message_count,
+    }
@@ -1,5 +1,6 @@
 # Complaints
 from rest_framework import serializers
+from .instrumentation import TimedSerializerMixin
 from .models import Complaint
 # Attendance
 from .models import Attendance
@@ -8,13 +9,16 @@ from django.contrib.auth.models import User
 from .models import Task
 from datetime import date
 # Messages
-from .models import Message
+from .models import Message, Conversation
 # Salary
 from .models import Salary
+# Tokens
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .authentication import USER_CLAIMS
 
 
 # Compaints
-class ComplaintSerializer(serializers.ModelSerializer):
+class ComplaintSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Complaint
         fields = ['id', 'employee', 'subject', 'description', 'status', 'created_at']
@@ -31,7 +35,7 @@ class ComplaintSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 # Attendance
-class AttendanceSerializer(serializers.ModelSerializer):
+class AttendanceSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     employee_name = serializers.SerializerMethodField()
 
     class Meta:
@@ -40,10 +44,14 @@ class AttendanceSerializer(serializers.ModelSerializer):
         read_only_fields = ['employee', 'date']
 
     def get_employee_name(self, obj):
-        return f"{obj.employee.first_name} {obj.employee.last_name}" if obj.employee.first_name and obj.employee.last_name else obj.employee.username
+        return display_name(obj.employee.first_name, obj.employee.last_name, obj.employee.username)
+
+
+def display_name(first_name, last_name, username):
+    return f"{first_name} {last_name}" if first_name and last_name else username
 
 # Tasks
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     assigned_to_username = serializers.ReadOnlyField(source='assigned_to.username')
     
     class Meta:
@@ -69,7 +77,7 @@ class TaskSerializer(serializers.ModelSerializer):
         return value
 
 # Messages
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     sender = serializers.StringRelatedField(read_only=True)
     recipient = serializers.StringRelatedField(read_only=True)
 
@@ -78,10 +86,47 @@ class MessageSerializer(serializers.ModelSerializer):
         fields = ['id', 'sender', 'recipient', 'timestamp', 'content']
         read_only_fields = ['id', 'sender', 'recipient', 'timestamp']
 
+# Conversations
+class ConversationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    peer_username = serializers.ReadOnlyField(source='peer.username')
+
+    class Meta:
+        model = Conversation
+        fields = ['id', 'peer', 'peer_username', 'last_message', 'last_timestamp', 'last_preview', 'unread_count']
+        read_only_fields = fields
+
 # Salary
-class SalarySerializer(serializers.ModelSerializer):
+class SalarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     employee_name = serializers.ReadOnlyField(source='employee.username')  
 
     class Meta:
         model = Salary
-        fields = ['id', 'employee', 'employee_name', 'basic_salary', 'bonuses', 'deductions', 'net_salary', 'date']
\ No newline at end of file
+        fields = ['id', 'employee', 'employee_name', 'basic_salary', 'bonuses', 'deductions', 'net_salary', 'date']
+
+
+# Payroll runs
+class PayrollAdjustmentSerializer(serializers.Serializer):
+    employee = serializers.IntegerField()
+    bonuses = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    deductions = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+
+class PayrollRunSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    basic_salary = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True, default=None)
+    bonuses = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, default=0)
+    deductions = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, default=0)
+    employees = serializers.ListField(child=serializers.IntegerField(), required=False, allow_null=True, default=None)
+    adjustments = PayrollAdjustmentSerializer(many=True, required=False, default=list)
+
+
+# Tokens
+class EmployeeTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Adds the claims WebSocket handshakes read instead of the user row."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        return token
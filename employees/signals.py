@@ -0,0 +1,70 @@
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .authentication import token_cache
+from .cache import invalidate
+from .events import entity_saved, entity_saving
+from .inbox import forget_message
+from .models import Attendance, Complaint, Message, Salary, Task
+from .usercache import username_cache
+
+
+# Cached responses are invalidated per model on every write, once it commits:
+# a request reading before the commit would otherwise cache the old rows
+# under the new version.
+@receiver(post_save, sender=Complaint)
+@receiver(post_delete, sender=Complaint)
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+@receiver(post_save, sender=Salary)
+@receiver(post_delete, sender=Salary)
+def invalidate_cached_responses(sender, **kwargs):
+    transaction.on_commit(lambda: invalidate(sender))
+
+
+# Task and complaint changes are pushed to WebSocket clients (employees/events.py)
+@receiver(pre_save, sender=Task)
+@receiver(pre_save, sender=Complaint)
+def capture_previous_values(sender, instance, using, update_fields=None, raw=False, **kwargs):
+    if not raw:  # Fixtures
+        entity_saving(instance, using, update_fields)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Complaint)
+def publish_entity_event(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if not raw:  # Fixtures
+        entity_saved(instance, created, update_fields)
+
+
+# Conversation summaries (employees/inbox.py) stop showing deleted messages
+@receiver(post_delete, sender=Message)
+def forget_deleted_message(sender, instance, **kwargs):
+    forget_message(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_users(sender, instance, update_fields=None, **kwargs):
+    # Logging in only touches last_login, which no cached payload contains.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    transaction.on_commit(lambda: invalidate(User))
+    username_cache.invalidate(instance.pk)
+    token_cache.invalidate_user(instance.pk)
+
+
+# Blacklisted tokens stop authenticating at once in this process
+if apps.is_installed('rest_framework_simplejwt.token_blacklist'):
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+    @receiver(post_save, sender=BlacklistedToken)
+    def evict_blacklisted_token(sender, instance, **kwargs):
+        token_cache.invalidate_jti(instance.token.jti)
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+from functools import lru_cache
+
+import redis.asyncio as redis
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+# Sequenced event streams
+#
+# Everything sent to a user's user_<id> group (chat messages and task and
+# complaint events) goes through publish(), which first appends the event to
+# that user's stream and stamps it with the user's next sequence number and the
+# stream's epoch.  All of the user's sockets receive the same "seq" and
+# "epoch"; clients keep the highest seq they have seen, with its epoch, and
+# after reconnecting send {"type": "resume", "last_seq": n, "epoch": e} to
+# receive just the events they missed.  When those have already been trimmed
+# the socket is told to refetch over the REST API instead.
+#
+# A stream keeps the last MAXLEN events and expires TTL seconds after its last
+# event; an expired stream starts again at seq 1 with a new epoch (its creation
+# time in milliseconds), so seqs from the old stream are never mistaken for
+# seqs from the new one.  RedisEventStream keeps one Redis stream per user,
+# with "<seq>-<epoch>" as the entry id, so an append is one Lua script call
+# (pipelined for broadcasts) and a replay one XRANGE.  MemoryEventStream keeps
+# the same in process, for tests and single-process deployments, and ignores
+# TTL.
+#
+# Presence updates are not sequenced: they describe current state, which a
+# presence_query after reconnecting returns in full.
+DEFAULT_OPTIONS = {
+    'BACKEND': 'employees.streams.RedisEventStream',
+    'LOCATION': 'redis://127.0.0.1:6379/3',
+    'KEY_PREFIX': 'events',
+    'MAXLEN': 500,
+    'TTL': 86400,
+}
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+@lru_cache(maxsize=None)
+def get_options():
+    return {**DEFAULT_OPTIONS, **getattr(settings, 'EMPLOYEES_EVENT_STREAM', {})}
+
+
+@lru_cache(maxsize=None)
+def get_event_stream():
+    options = get_options()
+    return import_string(options['BACKEND'])(options)
+
+
+@receiver(setting_changed)
+def reset_event_stream(setting, **kwargs):
+    if setting == 'EMPLOYEES_EVENT_STREAM':
+        get_options.cache_clear()
+        get_event_stream.cache_clear()
+
+
+async def publish(sends):
+    """Sequence [(user id, channel-layer event)] and send each to the user's group."""
+    if not sends:
+        return
+    try:
+        positions = await get_event_stream().append_many(sends)
+    except Exception:
+        # Streams are best effort: deliver unsequenced rather than not at all
+        logger.exception("Appending %s events to user streams failed", len(sends))
+    else:
+        sends = [
+            (user_id, {**event, 'seq': seq, 'epoch': epoch}) for (user_id, event), (seq, epoch) in zip(sends, positions)
+        ]
+
+    channel_layer = get_channel_layer()
+    concurrency = getattr(settings, 'EMPLOYEES_FAN_OUT_CONCURRENCY', 500)
+    for start in range(0, len(sends), concurrency):
+        await asyncio.gather(*(
+            channel_layer.group_send(user_group(user_id), event) for user_id, event in sends[start:start + concurrency]
+        ))
+
+
+# Backends
+#
+# append_many() returns the (seq, epoch) given to each event.  since(user id,
+# last seq, epoch) returns (newest seq, epoch, [(seq, event), ...] after last
+# seq), with None instead of the list when some of those events are gone:
+# trimmed, expired, or last seq is from another epoch, a stream that has since
+# expired and started again.  A last seq of 0 (nothing received yet) needs no
+# epoch.  An empty stream's epoch is None.
+
+# KEYS: the user's stream.  ARGV: MAXLEN, TTL, event.
+_APPEND_LUA = """
+local last = redis.call('XREVRANGE', KEYS[1], '+', '-', 'COUNT', 1)
+local seq, epoch
+if #last > 0 then
+    local last_seq
+    last_seq, epoch = string.match(last[1][1], '^(%d+)-(%d+)$')
+    seq = tonumber(last_seq) + 1
+else
+    local now = redis.call('TIME')
+    seq, epoch = 1, now[1] .. string.format('%03d', math.floor(tonumber(now[2]) / 1000))
+end
+redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], seq .. '-' .. epoch, 'e', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return {seq, epoch}
+"""
+
+
+def entry_position(entry_id):
+    """(seq, epoch) from a "<seq>-<epoch>" stream entry id."""
+    seq, epoch = entry_id.split('-', 1)
+    return int(seq), int(epoch)
+
+
+def is_gap(last_seq, epoch, oldest, newest, stream_epoch):
+    """Whether events after `last_seq` of `epoch` are missing from a stream spanning oldest..newest."""
+    if last_seq == 0:
+        return oldest > 1
+    return epoch != stream_epoch or last_seq > newest or oldest > last_seq + 1
+
+
+class RedisEventStream:
+    def __init__(self, options):
+        self.location = options['LOCATION']
+        self.prefix = options['KEY_PREFIX']
+        self.maxlen = options['MAXLEN']
+        self.ttl = options['TTL']
+        self._clients = weakref.WeakKeyDictionary()  # event loop -> (client, append script)
+
+    def key(self, user_id):
+        return f'{self.prefix}:{user_id}'
+
+    def _connection(self):
+        # redis.asyncio connections belong to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        entry = self._clients.get(loop)
+        if entry is None:
+            client = redis.Redis.from_url(self.location, decode_responses=True)
+            entry = self._clients[loop] = (client, client.register_script(_APPEND_LUA))
+        return entry
+
+    async def append_many(self, sends):
+        client, append = self._connection()
+        async with client.pipeline(transaction=False) as pipe:
+            for user_id, event in sends:
+                await append(keys=[self.key(user_id)], args=[self.maxlen, self.ttl, json.dumps(event, cls=DjangoJSONEncoder)],
+                             client=pipe)
+            return [(seq, int(epoch)) for seq, epoch in await pipe.execute()]
+
+    async def since(self, user_id, last_seq, epoch=None):
+        key = self.key(user_id)
+        async with self._connection()[0].pipeline(transaction=True) as pipe:
+            pipe.xrange(key, '-', '+', count=1)
+            pipe.xrevrange(key, '+', '-', count=1)
+            pipe.xrange(key, f'{last_seq + 1}-0', '+')
+            oldest, newest, entries = await pipe.execute()
+        if not newest:
+            return 0, None, (None if last_seq else [])
+        oldest_seq, _ = entry_position(oldest[0][0])
+        newest_seq, stream_epoch = entry_position(newest[0][0])
+        if is_gap(last_seq, epoch, oldest_seq, newest_seq, stream_epoch):
+            return newest_seq, stream_epoch, None
+        return newest_seq, stream_epoch, [(entry_position(entry_id)[0], json.loads(fields['e'])) for entry_id, fields in entries]
+
+    async def clear(self):
+        client = self._connection()[0]
+        keys = [key async for key in client.scan_iter(match=f'{self.prefix}:*')]
+        if keys:
+            await client.delete(*keys)
+
+
+class MemoryEventStream:
+    def __init__(self, options):
+        self.maxlen = options['MAXLEN']
+        self._streams = {}  # user id -> (epoch, deque of (seq, event))
+        self._epoch = 0  # The last epoch given, so that a stream started again within a millisecond gets a new one
+        self._lock = threading.Lock()  # Publishers may call in from other threads' event loops
+
+    async def append_many(self, sends):
+        positions = []
+        with self._lock:
+            for user_id, event in sends:
+                if user_id not in self._streams:
+                    self._epoch = max(time.time_ns() // 1_000_000, self._epoch + 1)
+                    self._streams[user_id] = (self._epoch, deque(maxlen=self.maxlen))
+                epoch, stream = self._streams[user_id]
+                seq = stream[-1][0] + 1 if stream else 1
+                # Stored as JSON, like Redis, so replays never share objects with live events
+                stream.append((seq, json.dumps(event, cls=DjangoJSONEncoder)))
+                positions.append((seq, epoch))
+        return positions
+
+    async def since(self, user_id, last_seq, epoch=None):
+        with self._lock:
+            stream_epoch, stream = self._streams.get(user_id, (None, ()))
+            stream = list(stream)
+        if not stream:
+            return 0, None, (None if last_seq else [])
+        if is_gap(last_seq, epoch, stream[0][0], stream[-1][0], stream_epoch):
+            return stream[-1][0], stream_epoch, None
+        return stream[-1][0], stream_epoch, [(seq, json.loads(event)) for seq, event in stream if seq > last_seq]
+
+    async def clear(self):
+        with self._lock:
+            self._streams.clear()
@@ -0,0 +1,120 @@
+import calendar
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import Attendance, AttendanceSummary
+
+
+# Attendance rollups
+#
+# AttendanceSummary holds present/absent counts per employee per month.  Every
+# write path that touches Attendance passes its changes to
+# apply_attendance_changes() as (employee_id, date, status, +1/-1) tuples so the
+# rollups never need a full rescan; rebuild_attendance_summary recomputes them
+# from scratch if they ever drift.
+STATUS_COLUMNS = {'Present': 'present_days', 'Absent': 'absent_days'}
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_end(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def apply_attendance_changes(changes):
+    deltas = defaultdict(lambda: {'present_days': 0, 'absent_days': 0})
+    for employee_id, day, status, delta in changes:
+        deltas[(employee_id, month_start(day))][STATUS_COLUMNS[status]] += delta
+
+    deltas = {key: delta for key, delta in deltas.items() if any(delta.values())}
+    if not deltas:
+        return
+
+    with transaction.atomic():
+        AttendanceSummary.objects.bulk_create(
+            [AttendanceSummary(employee_id=employee_id, month=month) for employee_id, month in deltas],
+            ignore_conflicts=True,
+        )
+        rows = AttendanceSummary.objects.select_for_update().filter(
+            employee_id__in={employee_id for employee_id, _ in deltas},
+            month__in={month for _, month in deltas},
+        )
+        changed = []
+        for row in rows:
+            delta = deltas.get((row.employee_id, row.month))
+            if delta is None:
+                continue
+            row.present_days = max(row.present_days + delta['present_days'], 0)
+            row.absent_days = max(row.absent_days + delta['absent_days'], 0)
+            changed.append(row)
+        AttendanceSummary.objects.bulk_update(changed, ['present_days', 'absent_days'])
+
+
+def rebuild_attendance_summaries(batch_size=5000):
+    rows = (
+        Attendance.objects.annotate(month=TruncMonth('date'))
+        .values('employee_id', 'month')
+        .annotate(
+            present_days=Count('id', filter=Q(status='Present')),
+            absent_days=Count('id', filter=Q(status='Absent')),
+        )
+        .order_by()
+    )
+    count = 0
+    with transaction.atomic():
+        AttendanceSummary.objects.all().delete()
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(AttendanceSummary(**row))
+            if len(batch) >= batch_size:
+                AttendanceSummary.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        AttendanceSummary.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def summarize_attendance(start, end, employee_ids=None):
+    """Present/absent totals per employee for any date range.
+
+    Whole months inside the range are read from the rollups; only the partial
+    months at either edge fall back to the attendance rows themselves.
+    """
+    totals = defaultdict(lambda: {'present_days': 0, 'absent_days': 0})
+
+    first_full = start if start.day == 1 else month_end(start) + timedelta(days=1)
+    last_full = end if end == month_end(end) else month_start(end) - timedelta(days=1)
+
+    raw_ranges = []
+    if first_full > last_full:
+        raw_ranges.append((start, end))
+    else:
+        if start < first_full:
+            raw_ranges.append((start, first_full - timedelta(days=1)))
+        if end > last_full:
+            raw_ranges.append((last_full + timedelta(days=1), end))
+
+        rollups = AttendanceSummary.objects.filter(month__gte=first_full, month__lte=last_full)
+        if employee_ids is not None:
+            rollups = rollups.filter(employee_id__in=employee_ids)
+        for row in rollups.values('employee_id').annotate(
+            present=Sum('present_days'), absent=Sum('absent_days'),
+        ).order_by():
+            totals[row['employee_id']]['present_days'] += row['present']
+            totals[row['employee_id']]['absent_days'] += row['absent']
+
+    for range_start, range_end in raw_ranges:
+        rows = Attendance.objects.filter(date__gte=range_start, date__lte=range_end)
+        if employee_ids is not None:
+            rows = rows.filter(employee_id__in=employee_ids)
+        for row in rows.values('employee_id', 'status').annotate(days=Count('id')).order_by():
+            totals[row['employee_id']][STATUS_COLUMNS[row['status']]] += row['days']
+
+    return totals
@@ -1,3 +1,1805 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import time
+import uuid
+from datetime import date, datetime, time as clock, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, router as db_router
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.functional import lazystr
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import JWTAuthMiddleware, token_cache
+from .benchmark import compare, http_scenarios, pick_users, run_benchmark
+from .management.commands.benchmark import serializer_baseline
+from .consumers import EmployeesConsumer
+from .events import EntityEventPublisher
+from .instrumentation import MemorySink, PrometheusSink
+from .routing import websocket_urlpatterns
+from .serializers import EmployeeTokenObtainPairSerializer
+from .presence import get_presence, presence_notifier
+from .replicas import is_pinned, pin, routed
+from .parsers import ORJSONParser
+from .protocol import MSGPACK_SUBPROTOCOL, pack, unpack
+from .renderers import ORJSONRenderer
+from .rows import ValuesRows
+from .streams import get_event_stream, publish
+from .summaries import apply_attendance_changes
+from .models import Attendance, AttendanceSummary, Complaint, Conversation, Message, Salary, Task
+from .payroll import run_payroll
+from .urls import router
+from .usercache import username_cache
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 100},
+    },
+}
+
+TEST_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+TEST_PRESENCE = {'BACKEND': 'employees.presence.MemoryPresence', 'DEBOUNCE': 0, 'PUSH_DELAY': 0}
+
+TEST_EVENT_STREAM = {'BACKEND': 'employees.streams.MemoryEventStream'}
+
+
+@override_settings(CACHES=TEST_CACHES, CHANNEL_LAYERS=TEST_CHANNEL_LAYERS, EMPLOYEES_PRESENCE=TEST_PRESENCE,
+                   EMPLOYEES_ENTITY_EVENTS={'COALESCE_WINDOW': 0}, EMPLOYEES_EVENT_STREAM=TEST_EVENT_STREAM)
+class EmployeesTestCase(TestCase):
+    """Runs against local in-memory caches, channel layer, presence and event streams, emptied before every test."""
+
+    def setUp(self):
+        super().setUp()
+        for cache in caches.all():
+            cache.clear()
+        username_cache.clear()
+        token_cache.clear()
+        async_to_sync(get_presence().clear)()
+        async_to_sync(get_event_stream().clear)()
+
+
+# Messages
+class MessagePaginationTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+        cls.bob = User.objects.create_user(username='bob', password='pass')
+        for i in range(7):
+            Message.objects.create(sender=cls.alice, recipient=cls.bob, content=f'm{i}')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_unpaginated_by_default(self):
+        response = self.client.get('/api/messages/')
+        self.assertEqual(len(response.data), 7)
+
+    def test_walks_history_with_cursors(self):
+        seen = []
+        url = '/api/messages/?limit=3'
+        while url:
+            response = self.client.get(url)
+            seen.extend(m['content'] for m in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, [f'm{i}' for i in reversed(range(7))])
+
+    def test_after_cursor_returns_newer_page(self):
+        first = self.client.get('/api/messages/?limit=3').data
+        older = self.client.get(first['next']).data
+        newer = self.client.get(older['previous']).data
+        self.assertEqual(newer['results'], first['results'])
+        self.assertIsNone(first['previous'])
+        self.assertIsNone(newer['previous'])  # Exact, not "came through a cursor"
+        self.assertEqual(newer['next'], first['next'])
+
+    def test_links_are_exact_at_both_ends(self):
+        older_url = self.client.get('/api/messages/?limit=6').data['next']
+        oldest = self.client.get(older_url).data
+        self.assertEqual([m['content'] for m in oldest['results']], ['m0'])
+        self.assertIsNone(oldest['next'])
+        self.assertIsNotNone(oldest['previous'])
+
+        Message.objects.exclude(content='m0').delete()  # Nothing newer left
+        self.assertIsNone(self.client.get(older_url).data['previous'])
+
+    def test_conversation_paginates(self):
+        response = self.client.get('/api/messages/conversation/bob/?limit=5')
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNotNone(response.data['next'])
+
+
+# Query counts
+class QueryCountTests(EmployeesTestCase):
+    """Every list/retrieve must cost the same number of queries at any size."""
+
+    SIZES = (1, 5, 25)
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def seed(self, size):
+        for model in (Attendance, Complaint, Message, Salary, Task):
+            model.objects.all().delete()
+        User.objects.exclude(pk=self.admin.pk).delete()
+        start = date.today()
+        for i in range(size):
+            user = User.objects.create_user(username=f'emp{i}', first_name='E', last_name=str(i))
+            Attendance.objects.create(employee=user, date=start)
+            Complaint.objects.create(employee=user, subject='s', description='d')
+            Message.objects.create(sender=user, recipient=self.admin, content='hi')
+            Salary.objects.create(
+                employee=user, basic_salary=Decimal('100'), bonuses=Decimal('0'),
+                deductions=Decimal('0'), net_salary=Decimal('100'), date=start,
+            )
+            Task.objects.create(
+                title='t', description='d', assigned_to=user, created_by=self.admin,
+                due_date=start + timedelta(days=1),
+            )
+
+    def assertQueriesAtEverySize(self, url, num):
+        for size in self.SIZES:
+            with self.subTest(size=size):
+                with self.captureOnCommitCallbacks(execute=True):  # Cache invalidation waits for the commit
+                    self.seed(size)
+                target = url() if callable(url) else url
+                with self.assertNumQueries(num):
+                    response = self.client.get(target)
+                self.assertEqual(response.status_code, 200)
+
+    def test_list_endpoints(self):
+        # Polled lists spend one extra aggregate query on their ETag.
+        for url, num in (('/api/attendance/', 1), ('/api/complaints/', 2), ('/api/messages/', 2),
+                         ('/api/salary/', 1), ('/api/tasks/', 2), ('/api/users/', 1)):
+            with self.subTest(url=url):
+                self.assertQueriesAtEverySize(url, num)
+
+    def test_retrieve_endpoints(self):
+        for model, prefix in ((Attendance, 'attendance'), (Complaint, 'complaints'),
+                              (Message, 'messages'), (Salary, 'salary'), (Task, 'tasks')):
+            with self.subTest(endpoint=prefix):
+                self.assertQueriesAtEverySize(lambda: f'/api/{prefix}/{model.objects.last().pk}/', 1)
+
+    def test_conversation(self):
+        # The other user, the ETag aggregate and the messages themselves.
+        self.assertQueriesAtEverySize('/api/messages/conversation/emp0/', 3)
+
+
+# Filtering
+class ListFilterTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.emp = User.objects.create_user(username='emp', password='pass')
+        today = date.today()
+        for i, (status, priority) in enumerate([('Pending', 'High'), ('Completed', 'Low'), ('Pending', 'Low')]):
+            Task.objects.create(
+                title=f't{i}', description='d', assigned_to=cls.emp, created_by=cls.admin,
+                status=status, priority=priority, due_date=today + timedelta(days=i),
+            )
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_filters_combine(self):
+        response = self.client.get('/api/tasks/?status=Pending&priority=Low')
+        self.assertEqual([t['title'] for t in response.data], ['t2'])
+
+    def test_repeated_param_and_date_range(self):
+        tomorrow = date.today() + timedelta(days=1)
+        response = self.client.get(f'/api/tasks/?status=Pending&status=Completed&due_date_after={tomorrow}&ordering=due_date')
+        self.assertEqual([t['title'] for t in response.data], ['t1', 't2'])
+
+    def test_invalid_value_is_rejected(self):
+        response = self.client.get('/api/tasks/?due_date_after=yesterday')
+        self.assertEqual(response.status_code, 400)
+
+    def test_repeated_range_param_is_rejected(self):
+        response = self.client.get(f'/api/tasks/?due_date_after=2024-01-01&due_date_after={date.today()}')
+        self.assertEqual((response.status_code, list(response.data)), (400, ['due_date_after']))
+
+    def test_limit_offset(self):
+        response = self.client.get('/api/tasks/?limit=2&ordering=id')
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([t['title'] for t in response.data['results']], ['t0', 't1'])
+
+
+# Attendance
+class BulkAttendanceTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.emp = User.objects.create_user(username='emp', password='pass')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_json_records_report_each_row(self):
+        Attendance.objects.create(employee=self.emp, date=date(2024, 1, 1), status='Present')
+        records = [
+            {'employee': self.emp.pk, 'date': '2024-01-01', 'status': 'Absent'},
+            {'employee': self.emp.pk, 'date': '2024-01-02', 'status': 'Absent'},
+            {'employee': 999, 'date': '2024-01-02'},
+            {'employee': self.emp.pk, 'date': 'not-a-date'},
+        ]
+        response = self.client.post('/api/attendance/bulk/', {'records': records}, content_type='application/json')
+        self.assertEqual(
+            [r['status'] for r in response.data['results']], ['skipped', 'created', 'error', 'error'],
+        )
+        self.assertEqual(Attendance.objects.get(date=date(2024, 1, 1)).status, 'Present')
+
+    def test_update_on_conflict(self):
+        Attendance.objects.create(employee=self.emp, date=date(2024, 1, 1), status='Present')
+        records = [{'employee': self.emp.pk, 'date': '2024-01-01', 'status': 'Absent'}]
+        response = self.client.post('/api/attendance/bulk/?on_conflict=update', records, content_type='application/json')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(Attendance.objects.get(date=date(2024, 1, 1)).status, 'Absent')
+
+    def test_row_inserted_after_the_read_is_skipped_and_counted_once(self):
+        # What AttendanceViewSet.perform_create does for a single check-in
+        Attendance.objects.create(employee=self.emp, date=date(2024, 1, 3), status='Present')
+        apply_attendance_changes([(self.emp.pk, date(2024, 1, 3), 'Present', 1)])
+        select_for_update = Attendance.objects.select_for_update
+        calls = []
+
+        def stale_select_for_update():
+            # The first read misses the row, as if it committed just after.
+            calls.append(1)
+            queryset = select_for_update()
+            return queryset.exclude(date=date(2024, 1, 3)) if len(calls) == 1 else queryset
+
+        records = [{'employee': self.emp.pk, 'date': '2024-01-03', 'status': 'Present'}]
+        with mock.patch.object(Attendance.objects, 'select_for_update', side_effect=stale_select_for_update):
+            response = self.client.post('/api/attendance/bulk/', records, content_type='application/json')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(response.data['skipped'], 1)
+        summary = AttendanceSummary.objects.get(employee=self.emp, month=date(2024, 1, 1))
+        self.assertEqual(summary.present_days, 1)
+
+    def test_csv_upload(self):
+        content = f'employee,date,status\n{self.emp.pk},2024-02-01,Present\n{self.emp.pk},2024-02-02,Absent\n'
+        upload = SimpleUploadedFile('attendance.csv', content.encode())
+        response = self.client.post('/api/attendance/bulk/', {'file': upload}, format='multipart')
+        self.assertEqual(response.data['created'], 2)
+
+    def test_employees_cannot_import(self):
+        self.client.force_authenticate(self.emp)
+        response = self.client.post('/api/attendance/bulk/', [], content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+
+class AttendanceSummaryTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.emp = User.objects.create_user(username='emp', password='pass')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        records = [
+            {'employee': self.emp.pk, 'date': f'2024-{month:02d}-{day:02d}', 'status': status}
+            for month, day, status in [(1, 10, 'Present'), (1, 31, 'Absent'), (2, 1, 'Present'),
+                                       (2, 15, 'Absent'), (3, 1, 'Present'), (3, 20, 'Present')]
+        ]
+        self.client.post('/api/attendance/bulk/', records, content_type='application/json')
+
+    def summary(self, start, end):
+        return self.client.get(f'/api/attendance-summary/?start={start}&end={end}').data
+
+    def test_bulk_import_maintains_rollups(self):
+        feb = AttendanceSummary.objects.get(employee=self.emp, month=date(2024, 2, 1))
+        self.assertEqual((feb.present_days, feb.absent_days), (1, 1))
+
+    def test_range_combines_rollups_and_partial_months(self):
+        data = self.summary('2024-01-15', '2024-03-10')
+        self.assertEqual((data['present_days'], data['absent_days']), (2, 2))
+
+    def test_update_and_destroy_adjust_rollups(self):
+        record = Attendance.objects.get(date=date(2024, 2, 15))
+        self.client.patch(f'/api/attendance/{record.pk}/', {'status': 'Present'}, content_type='application/json')
+        self.assertEqual(self.summary('2024-02-01', '2024-02-29')['present_days'], 2)
+        self.client.delete(f'/api/attendance/{record.pk}/')
+        self.assertEqual(self.summary('2024-02-01', '2024-02-29')['present_days'], 1)
+
+    def test_impossible_dates_are_rejected(self):
+        response = self.client.get('/api/attendance-summary/?start=2024-02-30&end=2024-03-01')
+        self.assertEqual(response.status_code, 400)
+
+    def test_rebuild_command(self):
+        AttendanceSummary.objects.all().delete()
+        call_command('rebuild_attendance_summary', stdout=io.StringIO())
+        self.assertEqual(self.summary('2024-01-01', '2024-03-31')['present_days'], 4)
+
+
+# Salary
+class PayrollRunTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.paid = User.objects.create_user(username='paid', password='pass')
+        cls.new = User.objects.create_user(username='new', password='pass')
+        Salary.objects.create(
+            employee=cls.paid, basic_salary=Decimal('1000'), bonuses=Decimal('0'),
+            deductions=Decimal('0'), net_salary=Decimal('1000'), date=date(2024, 1, 31),
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_run_is_idempotent(self):
+        body = {
+            'date': '2024-02-29', 'basic_salary': '500.00', 'deductions': '50.00',
+            'adjustments': [{'employee': self.paid.pk, 'bonuses': '200.00'}],
+        }
+        first = self.client.post('/api/salary/run-payroll/', body, format='json').data
+        self.assertEqual(first['created'], 3)
+        self.assertEqual(Salary.objects.get(employee=self.paid, date=date(2024, 2, 29)).net_salary, Decimal('1150.00'))
+        self.assertEqual(Salary.objects.get(employee=self.new, date=date(2024, 2, 29)).net_salary, Decimal('450.00'))
+
+        second = self.client.post('/api/salary/run-payroll/', body, format='json').data
+        self.assertEqual((second['created'], second['skipped_existing']), (0, 3))
+
+    def test_employees_without_salary_are_skipped(self):
+        result = self.client.post('/api/salary/run-payroll/', {'date': '2024-02-29'}, format='json').data
+        self.assertEqual((result['created'], result['skipped_no_salary']), (1, 2))
+
+    def test_rows_are_written_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            run_payroll(date(2024, 2, 29), basic_salary=Decimal('500'), bonuses=Decimal('20'))
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE')])
+        self.assertEqual(Salary.objects.get(employee=self.new, date=date(2024, 2, 29)).net_salary, Decimal('520.00'))
+
+    def test_rows_inserted_meanwhile_are_not_counted(self):
+        def progress(processed, total, elapsed):
+            if processed == 1:  # As if a concurrent run got to `new` first
+                Salary.objects.create(employee=self.new, basic_salary=Decimal('700'), bonuses=Decimal('0'),
+                                      deductions=Decimal('0'), net_salary=Decimal('700'), date=date(2024, 2, 29))
+
+        result = run_payroll(date(2024, 2, 29), basic_salary=Decimal('500'), chunk_size=1, progress=progress)
+        self.assertEqual((result['created'], result['skipped_existing']), (2, 1))
+        self.assertEqual(Salary.objects.get(employee=self.new, date=date(2024, 2, 29)).net_salary, Decimal('700.00'))
+
+
+# Response cache
+class ResponseCacheTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.emp = User.objects.create_user(username='emp', password='pass')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_second_read_is_served_from_cache(self):
+        self.client.get('/api/users/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/')
+        self.assertEqual({u['username'] for u in response.data}, {'admin', 'emp'})
+        self.assertEqual(self.client.get('/api/cache-stats/').data['responses']['hits'], 1)
+
+    def test_writes_invalidate(self):
+        self.client.get('/api/complaints/')
+        with self.captureOnCommitCallbacks(execute=True):
+            Complaint.objects.create(employee=self.emp, subject='s', description='d')
+        self.assertEqual(len(self.client.get('/api/complaints/').data), 1)
+
+    def test_invalidation_waits_for_the_commit(self):
+        self.client.get('/api/complaints/')
+        with self.captureOnCommitCallbacks() as callbacks:
+            Complaint.objects.create(employee=self.emp, subject='s', description='d')
+        # Still the old version: a reader could only have cached rows from before the write
+        self.assertEqual(self.client.get('/api/complaints/').data, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(self.client.get('/api/complaints/').data), 1)
+
+    def test_scoped_per_user(self):
+        Complaint.objects.create(employee=self.admin, subject='s', description='d')
+        self.client.get('/api/complaints/')
+        self.client.force_authenticate(self.emp)
+        self.assertEqual(self.client.get('/api/complaints/').data, [])
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'other.example'])
+    def test_links_keep_the_origin_of_each_request(self):
+        for subject in 'ab':
+            Complaint.objects.create(employee=self.emp, subject=subject, description='d')
+        self.assertTrue(self.client.get('/api/complaints/?limit=1').data['next'].startswith('http://testserver/'))
+        response = self.client.get('/api/complaints/?limit=1', HTTP_HOST='other.example', secure=True)
+        self.assertTrue(response.data['next'].startswith('https://other.example/'))
+
+    def test_login_does_not_invalidate_users(self):
+        self.client.get('/api/users/')
+        self.admin.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            self.client.get('/api/users/')
+
+
+# Conditional GET
+class ConditionalGetTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.emp = User.objects.create_user(username='emp', password='pass')
+        cls.complaint = Complaint.objects.create(employee=cls.emp, subject='s', description='d')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_unchanged_list_returns_304_after_one_query(self):
+        Message.objects.create(sender=self.emp, recipient=self.admin, content='hi')
+        etag = self.client.get('/api/messages/')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/messages/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_cached_list_returns_304_without_a_query(self):
+        etag = self.client.get('/api/complaints/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/complaints/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/complaints/')
+        self.assertEqual((response.status_code, response['ETag']), (200, etag))
+
+    def test_renamed_user_changes_message_etag(self):
+        Message.objects.create(sender=self.emp, recipient=self.admin, content='hi')
+        etag = self.client.get('/api/messages/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.emp.username = 'employee'
+            self.emp.save()
+        response = self.client.get('/api/messages/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.data[0]['sender']), (200, 'employee'))
+
+    def test_update_changes_etag(self):
+        etag = self.client.get('/api/complaints/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/complaints/{self.complaint.pk}/', {'status': 'Resolved'}, content_type='application/json')
+        response = self.client.get('/api/complaints/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['status'], 'Resolved')
+
+    def test_conversation(self):
+        Message.objects.create(sender=self.emp, recipient=self.admin, content='hi')
+        etag = self.client.get('/api/messages/conversation/emp/')['ETag']
+        response = self.client.get('/api/messages/conversation/emp/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Message.objects.create(sender=self.admin, recipient=self.emp, content='hello')
+        response = self.client.get('/api/messages/conversation/emp/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+# WebSocket consumer
+class ConsumerTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.emps = [User.objects.create_user(username=f'emp{i}', password='pass') for i in range(3)]
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(EmployeesConsumer.as_asgi(), '/ws/employees/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def test_chat_message_is_delivered(self):
+        async def run():
+            sender, recipient = await self.connect(self.emps[0]), await self.connect(self.emps[1])
+            await sender.send_json_to({'message': 'hi', 'recipient_username': 'emp1'})
+            received = await recipient.receive_json_from()
+            await sender.disconnect()
+            await recipient.disconnect()
+            return received
+
+        received = async_to_sync(run)()
+        self.assertEqual((received['sender'], received['message']), ('emp0', 'hi'))
+
+    @override_settings(EMPLOYEES_CHAT_WRITE_BEHIND=True)
+    def test_write_behind_persists_on_disconnect(self):
+        async def run():
+            sender, recipient = await self.connect(self.emps[0]), await self.connect(self.emps[1])
+            for i in range(3):
+                await sender.send_json_to({'message': f'm{i}', 'recipient_username': 'emp1'})
+            received = [await recipient.receive_json_from() for _ in range(3)]
+            await sender.disconnect()
+            await recipient.disconnect()
+            return received
+
+        received = async_to_sync(run)()
+        self.assertEqual([r['message'] for r in received], ['m0', 'm1', 'm2'])
+        self.assertEqual(
+            list(Message.objects.order_by('id').values_list('content', flat=True)), ['m0', 'm1', 'm2'],
+        )
+
+    def test_broadcast_to_group(self):
+        async def run():
+            admin = await self.connect(self.admin)
+            listeners = [await self.connect(emp) for emp in self.emps]
+            await admin.send_json_to({'type': 'broadcast', 'message': 'all hands', 'group': 'employees'})
+            ack = await admin.receive_json_from()
+            received = [await listener.receive_json_from() for listener in listeners]
+            for communicator in (admin, *listeners):
+                await communicator.disconnect()
+            return ack, received
+
+        ack, received = async_to_sync(run)()
+        self.assertEqual(ack['recipients'], 3)
+        self.assertEqual({r['recipient'] for r in received}, {'emp0', 'emp1', 'emp2'})
+        self.assertEqual(Message.objects.filter(sender=self.admin).count(), 3)
+
+    def test_broadcast_list_reports_missing(self):
+        async def run():
+            sender = await self.connect(self.emps[0])
+            await sender.send_json_to({'type': 'broadcast', 'message': 'hi',
+                                       'recipient_usernames': ['emp1', 'ghost', 'emp0', 'emp2']})
+            ack = await sender.receive_json_from()
+            await sender.disconnect()
+            return ack
+
+        User.objects.filter(pk=self.emps[2].pk).update(is_active=False)
+        ack = async_to_sync(run)()
+        self.assertEqual((ack['recipients'], ack['missing'], ack['inactive']), (1, ['ghost'], ['emp2']))
+
+    def test_group_broadcast_requires_admin(self):
+        async def run():
+            sender = await self.connect(self.emps[0])
+            await sender.send_json_to({'type': 'broadcast', 'message': 'hi', 'group': 'all'})
+            reply = await sender.receive_json_from()
+            await sender.disconnect()
+            return reply
+
+        self.assertIn('error', async_to_sync(run)())
+
+    def test_demoted_admin_cannot_broadcast_to_a_group(self):
+        async def run():
+            sender = await self.connect(self.admin)  # is_staff as of the token's claims
+            await sender.send_json_to({'type': 'broadcast', 'message': 'hi', 'group': 'all'})
+            reply = await sender.receive_json_from()
+            await sender.disconnect()
+            return reply
+
+        User.objects.filter(pk=self.admin.pk).update(is_staff=False)
+        self.assertEqual(async_to_sync(run)(), {'error': 'Invalid broadcast group'})
+        self.assertFalse(Message.objects.exists())
+
+    def test_chat_to_a_deleted_recipient(self):
+        async def run():
+            sender = await self.connect(self.emps[0])
+            await sender.send_json_to({'message': 'hi', 'recipient_username': 'ghost'})
+            reply = await sender.receive_json_from()
+            await sender.disconnect()
+            return reply
+
+        username_cache.set(self.admin.id + 100, 'ghost')
+        with mock.patch.object(Message.objects, 'create', side_effect=IntegrityError):
+            self.assertEqual(async_to_sync(run)(), {'error': 'Recipient does not exist'})
+
+
+# Username cache
+class UsernameCacheTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+        cls.bob = User.objects.create_user(username='bob', password='pass')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def test_repeat_sends_skip_the_user_lookup(self):
+        self.client.post('/api/messages/', {'recipient': 'bob', 'content': 'one'}, content_type='application/json')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/messages/', {'recipient': 'bob', 'content': 'two'}, content_type='application/json')
+        self.assertFalse([q for q in queries if 'FROM "auth_user"' in q['sql']])
+        self.assertEqual(response.data['recipient'], 'bob')
+        self.assertEqual(username_cache.stats()['hits'], 1)
+
+    def test_rename_evicts(self):
+        self.client.post('/api/messages/', {'recipient': 'bob', 'content': 'one'}, content_type='application/json')
+        self.bob.username = 'robert'
+        self.bob.save()
+        response = self.client.post('/api/messages/', {'recipient': 'bob', 'content': 'two'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_recipient_deleted_elsewhere(self):
+        # Deleted by another process: still cached here, the foreign key fails
+        username_cache.set(self.bob.id + 100, 'ghost')
+        with mock.patch.object(Message.objects, 'create', side_effect=IntegrityError):
+            response = self.client.post('/api/messages/', {'recipient': 'ghost', 'content': 'hi'}, content_type='application/json')
+        self.assertEqual((response.status_code, response.data), (400, {'error': 'Recipient does not exist'}))
+        self.assertIsNone(username_cache.get('ghost'))
+
+    def test_username_moving_to_another_id(self):
+        username_cache.set(1, 'a')
+        username_cache.set(2, 'a')
+        username_cache.invalidate(1)
+        self.assertEqual(username_cache.get('a'), (2, 'a'))
+
+    def test_lru_bound(self):
+        username_cache.max_entries = 1
+        try:
+            username_cache.set(1, 'a')
+            username_cache.set(2, 'b')
+            self.assertIsNone(username_cache.get('a'))
+            self.assertEqual(username_cache.get('b'), (2, 'b'))
+        finally:
+            username_cache.max_entries = 10000
+
+
+# Conversations
+class ConversationTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+        cls.bob = User.objects.create_user(username='bob', password='pass')
+        cls.carol = User.objects.create_user(username='carol', password='pass')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def send(self, sender, recipient, content):
+        self.client.force_authenticate(sender)
+        self.client.post('/api/messages/', {'recipient': recipient.username, 'content': content}, content_type='application/json')
+
+    def test_inbox_tracks_last_message_and_unread(self):
+        self.send(self.alice, self.bob, 'hi bob')
+        self.send(self.alice, self.bob, 'are you there?')
+        self.send(self.carol, self.bob, 'lunch?')
+
+        self.client.force_authenticate(self.bob)
+        with self.assertNumQueries(1):
+            inbox = self.client.get('/api/conversations/').data['results']
+        self.assertEqual(
+            [(c['peer_username'], c['last_preview'], c['unread_count']) for c in inbox],
+            [('carol', 'lunch?', 1), ('alice', 'are you there?', 2)],
+        )
+        self.assertEqual(self.client.get('/api/conversations/unread/').data['unread'], 3)
+
+        self.client.post('/api/conversations/alice/read/')
+        self.assertEqual(self.client.get('/api/conversations/unread/').data['unread'], 1)
+
+        sent = Conversation.objects.get(owner=self.alice, peer=self.bob)
+        self.assertEqual((sent.last_preview, sent.unread_count), ('are you there?', 0))
+
+    def test_deleting_messages_updates_the_inbox(self):
+        self.send(self.alice, self.bob, 'hi bob')
+        self.send(self.alice, self.bob, 'are you there?')
+        self.client.force_authenticate(self.bob)
+        self.client.post('/api/conversations/alice/read/')
+        self.send(self.alice, self.bob, 'lunch?')
+
+        def summaries():
+            return sorted(Conversation.objects.values_list('owner__username', 'last_preview', 'unread_count'))
+
+        Message.objects.get(content='lunch?').delete()  # Unread, and the latest
+        self.assertEqual(summaries(), [('alice', 'are you there?', 0), ('bob', 'are you there?', 0)])
+        Message.objects.get(content='hi bob').delete()  # Already read
+        self.assertEqual(summaries(), [('alice', 'are you there?', 0), ('bob', 'are you there?', 0)])
+        Message.objects.all().delete()
+        self.assertEqual(summaries(), [])
+
+    def test_rebuild_command(self):
+        self.send(self.alice, self.bob, 'hi bob')
+        Conversation.objects.all().delete()
+        call_command('rebuild_conversations', stdout=io.StringIO())
+        self.assertEqual(Conversation.objects.count(), 2)
+
+
+# Exports
+class ExportTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.emp = User.objects.create_user(username='emp', password='pass')
+        start = date(2024, 1, 1)
+        Attendance.objects.bulk_create([
+            Attendance(employee=cls.emp, date=start + timedelta(days=i), status='Present' if i % 3 else 'Absent')
+            for i in range(10)
+        ])
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_csv_streams_filtered_rows_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/attendance/export/?date_after=2024-01-03&date_before=2024-01-05&ordering=date')
+            body = b''.join(response.streaming_content).decode()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(body.splitlines(), [
+            'id,employee,employee_username,date,status',
+            *(f'{a.id},{self.emp.id},emp,{a.date},{a.status}'
+              for a in Attendance.objects.filter(date__range=('2024-01-03', '2024-01-05')).order_by('date')),
+        ])
+
+    def test_jsonl(self):
+        response = self.client.get('/api/attendance/export/?output=jsonl&status=Absent')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['date'] for row in rows], ['2024-01-10', '2024-01-07', '2024-01-04', '2024-01-01'])
+
+    async def test_asgi_exports_stream_asynchronously(self):
+        # A sync iterator would be read to the end before the first byte went out
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.admin)}'}
+        response = await self.async_client.get('/api/attendance/export/?output=jsonl', headers=headers)
+        self.assertTrue(response.is_async)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(body.splitlines()), 10)
+
+    def test_employees_cannot_export(self):
+        self.client.force_authenticate(self.emp)
+        self.assertEqual(self.client.get('/api/salary/export/').status_code, 403)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_data', 'attendance', '--start', '2024-01-09', '--chunk-size', '1', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+
+# Synthetic data and benchmarks
+class BenchmarkTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_data', '--users', '6', '--days', '10', '--tasks', '2', '--salary-months', '2',
+                     '--messages', '30', stdout=io.StringIO())
+
+    def test_seed_data(self):
+        self.assertEqual(User.objects.filter(username__startswith='seed').count(), 6)
+        self.assertEqual(Salary.objects.count(), 12)
+        self.assertEqual(Message.objects.count(), 30)
+        self.assertEqual(
+            sum(AttendanceSummary.objects.values_list('present_days', flat=True))
+            + sum(AttendanceSummary.objects.values_list('absent_days', flat=True)),
+            Attendance.objects.count(),
+        )
+        self.assertTrue(Conversation.objects.exists())
+
+    def test_scenarios_cover_every_router_endpoint(self):
+        paths = {scenario.path for scenario in http_scenarios(pick_users())}
+        for prefix, _, _ in router.registry:
+            self.assertTrue(any(path.startswith(f'/api/{prefix}/') for path in paths), prefix)
+
+    def test_run_and_compare(self):
+        current = run_benchmark(iterations=3, warmup=1, only=['tasks:list', 'chat:message'], chat_clients=2, chat_messages=2)
+        self.assertEqual(set(current['results']), {'tasks:list', 'tasks:list-own', 'chat:message'})
+        self.assertEqual(current['results']['tasks:list']['errors'], 0)
+
+        baseline = json.loads(json.dumps(current))
+        baseline['results']['tasks:list']['queries_per_request'] -= 1
+        regressed = {row[0] for row in compare(current, baseline) if row[-1]}
+        self.assertEqual(regressed, {'tasks:list'})
+
+    def test_list_scenarios_run_both_paths(self):
+        self.assertEqual(set(run_benchmark(iterations=1, warmup=0, only=['lists:tasks'])['results']), {'lists:tasks:values'})
+        current = run_benchmark(iterations=2, warmup=1, only=['lists:tasks'], serializer_baseline=serializer_baseline)
+        self.assertEqual(set(current['results']), {'lists:tasks:serializer', 'lists:tasks:values'})
+        self.assertFalse(any(result['errors'] for result in current['results'].values()))
+
+    def test_empty_samples(self):
+        current = run_benchmark(iterations=0, warmup=0, only=['tasks:list'])
+        result = current['results']['tasks:list']
+        self.assertEqual((result['requests'], result['p95_ms'], result['queries_per_request']), (0, None, None))
+        self.assertEqual(compare(current, current), [])
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('benchmark', '--iterations', '0', '--warmup', '0', '--scenario', 'tasks:list', stdout=out)
+        self.assertIn('tasks:list ', out.getvalue())
+
+
+# Request instrumentation
+@override_settings(EMPLOYEES_METRICS={
+    'SINKS': ['employees.instrumentation.MemorySink', 'employees.instrumentation.PrometheusSink'],
+    'SLOW_REQUEST_MS': 0,
+})
+class InstrumentationTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.emp = User.objects.create_user(username='emp', password='pass')
+        Task.objects.create(title='t', description='d', assigned_to=cls.emp, created_by=cls.admin, due_date=date.today())
+
+    def setUp(self):
+        super().setUp()
+        MemorySink.records.clear()
+        PrometheusSink.reset()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_request_is_recorded_per_action(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tasks/')
+        record = MemorySink.records[-1]
+        self.assertEqual(record['action'], 'TaskViewSet.list')
+        self.assertEqual((record['status'], record['queries']), (200, len(queries)))
+        self.assertEqual(record['response_bytes'], len(response.content))
+        self.assertGreater(record['serializer_ms'], 0)
+        self.assertEqual(len(record['sql']), len(queries))  # Slow request, so the SQL is attached
+
+        metrics = self.client.get('/api/metrics/').content.decode()
+        self.assertIn('employees_requests_total{action="TaskViewSet.list",method="GET",status="200"} 1', metrics)
+
+    def test_streamed_export_is_recorded_when_sent(self):
+        response = self.client.get('/api/tasks/export/')
+        self.assertFalse(any(r['action'] == 'TaskViewSet.export' for r in MemorySink.records))
+        body = b''.join(response.streaming_content)
+        record = MemorySink.records[-1]
+        self.assertEqual((record['action'], record['response_bytes'], record['queries']), ('TaskViewSet.export', len(body), 1))
+
+    def test_consumer_frames_are_recorded(self):
+        async def run():
+            communicator = WebsocketCommunicator(EmployeesConsumer.as_asgi(), '/ws/employees/')
+            communicator.scope['user'] = self.emp
+            await communicator.connect()
+            await communicator.send_to(text_data='{"message": "hi", "recipient_username": "nobody"}')
+            await communicator.receive_from()
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+        record = MemorySink.records[-1]
+        self.assertEqual(record['action'], 'EmployeesConsumer.chat')
+        self.assertEqual(record['queries'], 1)
+        self.assertGreater(record['response_bytes'], 0)
+
+
+# Async read paths
+class AsyncViewTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+        cls.bob = User.objects.create_user(username='bob', password='pass')
+        for i in range(5):
+            Message.objects.create(sender=cls.alice, recipient=cls.bob, content=f'm{i}')
+        for i, task_status in enumerate(['Pending', 'Completed', 'Pending']):
+            Task.objects.create(title=f't{i}', description='d', assigned_to=cls.alice, created_by=cls.admin,
+                                status=task_status, due_date=date.today() + timedelta(days=i))
+
+    def auth(self, user):
+        return {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+    def assertSameAsSync(self, user, sync_path, async_path):
+        async def fetch():
+            return await self.async_client.get(async_path, headers=self.auth(user))
+
+        expected = self.client.get(sync_path, headers=self.auth(user))
+        response = async_to_sync(fetch)()
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content.replace(b'/api/async/', b'/api/'), expected.content)
+
+    def test_responses_match_the_sync_endpoints(self):
+        self.assertSameAsSync(self.alice, '/api/messages/', '/api/async/messages/')
+        self.assertSameAsSync(self.alice, '/api/messages/?limit=2', '/api/async/messages/?limit=2')
+        self.assertSameAsSync(self.bob, '/api/messages/conversation/alice/?limit=3',
+                              '/api/async/messages/conversation/alice/?limit=3')
+        self.assertSameAsSync(self.bob, '/api/messages/conversation/nobody/', '/api/async/messages/conversation/nobody/')
+        self.assertSameAsSync(self.admin, '/api/tasks/?status=Pending&ordering=due_date', '/api/async/tasks/?status=Pending&ordering=due_date')
+        self.assertSameAsSync(self.admin, '/api/tasks/?limit=2&offset=1', '/api/async/tasks/?limit=2&offset=1')
+        self.assertSameAsSync(self.bob, '/api/tasks/', '/api/async/tasks/')
+        self.assertSameAsSync(self.admin, '/api/users/', '/api/async/users/')
+
+    async def test_requires_a_valid_token(self):
+        response = await self.async_client.get('/api/async/tasks/')
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get('/api/async/tasks/', headers={'Authorization': 'Bearer nope'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+
+    async def test_invalid_filter_is_rejected(self):
+        response = await self.async_client.get('/api/async/tasks/?due_date_after=soon', headers=self.auth(self.admin))
+        self.assertEqual(response.status_code, 400)
+
+
+# Authentication
+class TokenAuthenticationTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+
+    def get(self, token, path='/api/tasks/'):
+        return self.client.get(path, headers={'Authorization': f'Bearer {token}'})
+
+    def test_repeat_requests_skip_the_user_query(self):
+        token = AccessToken.for_user(self.alice)
+        self.assertEqual(self.get(token).status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.get(token).status_code, 200)
+        self.assertFalse([q for q in ctx.captured_queries if 'auth_user' in q['sql'] and 'employees_task' not in q['sql']])
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    def test_user_changes_evict_cached_tokens(self):
+        token = AccessToken.for_user(self.alice)
+        self.get(token)
+        self.alice.is_active = False
+        self.alice.save()
+        self.assertEqual(self.get(token).status_code, 401)
+        self.alice.is_active = True
+        self.alice.save()
+
+    def test_cached_user_has_role_flags(self):
+        token = AccessToken.for_user(self.admin)
+        self.get(token)
+        response = self.get(token, '/api/cache-stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['tokens']['hits'], 1)
+
+    def test_invalid_and_expired_tokens_are_rejected(self):
+        self.assertEqual(self.get('nope').status_code, 401)
+        token = AccessToken.for_user(self.alice)
+        token.set_exp(lifetime=-timedelta(minutes=1))
+        self.assertEqual(self.get(token).status_code, 401)
+        self.assertEqual(token_cache.stats()['entries'], 0)
+
+    def test_entries_expire_with_the_token(self):
+        token = AccessToken.for_user(self.alice)
+        self.get(token)
+        with mock.patch('employees.authentication.time.time', return_value=token['exp'] + 1):
+            self.assertIsNone(token_cache.get(str(token).encode()))
+        self.assertEqual(token_cache.stats()['entries'], 0)
+
+    def test_login_returns_tokens_and_role(self):
+        response = self.client.post('/api/token/', {'username': 'admin', 'password': 'pass'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'access', 'refresh', 'role'})
+        self.assertEqual(response.data['role'], 'admin')
+        self.assertEqual(self.get(response.data['access']).status_code, 200)
+
+    def test_login_rejects_bad_credentials(self):
+        for data in ({'username': 'alice', 'password': 'wrong'}, {'username': 'alice'}):
+            response = self.client.post('/api/token/', data, content_type='application/json')
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response.data, {'error': 'Invalid credentials'})
+
+    def test_login_hashes_the_password_once(self):
+        with mock.patch('django.contrib.auth.base_user.check_password', wraps=check_password) as checked:
+            response = self.client.post('/api/token/', {'username': 'alice', 'password': 'pass'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['role'], 'employee')
+        self.assertEqual(checked.call_count, 1)
+
+
+class WebSocketAuthTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+
+    def handshake(self, path='/ws/employees/', **kwargs):
+        async def run():
+            communicator = WebsocketCommunicator(JWTAuthMiddleware(URLRouter(websocket_urlpatterns)), path, **kwargs)
+            connected, subprotocol = await communicator.connect()
+            if connected:
+                await communicator.disconnect()
+            return connected, subprotocol
+        return async_to_sync(run)()
+
+    def login_token(self, user):
+        return str(EmployeeTokenObtainPairSerializer.get_token(user).access_token)
+
+    def test_login_tokens_carry_user_claims(self):
+        response = self.client.post('/api/token/', {'username': 'alice', 'password': 'pass'}, content_type='application/json')
+        token = AccessToken(response.data['access'])
+        self.assertEqual((token['username'], token['is_staff']), ('alice', False))
+
+    def test_subprotocol_token_connects_without_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            connected, subprotocol = self.handshake(subprotocols=['jwt', self.login_token(self.alice)])
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, 'jwt')
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_query_string_token_without_claims_loads_the_user(self):
+        token = AccessToken.for_user(self.alice)
+        with CaptureQueriesContext(connection) as ctx:
+            connected, subprotocol = self.handshake(f'/ws/employees/?token={token}')
+        self.assertEqual((connected, subprotocol), (True, None))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(self.handshake(f'/ws/employees/?token={token}')[0])
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_binary_protocol_with_subprotocol_token(self):
+        connected, subprotocol = self.handshake(subprotocols=['jwt', self.login_token(self.alice), MSGPACK_SUBPROTOCOL])
+        self.assertEqual((connected, subprotocol), (True, MSGPACK_SUBPROTOCOL))
+
+    def test_invalid_token_is_rejected(self):
+        self.assertFalse(self.handshake('/ws/employees/?token=nope')[0])
+        self.assertFalse(self.handshake(subprotocols=['jwt', 'nope'])[0])
+
+    def test_inactive_users_are_rejected_like_the_rest_api(self):
+        User.objects.filter(pk=self.alice.pk).update(is_active=False)
+        token = AccessToken.for_user(self.alice)
+        headers = {'Authorization': f'Bearer {token}'}
+        self.assertEqual(self.client.get('/api/tasks/', headers=headers).status_code, 401)
+        response = async_to_sync(self.async_client.get)('/api/async/tasks/', headers=headers)
+        self.assertEqual((response.status_code, response.json()['code']), (401, 'user_inactive'))
+        self.assertFalse(self.handshake(f'/ws/employees/?token={token}')[0])
+
+    def test_session_fallback(self):
+        self.client.force_login(self.alice)
+        cookie = f'sessionid={self.client.cookies["sessionid"].value}'.encode()
+        self.assertTrue(self.handshake(headers=[(b'cookie', cookie)])[0])
+        with override_settings(EMPLOYEES_WS_AUTH={'SESSION_FALLBACK': False}):
+            self.assertFalse(self.handshake(headers=[(b'cookie', cookie)])[0])
+
+
+# Presence
+class PresenceTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+        cls.bob = User.objects.create_user(username='bob', password='pass')
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(EmployeesConsumer.as_asgi(), '/ws/employees/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def test_backend_states(self):
+        async def run():
+            backend = get_presence()
+            states = [await backend.connect(1), await backend.connect(1), await backend.heartbeat(1, 'away')]
+            states += [await backend.disconnect(1), await backend.disconnect(1)]
+            return states
+
+        self.assertEqual(async_to_sync(run)(), [
+            ('offline', 'online'), ('online', 'online'), ('online', 'away'), ('away', 'away'), ('away', 'offline'),
+        ])
+
+    def test_users_without_heartbeats_go_offline(self):
+        backend = get_presence()
+        async_to_sync(backend.connect)(1)
+        self.assertEqual(async_to_sync(backend.statuses)([1, 2]), {1: 'online', 2: 'offline'})
+        with mock.patch('employees.presence.time.time', return_value=time.time() + backend.offline_after + 1):
+            self.assertEqual(async_to_sync(backend.present)(), {})
+            self.assertEqual(async_to_sync(backend.connect)(1), ('offline', 'online'))
+
+    def test_subscribers_receive_updates(self):
+        async def run():
+            alice = await self.connect(self.alice)
+            await alice.send_json_to({'type': 'presence_subscribe', 'user_ids': [self.bob.id]})
+            frames = [await alice.receive_json_from()]
+            bob = await self.connect(self.bob)
+            frames.append(await alice.receive_json_from())
+            await bob.send_json_to({'type': 'heartbeat', 'state': 'away'})
+            frames.append(await alice.receive_json_from())
+            await bob.disconnect()
+            frames.append(await alice.receive_json_from())
+            await alice.disconnect()
+            return frames
+
+        bob = str(self.bob.id)
+        self.assertEqual(async_to_sync(run)(), [
+            {'type': 'presence', 'users': {bob: state}} for state in ('offline', 'online', 'away', 'offline')
+        ])
+
+    def test_heartbeats_do_not_touch_the_database(self):
+        async def run():
+            alice = await self.connect(self.alice)
+            await alice.send_json_to({'type': 'heartbeat', 'state': 'away'})
+            await alice.send_json_to({'type': 'presence_query', 'user_ids': [self.alice.id]})
+            reply = await alice.receive_json_from()
+            await alice.disconnect()
+            return reply
+
+        with CaptureQueriesContext(connection) as ctx:
+            reply = async_to_sync(run)()
+        self.assertEqual(reply['users'], {str(self.alice.id): 'away'})
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    @override_settings(EMPLOYEES_PRESENCE={**TEST_PRESENCE, 'DEBOUNCE': 60})
+    def test_reconnects_inside_the_debounce_window_are_not_published(self):
+        async def run():
+            presence_notifier.changed(self.bob.id, 'offline', 'online')
+            presence_notifier.changed(self.bob.id, 'online', 'offline')
+            sent = presence_notifier.sent
+            await presence_notifier.flush()
+            return presence_notifier.sent - sent
+
+        self.assertEqual(async_to_sync(run)(), 0)
+
+    def test_rejects_bad_frames(self):
+        async def run():
+            alice = await self.connect(self.alice)
+            replies = []
+            for frame in ({'type': 'heartbeat', 'state': 'asleep'}, {'type': 'presence_subscribe', 'user_ids': ['bob']}):
+                await alice.send_json_to(frame)
+                replies.append(await alice.receive_json_from())
+            await alice.disconnect()
+            return replies
+
+        self.assertTrue(all('error' in reply for reply in async_to_sync(run)()))
+
+    def test_bulk_endpoint(self):
+        async_to_sync(get_presence().connect)(self.bob.id)
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.alice)}'}
+        response = self.client.get(f'/api/presence/?ids={self.alice.id},{self.bob.id}', headers=headers)
+        self.assertEqual(response.json(), {str(self.alice.id): 'offline', str(self.bob.id): 'online'})
+        response = self.client.get('/api/presence/', headers=headers)
+        self.assertEqual(response.json(), {str(self.bob.id): 'online'})
+        self.assertEqual(self.client.get('/api/presence/?ids=bob', headers=headers).status_code, 400)
+
+
+# Search
+class SearchTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+        cls.bob = User.objects.create_user(username='bob', password='pass')
+
+        def task(title, description, user, **kwargs):
+            return Task.objects.create(title=title, description=description, assigned_to=user, created_by=cls.admin,
+                                       due_date=date.today(), **kwargs)
+
+        cls.title_hit = task('Quarterly budget review', 'Numbers', cls.alice)
+        cls.body_hit = task('Planning', 'Prepare the budget slides', cls.alice, status='Completed')
+        cls.other = task('Budget for bob', 'Private', cls.bob)
+        Message.objects.create(sender=cls.alice, recipient=cls.bob, content='Lunch on Friday?')
+        Message.objects.create(sender=cls.bob, recipient=cls.admin, content='Friday deploy is risky')
+        Complaint.objects.create(employee=cls.alice, subject='Broken chair', description='The chair squeaks')
+        Complaint.objects.create(employee=cls.bob, subject='Noise', description='Broken air conditioning')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def search(self, user, path):
+        self.client.force_authenticate(user)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_results_are_scoped_and_ranked(self):
+        results = self.search(self.alice, '/api/tasks/search/?q=budget')['results']
+        self.assertEqual([row['id'] for row in results], [self.title_hit.id, self.body_hit.id])
+        self.assertEqual(len(self.search(self.admin, '/api/tasks/search/?q=budget')['results']), 3)
+
+    def test_messages_and_complaints(self):
+        results = self.search(self.alice, '/api/messages/search/?q=friday')['results']
+        self.assertEqual([row['content'] for row in results], ['Lunch on Friday?'])
+        results = self.search(self.alice, '/api/complaints/search/?q=broken')['results']
+        self.assertEqual([row['subject'] for row in results], ['Broken chair'])
+        self.assertEqual(len(self.search(self.admin, '/api/complaints/search/?q=broken')['results']), 2)
+
+    def test_list_filters_apply(self):
+        results = self.search(self.alice, '/api/tasks/search/?q=budget&status=Completed')['results']
+        self.assertEqual([row['id'] for row in results], [self.body_hit.id])
+
+    def test_index_follows_writes(self):
+        self.title_hit.title = 'Quarterly forecast'
+        self.title_hit.save()
+        self.body_hit.delete()
+        Message.objects.bulk_create([Message(sender=self.alice, recipient=self.bob, content='Forecast attached')])
+        self.assertEqual(self.search(self.alice, '/api/tasks/search/?q=budget')['results'], [])
+        self.assertEqual(len(self.search(self.alice, '/api/tasks/search/?q=forecast')['results']), 1)
+        self.assertEqual(len(self.search(self.alice, '/api/messages/search/?q=forecast')['results']), 1)
+
+    def test_paginates_without_counting(self):
+        page = self.search(self.admin, '/api/tasks/search/?q=budget&limit=2')
+        self.assertEqual(len(page['results']), 2)
+        self.assertNotIn('count', page)
+        self.assertIn('offset=2', page['next'])
+        last = self.search(self.admin, '/api/tasks/search/?q=budget&limit=2&offset=2')
+        self.assertEqual((len(last['results']), last['next']), (1, None))
+
+    def test_query_validation(self):
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.client.get('/api/tasks/search/').status_code, 400)
+        self.assertEqual(self.search(self.alice, '/api/tasks/search/?q=%22%3A*')['results'], [])
+
+    def test_admin_search_uses_the_index(self):
+        from django.contrib.admin.sites import site
+
+        queryset, _ = site._registry[Task].get_search_results(None, Task.objects.all(), 'budget')
+        self.assertEqual(queryset.count(), 3)
+        queryset, _ = site._registry[Task].get_search_results(None, Task.objects.all(), 'bob')
+        self.assertEqual(set(queryset), {self.other})
+        queryset, _ = site._registry[Task].get_search_results(None, Task.objects.all(), 'BO')
+        self.assertEqual(set(queryset), {self.other})
+
+
+# Task and complaint events
+class EntityEventTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+        cls.bob = User.objects.create_user(username='bob', password='pass')
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(EmployeesConsumer.as_asgi(), '/ws/employees/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def committed(self, write):
+        with self.captureOnCommitCallbacks(execute=True):
+            return write()
+
+    def new_task(self, assignee, **kwargs):
+        return Task.objects.create(title='Report', description='d', assigned_to=assignee, created_by=self.admin,
+                                   due_date=date.today(), **kwargs)
+
+    def test_assignee_and_staff_receive_task_events(self):
+        async def run():
+            admin, alice, bob = await self.connect(self.admin), await self.connect(self.alice), await self.connect(self.bob)
+            task = await sync_to_async(self.committed)(lambda: self.new_task(self.alice))
+            frames = [await alice.receive_json_from(), await admin.receive_json_from()]
+            self.assertTrue(await bob.receive_nothing())
+
+            def complete():
+                task = Task.objects.get(pk=frames[0]['data']['id'])
+                task.status = 'Completed'
+                task.save()
+            await sync_to_async(self.committed)(complete)
+            frames.append(await alice.receive_json_from())
+            for communicator in (admin, alice, bob):
+                await communicator.disconnect()
+            return task, frames
+
+        task, (created, staff_copy, completed) = async_to_sync(run)()
+        self.assertEqual((created['type'], created['entity'], created['event']), ('entity_event', 'task', 'created'))
+        self.assertEqual(created['data']['id'], task.id)
+        self.assertEqual(created['data']['assigned_to_username'], 'alice')
+        self.assertEqual({**staff_copy, 'seq': None, 'epoch': None}, {**created, 'seq': None, 'epoch': None})
+        self.assertEqual((completed['event'], completed['previous_status']), ('status_changed', 'Pending'))
+        self.assertEqual(completed['data']['status'], 'Completed')
+
+    def test_reassignment_notifies_both_assignees(self):
+        task_id = self.new_task(self.alice).id
+
+        async def run():
+            alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+
+            def reassign():
+                task = Task.objects.get(pk=task_id)
+                task.assigned_to = self.bob
+                task.save()
+            await sync_to_async(self.committed)(reassign)
+            frames = [await alice.receive_json_from(), await bob.receive_json_from()]
+            await alice.disconnect()
+            await bob.disconnect()
+            return frames
+
+        frames = async_to_sync(run)()
+        self.assertEqual({frame['data']['assigned_to_username'] for frame in frames}, {'bob'})
+
+    def test_complaint_owner_is_notified(self):
+        async def run():
+            alice = await self.connect(self.alice)
+            await sync_to_async(self.committed)(
+                lambda: Complaint.objects.create(employee=self.alice, subject='Chair', description='Broken'))
+            frame = await alice.receive_json_from()
+            await alice.disconnect()
+            return frame
+
+        frame = async_to_sync(run)()
+        self.assertEqual((frame['entity'], frame['event'], frame['data']['subject']), ('complaint', 'created', 'Chair'))
+
+    def test_staff_assignee_receives_one_copy(self):
+        async def run():
+            admin = await self.connect(self.admin)
+            await sync_to_async(self.committed)(lambda: self.new_task(self.admin))
+            frame = await admin.receive_json_from()
+            nothing_else = await admin.receive_nothing()
+            await admin.disconnect()
+            return frame, nothing_else
+
+        frame, nothing_else = async_to_sync(run)()
+        self.assertEqual(frame['event'], 'created')
+        self.assertTrue(nothing_else)
+
+    def test_uncommitted_writes_publish_nothing(self):
+        publisher = EntityEventPublisher()
+        with mock.patch('employees.events.entity_publisher', publisher):
+            self.new_task(self.alice)
+        self.assertEqual(publisher.published, 0)
+
+    def test_previous_values_come_from_the_load(self):
+        task = self.new_task(self.alice)
+        loaded = Task.objects.get(pk=task.pk)
+        loaded.status, loaded.assigned_to = 'Completed', self.bob
+        with mock.patch('employees.events.entity_publisher') as publisher:
+            with CaptureQueriesContext(connection) as queries:
+                self.committed(loaded.save)
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT')])
+        publisher.add.assert_called_once_with(Task, task.pk, 'status_changed', 'Pending', {self.alice.id, self.bob.id})
+
+    def test_deferred_previous_values_are_read_from_the_stored_row(self):
+        task = self.new_task(self.alice)
+        loaded = Task.objects.defer('status', 'assigned_to').get(pk=task.pk)  # Nothing captured on load
+        loaded.status, loaded.assigned_to = 'Completed', self.bob
+        with mock.patch('employees.events.entity_publisher') as publisher:
+            self.committed(loaded.save)
+        publisher.add.assert_called_once_with(Task, task.pk, 'status_changed', 'Pending', {self.alice.id, self.bob.id})
+
+    def test_staff_fan_out_can_be_turned_off(self):
+        task = self.new_task(self.alice)
+        publisher = EntityEventPublisher()
+        publisher.queue(Task, task.pk, 'updated', None, {self.alice.id})
+        with override_settings(EMPLOYEES_ENTITY_EVENTS={'COALESCE_WINDOW': 0, 'NOTIFY_STAFF': False}), \
+                mock.patch('employees.events.publish', new_callable=mock.AsyncMock) as publish:
+            publisher.flush()
+        self.assertEqual([user_id for user_id, _ in publish.call_args[0][0]], [self.alice.id])
+
+    def test_rapid_edits_are_coalesced(self):
+        task = self.new_task(self.alice)
+        task.status, task.title = 'Completed', 'Final report'
+        task.save()
+        publisher = EntityEventPublisher()
+        publisher.queue(Task, task.pk, 'created', None, {self.alice.id})
+        publisher.queue(Task, task.pk, 'status_changed', 'Pending', {self.alice.id})
+        publisher.queue(Task, task.pk, 'updated', None, {self.bob.id})
+        with mock.patch('employees.events.publish', new_callable=mock.AsyncMock) as publish:
+            publisher.flush()
+        sends = publish.call_args[0][0]
+        self.assertEqual([user_id for user_id, _ in sends], [self.admin.id, self.alice.id, self.bob.id])
+        event = sends[0][1]
+        self.assertEqual((event['event'], event['data']['title']), ('created', 'Final report'))
+
+
+# Sequenced event streams
+class EventStreamTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+        cls.bob = User.objects.create_user(username='bob', password='pass')
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(EmployeesConsumer.as_asgi(), '/ws/employees/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def chat(self, sender, count, start=0):
+        for i in range(start, start + count):
+            await sender.send_json_to({'message': f'm{i}', 'recipient_username': 'bob'})
+
+    def test_reconnect_replays_only_the_gap(self):
+        async def run():
+            alice, bob = await self.connect(self.alice), await self.connect(self.bob)
+            await self.chat(alice, 2)
+            live = [await bob.receive_json_from() for _ in range(2)]
+            await bob.disconnect()
+            await self.chat(alice, 3, start=2)  # While bob is away
+            await asyncio.sleep(0.05)
+
+            bob = await self.connect(self.bob)
+            await bob.send_json_to({'type': 'resume', 'last_seq': live[-1]['seq'], 'epoch': live[-1]['epoch']})
+            replayed = [await bob.receive_json_from() for _ in range(4)]
+            await self.chat(alice, 1, start=5)
+            after = await bob.receive_json_from()
+            await alice.disconnect()
+            await bob.disconnect()
+            return live, replayed, after
+
+        live, replayed, after = async_to_sync(run)()
+        self.assertEqual([frame['seq'] for frame in live], [1, 2])
+        self.assertEqual([(frame['message'], frame['seq']) for frame in replayed[:3]], [('m2', 3), ('m3', 4), ('m4', 5)])
+        self.assertEqual(replayed[3], {'type': 'resumed', 'seq': 5, 'epoch': live[-1]['epoch'], 'replayed': 3})
+        self.assertEqual((after['message'], after['seq'], after['epoch']), ('m5', 6, live[-1]['epoch']))
+
+    @override_settings(EMPLOYEES_EVENT_STREAM={**TEST_EVENT_STREAM, 'MAXLEN': 2})
+    def test_trimmed_gap_asks_for_refetch(self):
+        async def run():
+            alice = await self.connect(self.alice)
+            await self.chat(alice, 4)
+            await asyncio.sleep(0.05)
+            _, epoch, _ = await get_event_stream().since(self.bob.id, 0)
+            bob = await self.connect(self.bob)
+            await bob.send_json_to({'type': 'resume', 'last_seq': 1, 'epoch': epoch})
+            reply = await bob.receive_json_from()
+            await alice.disconnect()
+            await bob.disconnect()
+            return epoch, reply
+
+        epoch, reply = async_to_sync(run)()
+        self.assertEqual(reply, {'type': 'resync', 'seq': 4, 'epoch': epoch})
+
+    def test_restarted_stream_asks_for_refetch(self):
+        event = {'type': 'chat_message', 'sender_username': 'alice', 'recipient_username': 'bob', 'message': 'hi',
+                 'timestamp': '2024-01-01T00:00:00+00:00'}
+
+        async def run():
+            stream = get_event_stream()
+            (_, old_epoch), = await stream.append_many([(self.bob.id, event)])
+            await stream.clear()  # Expired
+            positions = await stream.append_many([(self.bob.id, event)] * 3)
+            bob = await self.connect(self.bob)
+            await bob.send_json_to({'type': 'resume', 'last_seq': 1, 'epoch': old_epoch})
+            reply = await bob.receive_json_from()
+            await bob.disconnect()
+            return old_epoch, positions, reply
+
+        old_epoch, positions, reply = async_to_sync(run)()
+        new_epoch = positions[-1][1]
+        self.assertNotEqual(new_epoch, old_epoch)
+        self.assertEqual(positions, [(1, new_epoch), (2, new_epoch), (3, new_epoch)])
+        self.assertEqual(reply, {'type': 'resync', 'seq': 3, 'epoch': new_epoch})
+
+    def test_live_copies_of_replayed_events_are_dropped(self):
+        event = {'type': 'chat_message', 'sender_username': 'alice', 'recipient_username': 'bob', 'message': 'hi',
+                 'timestamp': '2024-01-01T00:00:00+00:00'}
+
+        async def run():
+            (_, epoch), _ = await get_event_stream().append_many([(self.bob.id, event), (self.bob.id, event)])
+            bob = await self.connect(self.bob)
+            await bob.send_json_to({'type': 'resume', 'last_seq': 0})
+            replayed = [await bob.receive_json_from() for _ in range(3)]
+            channel_layer = get_channel_layer()
+            await channel_layer.group_send(f'user_{self.bob.id}', {**event, 'seq': 2, 'epoch': epoch})
+            await channel_layer.group_send(f'user_{self.bob.id}', {**event, 'seq': 3, 'epoch': epoch})
+            live = await bob.receive_json_from()
+            nothing_else = await bob.receive_nothing()
+            await bob.disconnect()
+            return replayed, live, nothing_else
+
+        replayed, live, nothing_else = async_to_sync(run)()
+        self.assertEqual([frame.get('seq') for frame in replayed], [1, 2, 2])
+        self.assertEqual(live['seq'], 3)
+        self.assertTrue(nothing_else)
+
+    def test_expired_stream_asks_for_refetch(self):
+        self.assertEqual(async_to_sync(get_event_stream().since)(self.bob.id, 7, 1), (0, None, None))
+        self.assertEqual(async_to_sync(get_event_stream().since)(self.bob.id, 0), (0, None, []))
+
+    def test_stream_outage_still_delivers(self):
+        async def run():
+            bob = await self.connect(self.bob)
+            with mock.patch.object(get_event_stream(), 'append_many', side_effect=ConnectionError), \
+                    self.assertLogs('employees.streams', 'ERROR'):
+                await publish([(self.bob.id, {'type': 'chat_message', 'sender_username': 'alice', 'recipient_username': 'bob',
+                                              'message': 'hi', 'timestamp': '2024-01-01T00:00:00+00:00'})])
+            frame = await bob.receive_json_from()
+            await bob.disconnect()
+            return frame
+
+        frame = async_to_sync(run)()
+        self.assertEqual((frame['message'], frame['seq']), ('hi', None))
+
+    def test_invalid_last_seq(self):
+        async def run():
+            bob = await self.connect(self.bob)
+            await bob.send_json_to({'type': 'resume', 'last_seq': '3'})
+            reply = await bob.receive_json_from()
+            await bob.disconnect()
+            return reply
+
+        self.assertIn('error', async_to_sync(run)())
+
+
+# Binary WebSocket protocol
+@override_settings(EMPLOYEES_WS_MSGPACK={'BATCH_DELAY': 0.05, 'BATCH_MAX': 100})
+class BinaryProtocolTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+        cls.bob = User.objects.create_user(username='bob', password='pass')
+
+    async def connect(self, user, subprotocols=()):
+        communicator = WebsocketCommunicator(EmployeesConsumer.as_asgi(), '/ws/employees/', subprotocols=list(subprotocols))
+        communicator.scope['user'] = user
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator, subprotocol
+
+    def chat_event(self, n):
+        return {'type': 'chat_message', 'sender_username': 'alice', 'recipient_username': 'bob', 'message': f'm{n}',
+                'timestamp': '2024-01-01T00:00:00+00:00'}
+
+    def test_chat_arrives_as_compact_binary_frame(self):
+        async def run():
+            alice, _ = await self.connect(self.alice)
+            bob, subprotocol = await self.connect(self.bob, [MSGPACK_SUBPROTOCOL])
+            await alice.send_json_to({'message': 'hi', 'recipient_username': 'bob'})
+            frame = await bob.receive_output()
+            await alice.disconnect()
+            await bob.disconnect()
+            return subprotocol, frame
+
+        subprotocol, frame = async_to_sync(run)()
+        self.assertEqual(subprotocol, MSGPACK_SUBPROTOCOL)
+        self.assertIsNone(frame.get('text'))
+        [event] = unpack(frame['bytes'])
+        self.assertEqual({key: event[key] for key in ('t', 's', 'r', 'm', 'q')},
+                         {'t': 'chat', 's': 'alice', 'r': 'bob', 'm': 'hi', 'q': 1})
+
+    def test_events_are_batched(self):
+        async def run():
+            bob, _ = await self.connect(self.bob, [MSGPACK_SUBPROTOCOL])
+            await publish([(self.bob.id, self.chat_event(n)) for n in range(3)])
+            frame = await bob.receive_output()
+            nothing_else = await bob.receive_nothing()
+            await bob.disconnect()
+            return frame, nothing_else
+
+        frame, nothing_else = async_to_sync(run)()
+        self.assertEqual([(event['m'], event['q']) for event in unpack(frame['bytes'])], [('m0', 1), ('m1', 2), ('m2', 3)])
+        self.assertTrue(nothing_else)
+
+    @override_settings(EMPLOYEES_WS_MSGPACK={'BATCH_DELAY': 0.05, 'BATCH_MAX': 2})
+    def test_full_batch_is_sent_without_waiting(self):
+        async def run():
+            bob, _ = await self.connect(self.bob, [MSGPACK_SUBPROTOCOL])
+            await publish([(self.bob.id, self.chat_event(n)) for n in range(3)])
+            frames = [await bob.receive_output(), await bob.receive_output()]
+            await bob.disconnect()
+            return frames
+
+        self.assertEqual([len(unpack(frame['bytes'])) for frame in async_to_sync(run)()], [2, 1])
+
+    def test_binary_client_frames(self):
+        async def run():
+            bob, _ = await self.connect(self.bob, [MSGPACK_SUBPROTOCOL])
+            await bob.send_to(bytes_data=pack({'type': 'presence_query', 'user_ids': [self.bob.id]}))
+            presence = await bob.receive_output()
+            await bob.send_to(bytes_data=b'\xc1')  # Never valid MessagePack
+            error = await bob.receive_output()
+            await bob.disconnect()
+            return presence, error
+
+        presence, error = async_to_sync(run)()
+        self.assertEqual(unpack(presence['bytes']), [{'t': 'presence', 'u': {self.bob.id: 'online'}}])
+        self.assertEqual(unpack(error['bytes']), [{'t': 'error', 'err': 'Invalid message format'}])
+
+    def test_json_stays_the_default(self):
+        async def run():
+            bob, subprotocol = await self.connect(self.bob)
+            await publish([(self.bob.id, self.chat_event(0))])
+            frame = await bob.receive_output()
+            await bob.disconnect()
+            return subprotocol, frame
+
+        subprotocol, frame = async_to_sync(run)()
+        self.assertIsNone(subprotocol)
+        self.assertEqual(json.loads(frame['text'])['message'], 'm0')
+
+
+# Read replicas
+REPLICA = 'replica'
+
+
+@override_settings(EMPLOYEES_REPLICAS={'REPLICAS': [REPLICA], 'CACHE': 'default'})
+class ReplicaRoutingTests(EmployeesTestCase):
+    """Routes between the test database and a second SQLite database standing in for a replica.
+
+    The replica is created after the test runner's own setup, so it is not in
+    `databases` and its rows are not rolled back between tests; tests only
+    read from it.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        sqlite = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+        connections.settings[REPLICA] = connections.configure_settings({DEFAULT_DB_ALIAS: sqlite, REPLICA: dict(sqlite)})[REPLICA]
+        cls.replica_name = connections[REPLICA].creation.create_test_db(verbosity=0, serialize=False)
+        for user in (cls.admin, cls.alice):
+            user.save(using=REPLICA)
+        # Rows that differ between the two databases show where a read went
+        Task.objects.using(REPLICA).create(id=cls.primary_task.id + 100, title='On the replica', description='d',
+                                           assigned_to=cls.alice, created_by=cls.admin, due_date=date.today())
+        Message.objects.using(REPLICA).create(id=cls.primary_message.id + 100, sender=cls.alice, recipient=cls.admin,
+                                              content='On the replica')
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].creation.destroy_test_db(cls.replica_name, verbosity=0)
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        cls.alice = User.objects.create_user(username='alice', password='pass')
+        cls.primary_task = Task.objects.create(title='On the primary', description='d', assigned_to=cls.alice,
+                                               created_by=cls.admin, due_date=date.today())
+        cls.primary_message = Message.objects.create(sender=cls.alice, recipient=cls.admin, content='On the primary')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def messages(self, client):
+        response = client.get('/api/messages/')
+        self.assertEqual(response.status_code, 200)
+        return [message['content'] for message in response.json()]
+
+    def test_reads_go_to_the_replica(self):
+        self.assertEqual(self.messages(self.client_for(self.alice)), ['On the replica'])
+
+    def test_writer_reads_the_primary_until_the_pin_expires(self):
+        admin, alice = self.client_for(self.admin), self.client_for(self.alice)
+        response = admin.post('/api/messages/', {'recipient': 'alice', 'content': 'New'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Message.objects.using(REPLICA).filter(content='New').exists())
+        self.assertEqual(self.messages(admin), ['New', 'On the primary'])
+        self.assertEqual(self.messages(alice), ['On the replica'])  # Only the writer is pinned
+
+        caches['default'].clear()
+        self.assertEqual(self.messages(admin), ['On the replica'])
+
+    def test_cached_lists_are_built_from_the_primary(self):
+        # Everyone is served a cached payload until it expires, so it must not be stale
+        response = self.client_for(self.alice).get('/api/tasks/')
+        self.assertEqual([task['title'] for task in response.json()], ['On the primary'])
+
+    def test_updates_look_the_row_up_on_the_primary(self):
+        response = self.client_for(self.alice).patch(f'/api/tasks/{self.primary_task.id}/', {'status': 'Completed'},
+                                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Task.objects.using(DEFAULT_DB_ALIAS).get(id=self.primary_task.id).status, 'Completed')
+
+    def test_async_views_follow_pins(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.alice)}'}
+
+        async def fetch():
+            response = await self.async_client.get('/api/async/tasks/', headers=headers)
+            return [task['title'] for task in json.loads(response.content)]
+
+        self.assertEqual(async_to_sync(fetch)(), ['On the replica'])
+        pin(self.alice.id)
+        self.assertEqual(async_to_sync(fetch)(), ['On the primary'])
+
+    @override_settings(EMPLOYEES_METRICS={'SINKS': ['employees.instrumentation.MemorySink'], 'SLOW_REQUEST_MS': 10000})
+    def test_queries_are_counted_per_alias(self):
+        MemorySink.records.clear()
+        self.messages(self.client_for(self.alice))
+        aliases = MemorySink.records[-1]['db_aliases']
+        self.assertEqual(set(aliases), {REPLICA})
+        self.assertGreater(aliases[REPLICA]['queries'], 0)
+
+    def test_outside_requests_everything_uses_the_primary(self):
+        self.assertEqual(db_router.db_for_read(Task), DEFAULT_DB_ALIAS)
+        self.assertEqual(Task.objects.get().title, 'On the primary')
+
+    def test_websocket_frames_pin_after_writing(self):
+        async def run():
+            async with routed(self.alice.id):
+                before = db_router.db_for_read(Task)
+                db_router.db_for_write(Message)
+                after = db_router.db_for_read(Task)
+            return before, after
+
+        self.assertEqual(async_to_sync(run)(), (REPLICA, DEFAULT_DB_ALIAS))
+        self.assertTrue(is_pinned(self.alice.id))
+        self.assertFalse(is_pinned(self.admin.id))
+
+
+# Serializer-free lists and orjson
+class FastListTests(EmployeesTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='pass', is_staff=True, first_name='Ada', last_name='Min')
+        cls.alice = User.objects.create_user(username='alice', password='pass', first_name='Alice')
+        cls.bob = User.objects.create_user(username='bob', password='pass')
+        for i, title in enumerate(['Plain', 'Ünïcode ✓ \u2028 line', 'Quotes "\\ \x01 </script>']):
+            Task.objects.create(title=title, description=f'd{i}\n', assigned_to=cls.alice, created_by=cls.admin,
+                                priority=['Low', 'Medium', 'High'][i], completed=bool(i % 2),
+                                due_date=date.today() + timedelta(days=i))
+        Attendance.objects.create(employee=cls.admin, status='Present')
+        Attendance.objects.create(employee=cls.alice, date=date.today() - timedelta(days=1), status='Absent')
+        Complaint.objects.create(employee=cls.alice, subject='Chair', description='Wobbly \u2029')
+        Salary.objects.create(employee=cls.alice, basic_salary=Decimal('1000'), bonuses=Decimal('12.5'),
+                              deductions=Decimal('0.10'), net_salary=Decimal('1012.40'), date=date.today())
+        for i in range(4):
+            Message.objects.create(sender=[cls.alice, cls.bob][i % 2], recipient=[cls.bob, cls.alice][i % 2], content=f'm{i} ☃')
+
+    def auth(self, user):
+        return {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+
+    def fetch(self, user, path):
+        for cache in caches.all():
+            cache.clear()
+        if path.startswith('/api/async/'):
+            async def get():
+                return await self.async_client.get(path, headers=self.auth(user))
+            response = async_to_sync(get)()
+        else:
+            response = self.client.get(path, headers=self.auth(user))
+        self.assertEqual(response.status_code, 200, path)
+        return response.content
+
+    def test_lists_are_byte_identical_to_the_serializers(self):
+        cases = [
+            (self.admin, '/api/tasks/'), (self.admin, '/api/tasks/?limit=2&offset=1'), (self.alice, '/api/tasks/?ordering=due_date'),
+            (self.admin, '/api/attendance/'), (self.alice, '/api/attendance/?limit=1'),
+            (self.admin, '/api/complaints/'), (self.admin, '/api/salary/'),
+            (self.alice, '/api/messages/'), (self.alice, '/api/messages/?limit=2'),
+            (self.bob, '/api/messages/conversation/alice/?limit=3'),
+            (self.admin, '/api/async/tasks/?limit=2'), (self.alice, '/api/async/messages/?limit=3'),
+        ]
+        with mock.patch.object(ValuesRows, 'represent', autospec=True, side_effect=ValuesRows.represent) as represent:
+            fast = [self.fetch(user, path) for user, path in cases]
+        self.assertEqual(represent.call_count, len(cases))
+        with override_settings(EMPLOYEES_FAST_LISTS=False), mock.patch.object(ORJSONRenderer, 'render', JSONRenderer.render):
+            slow = [self.fetch(user, path) for user, path in cases]
+        for (user, path), fast_content, slow_content in zip(cases, fast, slow):
+            self.assertEqual(fast_content, slow_content, path)
+
+    def test_datetimes_follow_the_current_timezone(self):
+        with timezone.override('Asia/Kolkata'):
+            fast = self.fetch(self.admin, '/api/tasks/')
+            with override_settings(EMPLOYEES_FAST_LISTS=False):
+                slow = self.fetch(self.admin, '/api/tasks/')
+        self.assertIn(b'+05:30"', fast)
+        self.assertEqual(fast, slow)
+
+    def test_renderer_matches_drf(self):
+        moment = datetime(2024, 5, 6, 7, 8, 9, 123456, tzinfo=dt_timezone.utc)
+        payloads = [
+            None, [], {}, 'text \u2028\u2029 ✓ \x00\x1f\x7f "\\/', 0, -1, True, 2 ** 70,
+            [0.5, 1e-05, 1.5e-5, 1e16, 1e+22, 123.456, -0.0, 1e15],
+            {'at': moment, 'naive': moment.replace(tzinfo=None), 'day': date(2024, 5, 6), 'clock': clock(7, 8, 9, 10)},
+            {'money': Decimal('12.50'), 'id': uuid.UUID(int=7), 'lazy': lazystr('lazy'), 'span': timedelta(hours=1)},
+            {1: 'int key', 'nested': {'tuple': (1, 2), 'list': [None, {'x': [1.25]}]}},
+            {'results': list(Task.objects.values('id', 'title', 'created_at'))},
+        ]
+        for data in payloads:
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data), data)
+        self.assertEqual(ORJSONRenderer().render({'a': [1]}, 'application/json; indent=4'),
+                         JSONRenderer().render({'a': [1]}, 'application/json; indent=4'))
+
+    def test_renderer_rejects_non_finite_floats_like_drf(self):
+        for value in (float('nan'), float('-inf'), Decimal('NaN')):
+            data = {'results': [{'score': value, 'note': None}]}
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    JSONRenderer().render(data)
+                with self.assertRaises(ValueError):
+                    ORJSONRenderer().render(data)
+
+    def test_parser_matches_drf(self):
+        bodies = [b'{"a": [1, 2.5, null, true], "b": "\\u2603 \xe2\x98\x83"}', b'[18446744073709551616]',
+                  b'"\\ud800"', b'  {"dup": 1, "dup": 2}  ']
+        for body in bodies:
+            self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)), body)
+        for body in [b'{"a": ', b'[NaN]', b'\xff']:
+            with self.assertRaises(ParseError):
+                ORJSONParser().parse(io.BytesIO(body))
@@ -9,6 +9,9 @@ from .views import TaskViewSet
 from .views import EmployeeActionView, CustomTokenObtainPairView
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .views import UserViewSet
+from .views import ConversationViewSet
+from .views import AttendanceSummaryView, CacheStatsView, MetricsView
+from . import async_views
 #
 
 router = DefaultRouter()
@@ -17,12 +20,22 @@ router.register(r'attendance', AttendanceViewSet)
 
 router.register(r'salary', SalaryViewSet)                          
 router.register(r'messages', MessageViewSet, basename='message')
+router.register(r'conversations', ConversationViewSet, basename='conversation')
 router.register(r'tasks', TaskViewSet)                             
 router.register(r'users', UserViewSet, basename='user')            
 
 urlpatterns = [
     path('', include(router.urls)),  
     path('employee-action/', EmployeeActionView.as_view(), name='employee_action'), 
+    path('attendance-summary/', AttendanceSummaryView.as_view(), name='attendance_summary'),
+    path('cache-stats/', CacheStatsView.as_view(), name='cache_stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    # Async (ASGI) versions of the hot read endpoints
+    path('async/messages/', async_views.message_list, name='async_message_list'),
+    path('async/messages/conversation/<str:username>/', async_views.message_conversation, name='async_message_conversation'),
+    path('async/tasks/', async_views.task_list, name='async_task_list'),
+    path('async/users/', async_views.user_list, name='async_user_list'),
+    path('presence/', async_views.presence, name='presence'),
     
 ]
 
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+
+
+# In-process username -> user cache
+#
+# Chat and message endpoints only need a recipient's id and username.  This
+# bounded LRU keeps those pairs for a short TTL so the consumer can resolve a
+# recipient without a thread-pool hop or a query.  User post_save/post_delete
+# (employees/signals.py) evict entries in this process; other processes pick up
+# renames and deletions when their entries expire.
+class CachedUser(namedtuple('CachedUser', ['id', 'username'])):
+    __slots__ = ()
+
+    def as_user(self):
+        # Unsaved stand-in for FK assignment and display only; never save() it.
+        return User(id=self.id, username=self.username)
+
+
+class UsernameCache:
+    def __init__(self, max_entries=10000, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()  # username -> (CachedUser, expires)
+        self._usernames = {}  # id -> username, for eviction by id
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._discard(username)
+            self.misses += 1
+            return None
+
+    def set(self, user_id, username):
+        cached = CachedUser(user_id, username)
+        with self._lock:
+            self._discard(self._usernames.get(user_id))
+            self._discard(username)  # Now someone else's, e.g. after a delete and re-signup
+            self._entries[username] = (cached, time.monotonic() + self.timeout)
+            self._entries.move_to_end(username)
+            self._usernames[user_id] = username
+            while len(self._entries) > self.max_entries:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._usernames.pop(evicted.id, None)
+        return cached
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._discard(self._usernames.get(user_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._usernames.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+    def _discard(self, username):
+        entry = self._entries.pop(username, None) if username is not None else None
+        if entry is not None:
+            self._usernames.pop(entry[0].id, None)
+
+
+_options = getattr(settings, 'EMPLOYEES_USERNAME_CACHE', {})
+username_cache = UsernameCache(
+    max_entries=_options.get('MAX_ENTRIES', 10000),
+    timeout=_options.get('TIMEOUT', 300),
+)
+
+
+def load_username(username):
+    """Fetch `username` from the database into the cache; raises User.DoesNotExist."""
+    user_id, username = User.objects.values_list('id', 'username').get(username=username)
+    return username_cache.set(user_id, username)
+
+
+def resolve_username(username):
+    """Return a CachedUser for `username` or raise User.DoesNotExist."""
+    return username_cache.get(username) or load_username(username)
+
+
+async def aresolve_username(username):
+    """resolve_username() for async code, using the async ORM on a miss."""
+    cached = username_cache.get(username)
+    if cached is not None:
+        return cached
+    user_id, username = await User.objects.values_list('id', 'username').aget(username=username)
+    return username_cache.set(user_id, username)
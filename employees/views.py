@@ -6,19 +6,29 @@ from .serializers import ComplaintSerializer
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 # Attendance
 from .models import Attendance
-from .serializers import AttendanceSerializer
+from .serializers import AttendanceSerializer, display_name
+from .bulk import CONFLICT_MODES, import_attendance, iter_uploaded_records
+from .summaries import apply_attendance_changes, summarize_attendance
+from django.db import IntegrityError, transaction
+from django.utils.dateparse import parse_date
+from rest_framework.parsers import MultiPartParser
+from .parsers import ORJSONParser
 from datetime import date
 # Tasks
 from .models import Task
 from .serializers import TaskSerializer
 # Messages
-from .models import Message
-from .serializers import MessageSerializer
-from django.db.models import Q
+from .models import Message, Conversation
+from .serializers import MessageSerializer, ConversationSerializer
+from .inbox import mark_read, record_messages
+from .pagination import ConversationPagination, KeysetPagination
+from .usercache import resolve_username, username_cache
+from django.db.models import Q, Sum
 # Salary
 from rest_framework import viewsets
 from .models import Salary
-from .serializers import SalarySerializer
+from .serializers import SalarySerializer, PayrollRunSerializer
+from .payroll import run_payroll
 
 # Create views for token obtainment and refreshing
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
@@ -27,46 +37,83 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
-from django.contrib.auth import authenticate
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
 from django.contrib.auth.models import User
 from rest_framework.decorators import action
-
+from rest_framework.filters import OrderingFilter
+from .filters import QueryParamFilterBackend
+from .pagination import OptionalLimitOffsetPagination
+from .cache import CachedListMixin, cache_stats
+from .conditional import ConditionalListMixin
+from .export import ExportMixin
+from .search import SearchMixin
+from .rows import ValuesListMixin, ValuesRows
+from .instrumentation import PrometheusSink
+from .authentication import token_cache
+from django.http import HttpResponse
+
+# Related-user columns each serializer actually reads. Loading them with
+# select_related()/only() keeps every list and retrieve at a single query
+# instead of one extra User lookup per row.
+COMPLAINT_FIELDS = ('id', 'employee__username', 'subject', 'description', 'status', 'created_at', 'updated_at')
+ATTENDANCE_FIELDS = ('id', 'employee__username', 'employee__first_name', 'employee__last_name', 'date', 'status')
+TASK_FIELDS = (
+    'id', 'title', 'description', 'assigned_to__username', 'status', 'priority',
+    'due_date', 'created_at', 'updated_at', 'created_by', 'completed',
+)
+MESSAGE_FIELDS = ('id', 'sender__username', 'recipient__username', 'timestamp', 'content')
+CONVERSATION_FIELDS = (
+    'id', 'peer__username', 'last_message', 'last_timestamp', 'last_preview', 'unread_count',
+)
+SALARY_FIELDS = ('id', 'employee__username', 'basic_salary', 'bonuses', 'deductions', 'net_salary', 'date')
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     permission_classes = (AllowAny,)  # Allow anyone to access this view
 
     def post(self, request, *args, **kwargs):
-        username = request.data.get("username")
-        password = request.data.get("password")
-        
-        # Authenticate the user
-        user = authenticate(username=username, password=password)
-        if user is not None:
-            # If user is authenticated, call the parent method to get tokens
-            response = super().post(request, *args, **kwargs)
-            
-            # Add the user's role to the response
-            response.data['role'] = user.is_staff and 'admin' or 'employee'  # Adjust based on your role logic
-            return response
-        
-        # If authentication fails, return an error response
-        return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
+        # The serializer authenticates the user itself; authenticating again
+        # here would run the password hasher twice per login.
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except (AuthenticationFailed, ValidationError):
+            # If authentication fails, return an error response
+            return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
+
+        # Add the user's role to the response
+        data = dict(serializer.validated_data)
+        data['role'] = serializer.user.is_staff and 'admin' or 'employee'  # Adjust based on your role logic
+        return Response(data, status=status.HTTP_200_OK)
 
 # Users
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()  
     permission_classes = [IsAuthenticated]  
+    cache_models = (User,)
+    cache_per_user = False  # Everyone sees the same directory
 
     def list(self, request):
         users = self.queryset
-        return Response(users.values('id', 'username'))  # Return only id and username
+        return self.cached_response(
+            request, lambda: Response(users.values('id', 'username')),  # Return only id and username
+        )
 
 # Complaints
-class ComplaintViewSet(viewsets.ModelViewSet):
+class ComplaintViewSet(CachedListMixin, ConditionalListMixin, SearchMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Complaint.objects.all()
     serializer_class = ComplaintSerializer
+    values_rows = ValuesRows(ComplaintSerializer)
     permission_classes = [IsAuthenticated]  # Default permission
+    cache_models = (Complaint,)
+    pagination_class = OptionalLimitOffsetPagination
+    filter_backends = [QueryParamFilterBackend, OrderingFilter]
+    query_filters = {
+        'status': 'status',
+        'employee': 'employee',
+    }
+    ordering_fields = ['created_at', 'status', 'id']
+    ordering = ['-created_at', '-id']
 
     def get_permissions(self):
         
@@ -81,26 +128,60 @@ class ComplaintViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Complaint.objects.select_related('employee').only(*COMPLAINT_FIELDS)
         if user.is_staff:  # Admin
-            return Complaint.objects.all()
-        return Complaint.objects.filter(employee=user)
+            return queryset
+        return queryset.filter(employee=user)
 
 # Attendance
-class AttendanceViewSet(viewsets.ModelViewSet):
+class AttendanceViewSet(ExportMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Attendance.objects.all()
     serializer_class = AttendanceSerializer
+    values_rows = ValuesRows(AttendanceSerializer, computed={
+        'employee_name': (('employee__first_name', 'employee__last_name', 'employee__username'), display_name),
+    })
     permission_classes = [IsAuthenticated]
+    pagination_class = OptionalLimitOffsetPagination
+    filter_backends = [QueryParamFilterBackend, OrderingFilter]
+    query_filters = {
+        'employee': 'employee',
+        'status': 'status',
+        'date_after': 'date__gte',
+        'date_before': 'date__lte',
+    }
+    ordering_fields = ['date', 'status', 'id']
+    ordering = ['-date', '-id']
+    export_name = 'attendance'
 
     # Employees can only mark attendance for today and only once per day
     def perform_create(self, serializer):
-        serializer.save(employee=self.request.user, date=date.today())
+        with transaction.atomic():
+            record = serializer.save(employee=self.request.user, date=date.today())
+            apply_attendance_changes([(record.employee_id, record.date, record.status, 1)])
+
+    # Keep the monthly rollups in step with every change
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        previous = (instance.employee_id, instance.date, instance.status)
+        with transaction.atomic():
+            record = serializer.save()
+            apply_attendance_changes([
+                (*previous, -1),
+                (record.employee_id, record.date, record.status, 1),
+            ])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            apply_attendance_changes([(instance.employee_id, instance.date, instance.status, -1)])
+            instance.delete()
 
     
     def get_queryset(self):
         user = self.request.user
+        queryset = Attendance.objects.select_related('employee').only(*ATTENDANCE_FIELDS)
         if user.is_staff:
-            return Attendance.objects.all()  # Admins can see all records
-        return Attendance.objects.filter(employee=user)  # Employees can only see their own records
+            return queryset  # Admins can see all records
+        return queryset.filter(employee=user)  # Employees can only see their own records
 
     # Override the destroy method to prevent employees from deleting their attendance records
     def destroy(self, request, *args, **kwargs):
@@ -109,11 +190,86 @@ class AttendanceViewSet(viewsets.ModelViewSet):
             return self.permission_denied(request, "You cannot delete attendance records.")
         return super().destroy(request, *args, **kwargs)
 
+    # Bulk marking / backfill for HR: a JSON list of {employee, date, status}
+    # records, or a CSV/JSONL file upload in the "file" field.
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[ORJSONParser, MultiPartParser])
+    def bulk(self, request):
+        if not request.user.is_staff:
+            return self.permission_denied(request, "Only admins can import attendance records.")
+
+        on_conflict = request.query_params.get('on_conflict', 'ignore')
+        if on_conflict not in CONFLICT_MODES:
+            return Response({'error': f'on_conflict must be one of {", ".join(CONFLICT_MODES)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        upload = request.FILES.get('file')
+        if upload is not None:
+            records = iter_uploaded_records(upload, request.query_params.get('file_type'))
+        else:
+            records = request.data.get('records') if isinstance(request.data, dict) else request.data
+            if not isinstance(records, list):
+                return Response({'error': 'Send a list of records or upload a file'}, status=status.HTTP_400_BAD_REQUEST)
+
+        summary, results = import_attendance(records, on_conflict=on_conflict)
+        return Response({**summary, 'results': results}, status=status.HTTP_200_OK)
+
+# Attendance summaries, served from the monthly rollups
+class AttendanceSummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            start = parse_date(request.query_params.get('start') or '')
+            end = parse_date(request.query_params.get('end') or '')
+        except ValueError:  # Well formed but not a real date, e.g. 2024-02-30
+            start = end = None
+        if start is None or end is None or start > end:
+            return Response({'error': 'start and end must be YYYY-MM-DD dates with start <= end'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.user.is_staff:
+            employee_ids = request.query_params.getlist('employee') or None
+            if employee_ids is not None:
+                try:
+                    employee_ids = [int(employee_id) for employee_id in employee_ids]
+                except ValueError:
+                    return Response({'error': 'employee must be an id'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            employee_ids = [request.user.id]  # Employees only see their own summary
+
+        totals = summarize_attendance(start, end, employee_ids)
+        usernames = dict(User.objects.filter(id__in=totals.keys()).values_list('id', 'username'))
+        employees = [
+            {'employee': employee_id, 'employee_name': usernames.get(employee_id), **counts}
+            for employee_id, counts in sorted(totals.items())
+        ]
+        return Response({
+            'start': start,
+            'end': end,
+            'present_days': sum(row['present_days'] for row in employees),
+            'absent_days': sum(row['absent_days'] for row in employees),
+            'employees': employees,
+        })
+
 # Tasks
-class TaskViewSet(viewsets.ModelViewSet):
+class TaskViewSet(CachedListMixin, ConditionalListMixin, ExportMixin, SearchMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
+    values_rows = ValuesRows(TaskSerializer)
     permission_classes = [IsAuthenticated]
+    cache_models = (Task, User)  # Rows include the assignee's username
+    etag_related_models = (User,)
+    pagination_class = OptionalLimitOffsetPagination
+    filter_backends = [QueryParamFilterBackend, OrderingFilter]
+    query_filters = {
+        'status': 'status',
+        'priority': 'priority',
+        'assigned_to': 'assigned_to',
+        'completed': 'completed',
+        'due_date_after': 'due_date__gte',
+        'due_date_before': 'due_date__lte',
+    }
+    ordering_fields = ['due_date', 'priority', 'status', 'created_at', 'updated_at', 'id']
+    ordering = ['-created_at', '-id']
+    export_name = 'tasks'
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -127,9 +283,10 @@ class TaskViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Task.objects.select_related('assigned_to').only(*TASK_FIELDS)
         if user.is_staff:
-            return Task.objects.all()
-        return Task.objects.filter(assigned_to=user)
+            return queryset
+        return queryset.filter(assigned_to=user)
 
     def perform_update(self, serializer):
         # Allow employees to update the 'completed' field on their assigned tasks
@@ -141,14 +298,22 @@ class TaskViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("You do not have permission to update this task.")
 
 # Messages
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(ConditionalListMixin, SearchMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Message.objects.all()  # Added queryset attribute
     serializer_class = MessageSerializer
+    values_rows = ValuesRows(MessageSerializer, sources={'sender': 'sender__username', 'recipient': 'recipient__username'})
     permission_classes = [IsAuthenticated]
+    last_modified_field = 'timestamp'  # Messages are never edited
+    etag_related_models = (User,)  # Rows include the sender's and recipient's usernames
+    pagination_class = KeysetPagination  # opt-in: ?limit=, ?before=, ?after=
 
     def get_queryset(self):
         user = self.request.user
-        return Message.objects.filter(Q(sender=user) | Q(recipient=user)).order_by('-timestamp')
+        return (
+            Message.objects.select_related('sender', 'recipient').only(*MESSAGE_FIELDS)
+            .filter(Q(sender=user) | Q(recipient=user))
+            .order_by('-timestamp', '-id')
+        )
 
     def create(self, request, *args, **kwargs):
         recipient_username = request.data.get('recipient')
@@ -158,15 +323,22 @@ class MessageViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Recipient and content are required'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            recipient = User.objects.get(username=recipient_username) # Jo username dia ham ny wo hy database mein ya nahi ye check krta agr nahi hoga to error dy dyga.
+            recipient = resolve_username(recipient_username) # Jo username dia ham ny wo hy database mein ya nahi ye check krta agr nahi hoga to error dy dyga.
         except User.DoesNotExist:
             return Response({'error': 'Recipient does not exist'}, status=status.HTTP_400_BAD_REQUEST)
 
-        message = Message.objects.create(
-            sender=request.user,
-            recipient=recipient,
-            content=content
-        )
+        try:
+            with transaction.atomic():
+                message = Message.objects.create(
+                    sender=request.user,
+                    recipient=recipient.as_user(),
+                    content=content
+                )
+                record_messages([message])  # Update both participants' conversation summaries
+        except IntegrityError:
+            # Deleted in another process while still in our username cache
+            username_cache.invalidate(recipient.id)
+            return Response({'error': 'Recipient does not exist'}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = self.get_serializer(message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -174,23 +346,63 @@ class MessageViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], url_path='conversation/(?P<username>[^/.]+)')
     def conversation(self, request, username=None): #This method retrieves all messages between the logged-in user and the specified user (the conversation).
         try:
-            other_user = User.objects.get(username=username)
+            other_user = resolve_username(username)
         except User.DoesNotExist:
             return Response({'error': 'User does not exist'}, status=status.HTTP_400_BAD_REQUEST)
 
-        messages = Message.objects.filter(
-            (Q(sender=request.user) & Q(recipient=other_user)) |
-            (Q(sender=other_user) & Q(recipient=request.user))
-        ).order_by('-timestamp')
+        messages = Message.objects.select_related('sender', 'recipient').only(*MESSAGE_FIELDS).filter(
+            (Q(sender=request.user) & Q(recipient_id=other_user.id)) |
+            (Q(sender_id=other_user.id) & Q(recipient=request.user))
+        ).order_by('-timestamp', '-id')
+
+        return self.conditional_response(request, messages, lambda: self.list_response(messages))
+
+# Conversations: the inbox, one row per person the user has messages with
+class ConversationViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = ConversationSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = ConversationPagination
+
+    def get_queryset(self):
+        return (
+            Conversation.objects.filter(owner=self.request.user)
+            .select_related('peer').only(*CONVERSATION_FIELDS)
+            .order_by('-last_timestamp', '-id')
+        )
+
+    @action(detail=False, methods=['post'], url_path='(?P<username>[^/.]+)/read')
+    def read(self, request, username=None):
+        try:
+            peer = resolve_username(username)
+        except User.DoesNotExist:
+            return Response({'error': 'User does not exist'}, status=status.HTTP_400_BAD_REQUEST)
+        mark_read(request.user.id, peer.id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
-        serializer = self.get_serializer(messages, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    @action(detail=False, methods=['get'])
+    def unread(self, request):
+        total = Conversation.objects.filter(owner=request.user).aggregate(total=Sum('unread_count'))['total']
+        return Response({'unread': total or 0})
 
 # Salary
-class SalaryViewSet(viewsets.ModelViewSet):
+class SalaryViewSet(ExportMixin, ValuesListMixin, viewsets.ModelViewSet):
     queryset = Salary.objects.all()
     serializer_class = SalarySerializer
+    values_rows = ValuesRows(SalarySerializer)
     permission_classes = [IsAuthenticated]
+    pagination_class = OptionalLimitOffsetPagination
+    filter_backends = [QueryParamFilterBackend, OrderingFilter]
+    query_filters = {
+        'employee': 'employee',
+        'date_after': 'date__gte',
+        'date_before': 'date__lte',
+    }
+    ordering_fields = ['date', 'net_salary', 'id']
+    ordering = ['-date', '-id']
+    export_name = 'salary'
+
+    def get_queryset(self):
+        return Salary.objects.select_related('employee').only(*SALARY_FIELDS)
 
     def perform_create(self, serializer):
         # Calculate net salary
@@ -206,10 +418,51 @@ class SalaryViewSet(viewsets.ModelViewSet):
             # Employees cannot assign salary, but they can view their own
             serializer.save(employee=self.request.user, net_salary=net_salary)
 
+    # Generate a whole pay period in one request; safe to repeat
+    @action(detail=False, methods=['post'], url_path='run-payroll')
+    def run_payroll(self, request):
+        if not request.user.is_staff:
+            return self.permission_denied(request, "Only admins can run payroll.")
+
+        serializer = PayrollRunSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        adjustments = {
+            item['employee']: {key: value for key, value in item.items() if key != 'employee'}
+            for item in data['adjustments']
+        }
+        result = run_payroll(
+            data['date'],
+            basic_salary=data['basic_salary'],
+            bonuses=data['bonuses'],
+            deductions=data['deductions'],
+            adjustments=adjustments,
+            employee_ids=data['employees'],
+        )
+        return Response(result, status=status.HTTP_200_OK)
+
+
+
+
+
 
+# Response cache hit/miss counters
+class CacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
 
+    def get(self, request):
+        return Response({
+            'responses': cache_stats(),
+            'usernames': username_cache.stats(),
+            'tokens': token_cache.stats(),
+        })
 
+# Request metrics in the Prometheus text format (this process only)
+class MetricsView(APIView):
+    permission_classes = [IsAdminUser]
 
+    def get(self, request):
+        return HttpResponse(PrometheusSink.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # 
 
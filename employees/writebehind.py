@@ -0,0 +1,119 @@
+import asyncio
+import atexit
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .cache import invalidate
+from .inbox import record_messages
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+
+# Write-behind persistence for chat messages
+#
+# With settings.EMPLOYEES_CHAT_WRITE_BEHIND enabled, EmployeesConsumer delivers a
+# chat frame first and hands the unsaved Message to this buffer.  The buffer is
+# written with one bulk_create when it reaches MAX_BATCH messages or every
+# FLUSH_INTERVAL seconds, whichever comes first.  At MAX_QUEUE pending messages
+# enqueue() blocks until the next flush (backpressure).  Consumers flush on
+# disconnect and whatever is left at interpreter exit is written synchronously.
+#
+# Stored timestamps are taken when the batch is written, so they can trail the
+# delivered timestamp by up to FLUSH_INTERVAL.
+class MessageWriteBehind:
+    def __init__(self, max_batch=500, flush_interval=0.05, max_queue=10000):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._buffer = []
+        self._loop = None
+        self._task = None
+        self.written = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task is not None and not self._task.done():
+            return
+        # asyncio primitives belong to one event loop; rebuild them if the
+        # loop changed (e.g. a new loop per test).
+        self._loop = loop
+        self._lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._task = loop.create_task(self._run())
+
+    async def enqueue(self, message):
+        self._ensure_started()
+        while len(self._buffer) >= self.max_queue:
+            self._space.clear()
+            self._wake.set()
+            await self._space.wait()
+        self._buffer.append(message)
+        if len(self._buffer) >= self.max_batch:
+            self._wake.set()
+
+    async def flush(self):
+        if self._loop is not asyncio.get_running_loop():
+            self._ensure_started()
+        async with self._lock:
+            batch, self._buffer = self._buffer, []
+            if batch:
+                await database_sync_to_async(self.write)(batch)
+            self._space.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if self._buffer:
+                try:
+                    await self.flush()
+                except Exception:
+                    logger.exception("Chat write-behind flush failed")
+
+    def write(self, batch):
+        try:
+            with transaction.atomic():
+                Message.objects.bulk_create(batch, batch_size=self.max_batch)
+                record_messages(batch)
+        except Exception:
+            # One bad row (e.g. a recipient deleted meanwhile) must not cost
+            # the whole batch: retry row by row.
+            logger.exception("Bulk write of %d chat messages failed, retrying one by one", len(batch))
+            saved = []
+            for message in batch:
+                try:
+                    with transaction.atomic():
+                        message.save()
+                        record_messages([message])
+                    saved.append(message)
+                except Exception:
+                    self.failed += 1
+                    logger.exception("Dropping chat message from user %s", message.sender_id)
+            batch = saved
+        self.written += len(batch)
+        invalidate(Message)  # bulk_create() sends no post_save signals
+        return batch
+
+    def drain_sync(self):
+        batch, self._buffer = self._buffer, []
+        if batch:
+            self.write(batch)
+
+
+_options = getattr(settings, 'EMPLOYEES_CHAT_WRITE_BEHIND_OPTIONS', {})
+message_writer = MessageWriteBehind(
+    max_batch=_options.get('MAX_BATCH', 500),
+    flush_interval=_options.get('FLUSH_INTERVAL', 0.05),
+    max_queue=_options.get('MAX_QUEUE', 10000),
+)
+atexit.register(message_writer.drain_sync)